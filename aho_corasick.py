@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : aho_corasick.py
+
+from collections import deque
+from typing import Dict, Iterable, List, Tuple
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式匹配：一次线性扫描找出文本中所有关键词，耗时与关键词数量无关。
+    构建时把失败指针展开成完整的状态转移表，扫描时每个字符只需一次字典查找。
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = sorted({keyword for keyword in keywords if keyword})
+        # 状态0为根；transitions[状态] 只保存与根状态不同的转移，查不到时使用根状态的转移
+        self.transitions: List[Dict[str, int]] = [{}]
+        # 在该状态结束的关键词长度（含后缀链接上的关键词），从长到短
+        self.outputs: List[Tuple[int, ...]] = [()]
+        self._build()
+
+    def _build(self) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        lengths: List[List[int]] = [[]]
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                if char not in goto[state]:
+                    goto.append({})
+                    lengths.append([])
+                    goto[state][char] = len(goto) - 1
+                state = goto[state][char]
+            lengths[state].append(len(keyword))
+
+        # 按层次遍历计算失败指针，并把失败状态的转移和输出合并进来
+        fail = [0] * len(goto)
+        transitions: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in goto[state].items():
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(char, 0) if goto[fallback].get(char) != child else 0
+                lengths[child].extend(lengths[fail[child]])
+                queue.append(child)
+            # 该状态的完整转移 = 失败状态的转移 + 自身的转移；与根状态相同的转移不保存
+            merged = dict(transitions[fail[state]]) if state else {}
+            merged.update(goto[state])
+            transitions[state] = {char: target for char, target in merged.items()
+                                  if state == 0 or transitions[0].get(char) != target}
+
+        self.transitions = transitions
+        self.outputs = [tuple(sorted(set(found), reverse=True)) for found in lengths]
+
+    def find_all(self, text: str) -> List[Tuple[int, int]]:
+        """
+        返回互不重叠的匹配位置 [(开始, 结束), ...]，从左到右、同一起点取最长的关键词。
+        """
+        if not self.keywords:
+            return []
+        root = self.transitions[0]
+        transitions = self.transitions
+        outputs = self.outputs
+        state = 0
+        found = []
+        for end, char in enumerate(text, 1):
+            state = transitions[state].get(char) or root.get(char, 0)
+            if outputs[state]:
+                found.extend((end - length, end) for length in outputs[state])
+        if len(found) > 1:
+            found.sort(key=lambda span: (span[0], -span[1]))
+            selected = []
+            last_end = 0
+            for start, end in found:
+                if start >= last_end:
+                    selected.append((start, end))
+                    last_end = end
+            found = selected
+        return found
+
+    def remove(self, text: str) -> str:
+        """
+        删除文本中所有关键词。
+        """
+        spans = self.find_all(text)
+        if not spans:
+            return text
+        pieces = []
+        position = 0
+        for start, end in spans:
+            pieces.append(text[position:start])
+            position = end
+        pieces.append(text[position:])
+        return ''.join(pieces)
+
+    def __len__(self) -> int:
+        return len(self.keywords)
@@ -2,61 +2,466 @@
 # @Time : 2023/11/21
 # @File : api.py
 
+import os
 import json
+import random
+import asyncio
+import functools
 import requests
-from typing import Union, List, Dict, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Union, List, Dict, Optional, Set, Tuple, Iterable, Callable
 from config import ConfigManager
+from cache import ResponseCache, NegativeCache, normalize_title
+from ratelimit import TokenBucket, get_bucket, parse_retry_after
+from singleflight import DEFAULT_MAX_ENTRIES as DEFAULT_SINGLEFLIGHT_ENTRIES, DEFAULT_TTL as DEFAULT_SINGLEFLIGHT_TTL, SingleFlight, coalesced
+from hedge import Hedger
+from breaker import CircuitBreaker, get_breaker, DEFAULT_FAILURE_THRESHOLD, DEFAULT_COOLDOWN
+from urllib.parse import urlsplit
 import time
 from colorama import Fore, Style
 
-class PlexApi:
-    def __init__(self, plex_url: str, plex_token: str, execute_request: bool = True):
-        self.plex_url = plex_url
-        self.plex_token = plex_token
-        self.headers = {
-            "X-Plex-Token": self.plex_token,
-            "Accept": "application/json",
-        }
-        if execute_request:
-            response = requests.get(self.plex_url, headers=self.headers)
-            if response.status_code == 200:
-                print(Fore.GREEN + "成功连接PLEX服务器." + Style.RESET_ALL)
-            else:
-                print(Fore.RED + "连接PLEX服务器失败." + Style.RESET_ALL)
-        self.class_name = type(self).__name__
+# 连接池默认参数：每个主机保持的连接池数量、单个池的最大连接数、连接层面的重试次数
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_MAX_RETRIES = 2
+# 默认的连接超时和读取超时（秒）；Plex媒体库分页响应较大，读取超时更长
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 30.0
+DEFAULT_PLEX_READ_TIMEOUT = 60.0
+# 安装了 orjson 时使用它解析JSON，大体积的Plex媒体库响应解析速度明显更快
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# TMDB 的 append_to_response 每次最多附带 20 项
+APPEND_TO_RESPONSE_LIMIT = 20
+# 异步客户端默认的最大并发请求数
+DEFAULT_CONCURRENCY = 8
+
+
+def create_session(pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+                   pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                   max_retries: int = DEFAULT_MAX_RETRIES,
+                   backoff_factor: float = 0.5) -> requests.Session:
+    """
+    创建一个带连接池的会话。
+    同一主机的请求复用 keep-alive 连接，连接层面的错误由重试适配器自动重试。
+    """
+    retry = Retry(total=max_retries,
+                  connect=max_retries,
+                  read=max_retries,
+                  status=max_retries,
+                  status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset(['GET']),
+                  backoff_factor=backoff_factor,
+                  raise_on_status=False,
+                  # 429 及其 Retry-After 交给共享令牌桶处理，避免各线程各自等待
+                  respect_retry_after_header=False)
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive'})
+    return session
+
+
+def session_from_config(config: Dict) -> requests.Session:
+    """
+    根据配置文件中的连接池参数创建会话，未配置的参数使用默认值。
+    """
+    return create_session(pool_connections=int(config.get('http_pool_connections', DEFAULT_POOL_CONNECTIONS)),
+                          pool_maxsize=int(config.get('http_pool_maxsize', DEFAULT_POOL_MAXSIZE)),
+                          max_retries=int(config.get('http_max_retries', DEFAULT_MAX_RETRIES)))
+
+
+_shared_session: Optional[requests.Session] = None
+_shared_session_lock = threading.Lock()
+
+
+def timeout_from_config(config: Dict, prefix: str, read_timeout: float = DEFAULT_READ_TIMEOUT) -> Tuple[float, float]:
+    """
+    读取 {prefix}_connect_timeout 和 {prefix}_read_timeout，返回 requests 使用的 (连接超时, 读取超时)。
+    """
+    return (float(config.get(f'{prefix}_connect_timeout', DEFAULT_CONNECT_TIMEOUT)),
+            float(config.get(f'{prefix}_read_timeout', read_timeout)))
+
+
+def hedger_from_config(config: Dict, prefix: str) -> Optional[Hedger]:
+    """
+    读取 {prefix}_hedge_percentile，大于0时创建对冲器，否则返回None（不对冲）。
+    """
+    percentile = float(config.get(f'{prefix}_hedge_percentile', 0) or 0)
+    if percentile <= 0:
+        return None
+    return Hedger(percentile=percentile)
+
+
+def get_shared_session() -> requests.Session:
+    """
+    返回进程内共享的会话，首次调用时创建。
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+def empty_search_result() -> dict:
+    """
+    已知未匹配的TMDB搜索直接返回的空结果，格式与查找不到时的响应相同。
+    """
+    return {'page': 1, 'results': [], 'total_pages': 0, 'total_results': 0, 'request_code': 200}
+
+
+def plex_tmdb_id(item: dict) -> Optional[str]:
+    """
+    从Plex条目的 Guid 列表中取出TMDB ID。
+    """
+    for guid_dict in item.get('Guid', []):
+        id_value = guid_dict.get('id')
+        if id_value and id_value.startswith('tmdb://'):
+            return id_value.split('://')[1]
+    return None
+
 
-    def send_request(self, search_url: str) -> Optional[requests.Response]:
+def plex_movie_details(item: dict) -> dict:
+    """
+    把Plex电影条目展开成字典，Guid 替换为 tmdbid。
+    """
+    details = {key: value for key, value in item.items() if key != 'Guid'}
+    tmdb_id = plex_tmdb_id(item)
+    if tmdb_id:
+        details['tmdbid'] = tmdb_id
+    return details
+
+
+def plex_show_details(item: dict) -> dict:
+    """
+    返回Plex剧集条目的标题、年份和TMDB ID。
+    """
+    return {'title': item.get('title'), 'year': item.get('year'), 'tmdbid': plex_tmdb_id(item)}
+
+
+class ApiResponse:
+    """
+    已解码的响应。响应体只在 send_request 中解析一次，调用方直接使用 data。
+    """
+    __slots__ = ('status_code', 'headers', 'content', 'data')
+
+    def __init__(self, status_code: int, content: bytes, data, headers: Optional[Dict[str, str]] = None):
+        self.status_code = status_code
+        self.content = content
+        self.data = data
+        self.headers = headers if headers is not None else {}
+
+
+class BaseApi:
+    max_attempts = 3
+
+    def __init__(self, session: Optional[requests.Session] = None, cache: Optional[ResponseCache] = None,
+                 timeout: Optional[Tuple[float, float]] = None, hedger: Optional[Hedger] = None):
+        # 未传入会话时使用进程内共享的连接池；测试时可注入指向本地桩服务器的会话
+        self.session = session if session is not None else get_shared_session()
+        self.cache = cache
+        # 每个请求都带上 (连接超时, 读取超时)，避免一个卡住的连接挂起整个批处理
+        self.timeout = timeout if timeout is not None else (DEFAULT_CONNECT_TIMEOUT, DEFAULT_READ_TIMEOUT)
+        self.hedger = hedger
+        # 已知未匹配的查询，由 from_config 创建，可在多个客户端间共享
+        self.negative_cache: Optional[NegativeCache] = None
+        self.rate_limiter: Optional[TokenBucket] = None
+        # 按 主机/接口 共享的熔断器，阈值为0时不熔断
+        self.breaker_threshold = DEFAULT_FAILURE_THRESHOLD
+        self.breaker_cooldown = DEFAULT_COOLDOWN
+        self._breaker_names = set()
+        # 合并短时间内相同的查询，重复的调用共享同一次请求及其解析结果
+        self.singleflight = SingleFlight()
+        self.headers: Dict[str, str] = {}
+
+    def send_request(self, url: str, params: Optional[Dict[str, str]] = None) -> Optional[ApiResponse]:
         """
-        向指定的URL发送GET请求，并返回响应。
-        如果请求失败，返回None。
+        向指定的URL发送GET请求，并返回解码后的响应。
+        如果配置了缓存且缓存未过期，直接返回缓存的响应；
+        已过期的缓存带有 ETag 或 Last-Modified 时发送条件请求，服务器返回 304 则沿用缓存的内容。
+        接口连续失败时熔断，熔断期间不再发送请求。
+        如果请求失败或接口已熔断，有过期的缓存时返回过期的内容，否则返回None。
         如果无法将响应内容解析为JSON，返回None。
         """
-        max_attempts = 4
-        for attempt in range(max_attempts):
+        cache_key = None
+        stale = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(url, params)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                status_code, content = cached
+                return ApiResponse(status_code, content, json_loads(content))
+            stale = self.cache.get_stale(cache_key)
+
+        breaker = self.breaker_for(url)
+        response = None
+        rejected = False
+        for attempt in range(self.max_attempts):
+            if breaker is not None and not breaker.allow():
+                rejected = True
+                break
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
             try:
-                response = requests.get(search_url, headers=self.headers)
+                response = self._get(url, params, stale[2] if stale is not None else None)
+                if breaker is not None:
+                    # 服务器有响应（包括4xx和429）说明仍然可用，只有5xx计为失败
+                    if response.status_code >= 500:
+                        breaker.record_failure()
+                    else:
+                        breaker.record_success()
+                if response.status_code == 429:
+                    # 被限速时按 Retry-After 等待，由共享令牌桶让所有线程一起暂停
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    if self.rate_limiter is not None:
+                        wait_time = self.rate_limiter.penalize(retry_after)
+                    else:
+                        wait_time = retry_after if retry_after is not None else 2 ** attempt
+                        time.sleep(wait_time)
+                    print(Fore.YELLOW + f"请求过于频繁(429)，等待{wait_time:.1f}秒后重试..." + Style.RESET_ALL)
+                    response = None
+                    continue
                 response.raise_for_status()
             except requests.exceptions.RequestException as e:
-                print(Fore.RED + "请求失败，错误信息：总共会重复请求3次，3次后跳过。" + Style.RESET_ALL)
-                if attempt < max_attempts - 1:
-                    wait_time = 2 ** attempt
-                    print(f"等待{wait_time}秒后重试...")
+                response = None
+                if breaker is not None and not isinstance(e, requests.exceptions.HTTPError):
+                    breaker.record_failure()
+                print(Fore.RED + f"请求失败，错误信息：总共会重复请求{self.max_attempts - 1}次，{self.max_attempts - 1}次后跳过。" + Style.RESET_ALL)
+                # 已熔断时不再等待，下一次循环直接跳过
+                if attempt < self.max_attempts - 1 and (breaker is None or not breaker.is_open()):
+                    wait_time = 2 ** attempt * random.uniform(0.5, 1.5)
+                    print(f"等待{wait_time:.1f}秒后重试...")
                     time.sleep(wait_time)
-                    continue
+                continue
             else:
+                if self.rate_limiter is not None:
+                    self.rate_limiter.on_success(response.headers)
                 break
-        else:
-            print(Fore.RED + "所有尝试都失败，跳过请求。" + Style.RESET_ALL)
+
+        if response is None:
+            if stale is not None:
+                print(Fore.YELLOW + "请求失败，使用已过期的缓存内容。" + Style.RESET_ALL)
+                status_code, content, _ = stale
+                return ApiResponse(status_code, content, json_loads(content))
+            if rejected:
+                print(Fore.RED + f"{breaker.name} 已熔断，跳过请求。" + Style.RESET_ALL)
+            else:
+                print(Fore.RED + "所有尝试都失败，跳过请求。" + Style.RESET_ALL)
             return None
 
+        if response.status_code == 304 and stale is not None:
+            # 内容未变化，没有响应体，使用缓存的内容并延长有效期
+            status_code, content, _ = stale
+            data = json_loads(content)
+            ttl = self.cache.negative_ttl if self.is_empty_result(data) else None
+            self.cache.refresh(cache_key, self.cache.endpoint_of(url), ttl)
+            return ApiResponse(status_code, content, data, response.headers)
+
         try:
-            response_json = response.json()
+            data = json_loads(response.content)
         except ValueError:
             print(Fore.RED + "无法解析响应内容为JSON" + Style.RESET_ALL)
             return None
 
-        return response
+        if cache_key is not None:
+            ttl = self.cache.negative_ttl if self.is_empty_result(data) else None
+            self.cache.set(cache_key, self.cache.endpoint_of(url), response.status_code, response.content, ttl,
+                           etag=response.headers.get('ETag'), last_modified=response.headers.get('Last-Modified'))
+        return ApiResponse(response.status_code, response.content, data, response.headers)
+
+    def _get(self, url: str, params: Optional[Dict[str, str]] = None,
+             conditional: Optional[Dict[str, str]] = None) -> requests.Response:
+        """
+        发送一次GET请求，conditional 为条件请求头（If-None-Match / If-Modified-Since）。
+        开启对冲时，超过分位数耗时仍未返回则再发一次，重复的请求同样要取得令牌。
+        """
+        headers = dict(self.headers, **conditional) if conditional else self.headers
+        fetch = functools.partial(self.session.get, url, params=params, headers=headers, timeout=self.timeout)
+        if self.hedger is None:
+            return fetch()
+
+        def duplicate() -> requests.Response:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire()
+            return fetch()
+
+        return self.hedger.run(fetch, duplicate)
+
+    def breaker_for(self, url: str) -> Optional[CircuitBreaker]:
+        """
+        返回URL所属 主机/接口 的熔断器，未开启熔断时返回None。
+        """
+        if self.breaker_threshold <= 0:
+            return None
+        name = urlsplit(url).netloc + '/' + ResponseCache.endpoint_of(url)
+        self._breaker_names.add(name)
+        return get_breaker(name, self.breaker_threshold, self.breaker_cooldown)
+
+    def is_available(self) -> bool:
+        """
+        用过的接口都没有处于熔断状态时返回True。
+        """
+        return not any(get_breaker(name).is_open() for name in list(self._breaker_names))
 
+    def configure_breaker(self, config: Dict, prefix: str) -> None:
+        """
+        读取 {prefix}_circuit_threshold 和 {prefix}_circuit_cooldown。
+        """
+        self.breaker_threshold = int(config.get(f'{prefix}_circuit_threshold', DEFAULT_FAILURE_THRESHOLD))
+        self.breaker_cooldown = float(config.get(f'{prefix}_circuit_cooldown', DEFAULT_COOLDOWN))
+
+    def configure_singleflight(self, config: Dict) -> None:
+        """
+        读取 singleflight_ttl 和 singleflight_max_entries，限制合并调用的结果保留多久、保留多少。
+        """
+        self.singleflight = SingleFlight(max_entries=int(config.get('singleflight_max_entries', DEFAULT_SINGLEFLIGHT_ENTRIES)),
+                                         ttl=float(config.get('singleflight_ttl', DEFAULT_SINGLEFLIGHT_TTL)))
+
+    def forget_results(self) -> None:
+        """
+        清空合并调用记住的结果，守护模式下每批开始前调用，使之后的查找反映服务器上的最新数据。
+        """
+        if self.singleflight is not None:
+            self.singleflight.forget()
+
+    def is_empty_result(self, data) -> bool:
+        """
+        响应是否表示查找不到结果，是则以较短的有效期缓存。
+        """
+        return False
+
+    def is_known_miss(self, source: str, title: str, year: Optional[str] = None) -> bool:
+        return self.negative_cache is not None and self.negative_cache.is_known_miss(source, title, year)
+
+    def remember_miss(self, source: str, title: str, year: Optional[str] = None) -> None:
+        if self.negative_cache is not None:
+            self.negative_cache.add(source, title, year)
+
+    def stats(self) -> Dict[str, Dict]:
+        """
+        返回缓存、未匹配、限速、对冲等各项统计。
+        """
+        stats = {}
+        if self.cache is not None:
+            stats['cache'] = self.cache.stats()
+        if self.negative_cache is not None:
+            stats['negative'] = self.negative_cache.stats()
+        if self.rate_limiter is not None:
+            stats['rate_limit'] = self.rate_limiter.stats()
+        if self.singleflight is not None:
+            stats['singleflight'] = self.singleflight.stats()
+        if self.hedger is not None:
+            stats['hedge'] = self.hedger.stats()
+        if self._breaker_names:
+            stats['circuit'] = {name: get_breaker(name).stats() for name in sorted(self._breaker_names)}
+        return stats
+
+    def print_stats(self) -> None:
+        for name, values in self.stats().items():
+            print(Fore.GREEN + f"{type(self).__name__} {name}: {values}" + Style.RESET_ALL)
+
+    def print_miss_report(self) -> None:
+        if self.negative_cache is not None:
+            self.negative_cache.print_report()
+
+    def close(self) -> None:
+        """
+        关闭会话持有的连接池。
+        """
+        if self.hedger is not None:
+            self.hedger.close()
+        self.session.close()
+
+
+class PlexApi(BaseApi):
+    max_attempts = 4
+
+    def __init__(self, plex_url: str, plex_token: str, execute_request: bool = True,
+                 session: Optional[requests.Session] = None, timeout: Optional[Tuple[float, float]] = None,
+                 hedger: Optional[Hedger] = None):
+        super().__init__(session, timeout=timeout if timeout is not None else (DEFAULT_CONNECT_TIMEOUT, DEFAULT_PLEX_READ_TIMEOUT),
+                         hedger=hedger)
+        self.plex_url = plex_url
+        self.plex_token = plex_token
+        self.headers = {
+            "X-Plex-Token": self.plex_token,
+            "Accept": "application/json",
+        }
+        if execute_request:
+            try:
+                response = self.session.get(self.plex_url, headers=self.headers, timeout=self.timeout)
+                connected = response.status_code == 200
+            except requests.exceptions.RequestException:
+                connected = False
+            if connected:
+                print(Fore.GREEN + "成功连接PLEX服务器." + Style.RESET_ALL)
+            else:
+                print(Fore.RED + "连接PLEX服务器失败." + Style.RESET_ALL)
+        self.class_name = type(self).__name__
+
+    @classmethod
+    def from_config(cls, config: Dict, plex_url: str, plex_token: str, execute_request: bool = True,
+                    session: Optional[requests.Session] = None,
+                    negative_cache: Optional[NegativeCache] = None) -> 'PlexApi':
+        """
+        根据配置文件创建客户端，超时、对冲、熔断和未匹配缓存参数从配置读取。
+        """
+        api = cls(plex_url, plex_token, execute_request=execute_request,
+                  session=session if session is not None else session_from_config(config),
+                  timeout=timeout_from_config(config, 'plex', DEFAULT_PLEX_READ_TIMEOUT),
+                  hedger=hedger_from_config(config, 'plex'))
+        api.negative_cache = negative_cache if negative_cache is not None else NegativeCache.from_config(config)
+        api.configure_breaker(config, 'plex')
+        api.configure_singleflight(config)
+        return api
+
+    def _search_first(self, title: str, year: Union[str, None] = None, source: str = 'plex/search') -> Optional[dict]:
+        """
+        搜索并返回第一个标题和年份都匹配的条目，请求成功但没有匹配时记为 source 的未匹配。
+        搜索请求带 includeGuids=1，条目中直接包含TMDB ID，不再逐个请求详细信息。
+        """
+        response = self.send_request(self.plex_url + "/search", {'query': title, 'includeGuids': 1})
+        if response is None:
+            return None
+
+        results = response.data
+        for item in results['MediaContainer'].get('Metadata', []):
+            if item.get('title') != title:
+                continue
+            if year and item.get('year') != int(year):
+                continue
+            if 'Guid' not in item:
+                # 旧版本服务器忽略 includeGuids 时再补取一次详细信息
+                item = self.metadata_batch([item['ratingKey']]).get(item['ratingKey'], item)
+            return item
+        self.remember_miss(source, title, year)
+        return None
+
+    def metadata_batch(self, rating_keys: List[str], chunk_size: int = 50) -> Dict[str, dict]:
+        """
+        一次请求获取多个条目的详细信息（/library/metadata/1,2,3），返回 ratingKey 到条目的映射。
+        """
+        details = {}
+        rating_keys = [str(key) for key in rating_keys]
+        for i in range(0, len(rating_keys), chunk_size):
+            chunk = rating_keys[i:i + chunk_size]
+            response = self.send_request(self.plex_url + "/library/metadata/" + ','.join(chunk))
+            if response is None:
+                continue
+            for item in response.data['MediaContainer'].get('Metadata', []):
+                details[str(item.get('ratingKey'))] = item
+        return details
+
+    @coalesced
     def search_tv(self, title: str, year: Union[str, None] = None) -> Optional[Dict[str, str]]:
         """
         在PLEX服务器上搜索指定标题和年份的电视剧。
@@ -69,25 +474,16 @@ class PlexApi:
         if year and not year.isdigit():
             raise ValueError("年份必须为数字")
 
-        search_endpoint = f"/search?query={title}"
-        search_url = self.plex_url + search_endpoint
-        response = self.send_request(search_url)
-        if response is None:
+        if self.is_known_miss('plex/show', title, year):
+            print(Fore.YELLOW + f"已知未匹配，跳过：{title}" + Style.RESET_ALL)
             return None
-
-        shows = response.json()
-        if 'Metadata' in shows['MediaContainer']:
-            for show in shows['MediaContainer']['Metadata']:
-                if year:
-                    if show.get('title') == title and show.get('year') == int(year):
-                        show_details = self.tv_info(show)
-                        return show_details
-                elif show.get('title') == title:
-                    show_details = self.tv_info(show)
-                    return show_details
+        show = self._search_first(title, year, 'plex/show')
+        if show is not None:
+            return plex_show_details(show)
         print(Fore.RED + "未发现媒体" + Style.RESET_ALL)
         return None
 
+    @coalesced
     def tv_info(self, show: str,  silent: bool = False) -> dict:
         """
         获取指定电视剧的详细信息。
@@ -100,17 +496,13 @@ class PlexApi:
         if response is None:
             return None
 
-        response_json = response.json()
+        response_json = response.data
         show_details = {'title': None, 'year': None, 'tmdbid': None}
         for child in response_json['MediaContainer']['Metadata']:
-            show_details['title'] = child.get('title')
-            show_details['year'] = child.get('year')
-            for guid_dict in child.get('Guid', []):
-                id_value = guid_dict.get('id')
-                if id_value and id_value.startswith('tmdb://'):
-                    show_details['tmdbid'] = id_value.split('://')[1]
+            show_details = plex_show_details(child)
         return show_details
 
+    @coalesced
     def search_movie(self, title: str, year: Union[str, None] = None) -> Optional[Dict[str, str]]:
         """
         在PLEX服务器上搜索指定标题和年份的电影。
@@ -123,25 +515,16 @@ class PlexApi:
         if year and not year.isdigit():
             raise ValueError("年份必须为数字")
 
-        search_endpoint = f"/search?query={title}"
-        search_url = self.plex_url + search_endpoint
-        response = self.send_request(search_url)
-        if response is None:
+        if self.is_known_miss('plex/movie', title, year):
+            print(Fore.YELLOW + f"已知未匹配，跳过：{title}" + Style.RESET_ALL)
             return None
-
-        movies = response.json()
-        if 'Metadata' in movies['MediaContainer']:
-            for movie in movies['MediaContainer']['Metadata']:
-                if year:
-                    if movie.get('title') == title and movie.get('year') == int(year):
-                        details = self.movie_info(movie)
-                        return details
-                elif movie.get('title') == title:
-                    movie_details = self.movie_info(movie)
-                    return movie_details
+        movie = self._search_first(title, year, 'plex/movie')
+        if movie is not None:
+            return plex_movie_details(movie)
         print(Fore.RED + "未发现媒体" + Style.RESET_ALL)
         return None
 
+    @coalesced
     def movie_info(self, movie: str) -> dict:
         """
         获取指定电影的详细信息。
@@ -154,57 +537,309 @@ class PlexApi:
         if response is None:
             return None
 
-        response_json = response.json()
+        response_json = response.data
         media_details = {}
         for child in response_json['MediaContainer']['Metadata']:
-            for key, value in child.items():
-                if key == 'Guid':
-                    for guid_dict in value:
-                        id_value = guid_dict.get('id')
-                        if id_value and id_value.startswith('tmdb://'):
-                            media_details['tmdbid'] = id_value.split('://')[1]
-                else:
-                    media_details[key] = value
+            media_details.update(plex_movie_details(child))
         return media_details
 
 
-class TMDBApi:
-    def __init__(self, key: str):
-        self.key = key
-        self.api_url = "https://api.themoviedb.org/3"
+class PlexLibraryIndex:
+    """
+    Plex媒体库的内存索引。
+    首次查询时分页拉取所有电影和剧集库，之后按标准化标题、年份、TMDB ID和媒体文件路径在本地查找。
+    拉取失败后 retry_after 秒内不再重新拉取，期间按标题的查找改为请求 PLEX 的 /search。
+    mark_stale 之后查找不到时，只按加入时间倒序拉取新加入的条目再查找一次，不重新拉取整个媒体库。
+    """
+    page_size = 500
+    refresh_page_size = 50
+    retry_after = 300.0
+
+    def __init__(self, plex_api: PlexApi, section_types: Tuple[str, ...] = ('movie', 'show')):
+        self.plex_api = plex_api
+        self.section_types = section_types
+        self.loaded = False
+        # 上次拉取失败的时间（time.monotonic），None表示没有失败过
+        self.failed_at: Optional[float] = None
+        # 媒体库可能有新条目，查找不到时先拉取新加入的条目
+        self.stale = False
+        # 已索引的媒体库 [(key, 类型)] 和条目的 ratingKey
+        self.sections: List[Tuple[str, str]] = []
+        self.keys: Set[str] = set()
+        self.by_title: Dict[str, List[dict]] = {}
+        self.by_tmdb: Dict[str, dict] = {}
+        self.by_file: Dict[str, dict] = {}
+        # 文件名 -> [(所在文件夹名, 条目)]
+        self.by_file_name: Dict[str, List[Tuple[str, dict]]] = {}
+        # 是否把索引中查找不到的标题记入未匹配缓存；守护模式下媒体库随时会新增条目，不应记录
+        self.remember_misses = True
+        self._lock = threading.Lock()
 
-    def send_request(self, url: str, params: Dict[str, str]) -> Optional[requests.Response]:
+    @staticmethod
+    def normalize_title(title: Optional[str]) -> str:
         """
-        向指定的URL发送GET请求，并返回响应。
-        如果请求失败，返回None。
-        如果无法将响应内容解析为JSON，返回None。
+        标准化标题：统一全半角和大小写，去掉空白和标点。
         """
-        max_attempts = 3
-        for attempt in range(max_attempts):
-            try:
-                response = requests.get(url, params=params)
-                response.raise_for_status()
-            except requests.exceptions.RequestException as e:
-                print(Fore.RED + "请求失败，错误信息：总共会重复请求3次，3次后跳过。" + Style.RESET_ALL)
-                if attempt < max_attempts - 1:
-                    wait_time = 2 ** attempt
-                    print(f"等待{wait_time}秒后重试...")
-                    time.sleep(wait_time)
-                    continue
-            else:
-                break
-        else:
-            print(Fore.RED + "所有尝试都失败，跳过请求。" + Style.RESET_ALL)
+        return normalize_title(title)
+
+    def ensure_loaded(self) -> bool:
+        """
+        需要时拉取索引，返回索引是否可用。上次拉取失败不到 retry_after 秒时不重试，直接返回False。
+        """
+        with self._lock:
+            if not self.loaded and (self.failed_at is None or time.monotonic() - self.failed_at >= self.retry_after):
+                self.load()
+            return self.loaded
+
+    def mark_stale(self) -> None:
+        """
+        标记媒体库可能加入了新条目，守护模式下每批开始前调用。
+        """
+        with self._lock:
+            self.stale = self.loaded
+
+    def _lookup(self, lookup: Callable[[], Optional[dict]]) -> Optional[dict]:
+        if not self.ensure_loaded():
             return None
+        item = lookup()
+        if item is None and self.stale:
+            with self._lock:
+                if self.stale:
+                    self.stale = False
+                    self.refresh()
+            item = lookup()
+        return item
 
-        try:
-            response_json = response.json()
-        except ValueError:
-            print(Fore.RED + "无法解析响应内容为JSON" + Style.RESET_ALL)
+    def load(self) -> None:
+        """
+        拉取所有媒体库并重建索引。
+        """
+        self.by_title, self.by_tmdb, self.by_file, self.by_file_name = {}, {}, {}, {}
+        self.sections, self.keys = [], set()
+        self.loaded = False
+        self.stale = False
+        response = self.plex_api.send_request(self.plex_api.plex_url + "/library/sections")
+        if response is None:
+            print(Fore.RED + f"无法获取PLEX媒体库列表，{self.retry_after:g} 秒内改为逐个搜索" + Style.RESET_ALL)
+            self.failed_at = time.monotonic()
+            return
+        sections = response.data['MediaContainer'].get('Directory', [])
+        items = []
+        for section in sections:
+            if section.get('type') not in self.section_types:
+                continue
+            section_items = self._section_items(section['key'])
+            if section_items is None:
+                # 只拉取到部分条目的索引会把其余条目当作未匹配
+                print(Fore.RED + f"无法获取PLEX媒体库 {section.get('title', section['key'])}，{self.retry_after:g} 秒内改为逐个搜索"
+                      + Style.RESET_ALL)
+                self.by_title, self.by_tmdb, self.by_file, self.by_file_name = {}, {}, {}, {}
+                self.sections, self.keys = [], set()
+                self.failed_at = time.monotonic()
+                return
+            self.sections.append((section['key'], section['type']))
+            for item in section_items:
+                item.setdefault('type', section['type'])
+                items.append(item)
+        items = self._with_guids(items)
+        for item in items:
+            self.add(item)
+        self.loaded = True
+        self.failed_at = None
+        print(Fore.GREEN + f"PLEX媒体库索引完成，共 {len(items)} 个条目。" + Style.RESET_ALL)
+
+    def refresh(self) -> int:
+        """
+        按加入时间倒序拉取各媒体库中还没有索引的条目，遇到已索引的条目即停止，返回新增的条目数。
+        条目的修改和删除不会反映到索引中，需要时调用 load 重新拉取。
+        """
+        items = []
+        for section_key, section_type in self.sections:
+            url = self.plex_api.plex_url + f"/library/sections/{section_key}/all"
+            start = 0
+            while True:
+                params = {'includeGuids': 1, 'sort': 'addedAt:desc',
+                          'X-Plex-Container-Start': start,
+                          'X-Plex-Container-Size': self.refresh_page_size}
+                response = self.plex_api.send_request(url, params)
+                if response is None:
+                    break
+                container = response.data['MediaContainer']
+                page = container.get('Metadata', [])
+                new = [item for item in page if str(item.get('ratingKey')) not in self.keys]
+                for item in new:
+                    item.setdefault('type', section_type)
+                items.extend(new)
+                start += len(page)
+                total = container.get('totalSize', container.get('size', start))
+                if len(new) < len(page) or not page or start >= int(total):
+                    break
+        items = self._with_guids(items)
+        for item in items:
+            self.add(item)
+        if items:
+            print(Fore.GREEN + f"PLEX媒体库索引新增 {len(items)} 个条目。" + Style.RESET_ALL)
+        return len(items)
+
+    def _with_guids(self, items: List[dict]) -> List[dict]:
+        # 服务器未返回 Guid 的条目批量补取详细信息
+        missing = [item['ratingKey'] for item in items if 'Guid' not in item and 'ratingKey' in item]
+        if not missing:
+            return items
+        details = self.plex_api.metadata_batch(missing)
+        return [details.get(str(item.get('ratingKey')), item) if 'Guid' not in item else item for item in items]
+
+    def _section_items(self, section_key: str) -> Optional[List[dict]]:
+        # 按 X-Plex-Container-Start/Size 分页拉取，直到取完 totalSize 条；任何一页失败时返回None
+        url = self.plex_api.plex_url + f"/library/sections/{section_key}/all"
+        start = 0
+        section_items = []
+        while True:
+            params = {'includeGuids': 1,
+                      'X-Plex-Container-Start': start,
+                      'X-Plex-Container-Size': self.page_size}
+            response = self.plex_api.send_request(url, params)
+            if response is None:
+                return None
+            container = response.data['MediaContainer']
+            items = container.get('Metadata', [])
+            section_items.extend(items)
+            start += len(items)
+            total = container.get('totalSize', container.get('size', start))
+            if not items or start >= int(total):
+                return section_items
+
+    def add(self, item: dict) -> None:
+        if 'ratingKey' in item:
+            self.keys.add(str(item['ratingKey']))
+        for title in {item.get('title'), item.get('originalTitle')}:
+            key = self.normalize_title(title)
+            if key:
+                self.by_title.setdefault(key, []).append(item)
+        tmdb_id = plex_tmdb_id(item)
+        if tmdb_id:
+            self.by_tmdb[tmdb_id] = item
+        for media in item.get('Media', []):
+            for part in media.get('Part', []):
+                if 'file' in part:
+                    self.by_file[os.path.normcase(os.path.normpath(part['file']))] = item
+                    folder, file_name = os.path.split(part['file'].replace('\\', '/'))
+                    self.by_file_name.setdefault(file_name, []).append((os.path.basename(folder), item))
+
+    def find(self, title: str, year: Union[str, int, None] = None, item_type: Optional[str] = None) -> Optional[dict]:
+        return self._lookup(lambda: self._find(title, year, item_type))
+
+    def _find(self, title: str, year: Union[str, int, None], item_type: Optional[str]) -> Optional[dict]:
+        for item in self.by_title.get(self.normalize_title(title), []):
+            if item_type and item.get('type') != item_type:
+                continue
+            if year and item.get('year') != int(year):
+                continue
+            return item
+        return None
+
+    def find_by_tmdb(self, tmdb_id: Union[str, int]) -> Optional[dict]:
+        return self._lookup(lambda: self.by_tmdb.get(str(tmdb_id)))
+
+    def find_by_file(self, file_path: str) -> Optional[dict]:
+        """
+        先按完整路径查找，找不到时按文件名查找（本地挂载路径与Plex服务器上的路径可能不同）。
+        只有文件名在索引中唯一、且所在文件夹名也相同时才按文件名匹配，否则返回None，由调用方按标题查找。
+        """
+        return self._lookup(lambda: self._find_by_file(file_path))
+
+    def _find_by_file(self, file_path: str) -> Optional[dict]:
+        item = self.by_file.get(os.path.normcase(os.path.normpath(file_path)))
+        if item is not None:
+            return item
+        candidates = self.by_file_name.get(os.path.basename(file_path), [])
+        if len(candidates) == 1:
+            folder, item = candidates[0]
+            if os.path.normcase(folder) == os.path.normcase(os.path.basename(os.path.dirname(file_path))):
+                return item
+        return None
+
+    def search_movie(self, title: str, year: Union[str, None] = None) -> Optional[Dict[str, str]]:
+        """
+        与 PlexApi.search_movie 返回相同格式的结果，但在本地索引中查找。
+        """
+        if not title:
+            raise ValueError("标题不能为空")
+        if year and not year.isdigit():
+            raise ValueError("年份必须为数字")
+        if not self.ensure_loaded():
+            # 索引暂时不可用，直接在服务器上搜索
+            return self.plex_api.search_movie(title, year)
+        if self.remember_misses and self.plex_api.is_known_miss('plex/movie', title, year):
+            print(Fore.YELLOW + f"已知未匹配，跳过：{title}" + Style.RESET_ALL)
+            return None
+        item = self.find(title, year, 'movie')
+        if item is None:
+            if self.remember_misses:
+                self.plex_api.remember_miss('plex/movie', title, year)
+            print(Fore.RED + "未发现媒体" + Style.RESET_ALL)
+            return None
+        return plex_movie_details(item)
+
+    def search_tv(self, title: str, year: Union[str, None] = None) -> Optional[Dict[str, str]]:
+        """
+        与 PlexApi.search_tv 返回相同格式的结果，但在本地索引中查找。
+        """
+        if not title:
+            raise ValueError("标题不能为空")
+        if year and not year.isdigit():
+            raise ValueError("年份必须为数字")
+        if not self.ensure_loaded():
+            # 索引暂时不可用，直接在服务器上搜索
+            return self.plex_api.search_tv(title, year)
+        if self.remember_misses and self.plex_api.is_known_miss('plex/show', title, year):
+            print(Fore.YELLOW + f"已知未匹配，跳过：{title}" + Style.RESET_ALL)
+            return None
+        item = self.find(title, year, 'show')
+        if item is None:
+            if self.remember_misses:
+                self.plex_api.remember_miss('plex/show', title, year)
+            print(Fore.RED + "未发现媒体" + Style.RESET_ALL)
             return None
+        return plex_show_details(item)
 
-        return response
 
+class TMDBApi(BaseApi):
+    def __init__(self, key: str, session: Optional[requests.Session] = None,
+                 api_url: str = "https://api.themoviedb.org/3", cache: Optional[ResponseCache] = None,
+                 rate_limit: Optional[float] = None, rate_burst: Optional[float] = None,
+                 timeout: Optional[Tuple[float, float]] = None, hedger: Optional[Hedger] = None):
+        super().__init__(session, cache, timeout=timeout, hedger=hedger)
+        self.key = key
+        self.api_url = api_url
+        # 同一主机的令牌桶在进程内共享
+        self.rate_limiter = get_bucket(urlsplit(api_url).netloc, rate_limit, rate_burst)
+        # 批量查询时同时进行的请求数
+        self.concurrency = DEFAULT_CONCURRENCY
+
+    @classmethod
+    def from_config(cls, config: Dict, session: Optional[requests.Session] = None,
+                    negative_cache: Optional[NegativeCache] = None) -> 'TMDBApi':
+        """
+        根据配置文件创建客户端，连接池、缓存、未匹配缓存、限速、超时、对冲和熔断参数均从配置读取。
+        """
+        api = cls(config['TMDB_API_KEY'],
+                  session=session if session is not None else session_from_config(config),
+                  cache=ResponseCache.from_config(config),
+                  rate_limit=config.get('tmdb_rate_limit'),
+                  rate_burst=config.get('tmdb_rate_burst'),
+                  timeout=timeout_from_config(config, 'tmdb'),
+                  hedger=hedger_from_config(config, 'tmdb'))
+        api.negative_cache = negative_cache if negative_cache is not None else NegativeCache.from_config(config)
+        api.configure_breaker(config, 'tmdb')
+        api.configure_singleflight(config)
+        api.concurrency = int(config.get('tmdb_concurrency', DEFAULT_CONCURRENCY))
+        return api
+
+    def is_empty_result(self, data) -> bool:
+        return isinstance(data, dict) and 'results' in data and not data['results']
+
+    @coalesced
     def search_tv(self, title: str, year: str = None, language: str = 'zh-CN', silent: bool = False) -> dict:
         """
         在TMDB上搜索指定标题和年份的电视剧。
@@ -216,6 +851,10 @@ class TMDBApi:
             raise ValueError("标题不能为空")
         if year and not year.isdigit():
             raise ValueError("年份必须为数字")
+        if self.is_known_miss('tmdb/search_tv', title, year):
+            if not silent:
+                print(Fore.YELLOW + f"已知未匹配，跳过剧集搜索：{title}" + Style.RESET_ALL)
+            return empty_search_result()
 
         post_url = "{0}/search/tv".format(self.api_url)
         post_params = dict(api_key=self.key, query=title, language=language)
@@ -223,8 +862,10 @@ class TMDBApi:
         if response is None:
             return None
 
-        return_data = response.json()
+        return_data = response.data
         return_data['request_code'] = response.status_code
+        if response.status_code == 200 and not return_data.get('results'):
+            self.remember_miss('tmdb/search_tv', title, year)
         if silent:
             return return_data
 
@@ -255,6 +896,7 @@ class TMDBApi:
         return None
 
 
+    @coalesced
     def tv_info(self, tv_id: str, language: str = 'zh-CN', silent: bool = False) -> dict:
         """
         获取指定电视剧的详细信息。
@@ -267,7 +909,7 @@ class TMDBApi:
         if response is None:
             return None
 
-        return_data = response.json()
+        return_data = response.data
         return_data['request_code'] = response.status_code
         if silent:
             return return_data
@@ -284,6 +926,7 @@ class TMDBApi:
         print(f"{success_msg} {dir_name}")
         return return_data
 
+    @coalesced
     def tv_season_info(self,
                     tv_id: str,
                     season_number: int,
@@ -300,7 +943,7 @@ class TMDBApi:
         if response is None:
             return {}
 
-        return_data = response.json()
+        return_data = response.data
         return_data['request_code'] = response.status_code
         if silent:
             return return_data
@@ -313,6 +956,57 @@ class TMDBApi:
 
         return return_data
 
+    @coalesced
+    def tv_bundle(self,
+                  tv_id: str,
+                  seasons: Optional[List[int]] = None,
+                  language: str = 'zh-CN',
+                  silent: bool = False) -> Optional[dict]:
+        """
+        用 append_to_response 一次获取剧集信息和多季的详细信息。
+        每次请求最多附带 APPEND_TO_RESPONSE_LIMIT 季，超出时分批请求。
+        seasons 为None时获取该剧集的所有季。
+        返回与 tv_info 相同的字典，并在 season_details 中按季数存放各季信息。
+        如果无法获取信息，返回None。
+        """
+        post_url = "{0}/tv/{1}".format(self.api_url, tv_id)
+        pending = list(dict.fromkeys(int(number) for number in seasons)) if seasons is not None else []
+        return_data = None
+        season_details = {}
+        while return_data is None or pending:
+            chunk, pending = pending[:APPEND_TO_RESPONSE_LIMIT], pending[APPEND_TO_RESPONSE_LIMIT:]
+            post_params = dict(api_key=self.key, language=language)
+            if chunk:
+                post_params['append_to_response'] = ','.join(f"season/{number}" for number in chunk)
+            response = self.send_request(post_url, post_params)
+            if response is None:
+                return return_data
+            data = response.data
+            for number in chunk:
+                season = data.pop(f"season/{number}", None)
+                if season is not None:
+                    season['request_code'] = response.status_code
+                    season_details[number] = season
+            if return_data is None:
+                return_data = data
+                return_data['request_code'] = response.status_code
+                return_data['season_details'] = season_details
+                if seasons is None:
+                    pending = [season['season_number'] for season in data.get('seasons', [])]
+        if silent:
+            return return_data
+
+        failure_msg = Fore.RED + '\n[Tv_info●失败]' + Style.RESET_ALL
+        success_msg = Fore.GREEN + '\n[Tv_info●成功]' + Style.RESET_ALL
+        if return_data['request_code'] != 200:
+            print(f"{failure_msg} tv_id: {tv_id}\n{return_data['status_message']}")
+            return return_data
+
+        first_air_year = return_data['first_air_date'][:4]
+        print(f"{success_msg} {return_data['name']} ({first_air_year}) 共获取 {len(season_details)} 季")
+        return return_data
+
+    @coalesced
     def movie_info(self, movie_id: str, language: str = 'zh-CN', silent: bool = False) -> dict:
         """
         获取指定电影的详细信息。
@@ -325,7 +1019,7 @@ class TMDBApi:
         if response is None:
             return None
 
-        return_data = response.json()
+        return_data = response.data
         return_data['request_code'] = response.status_code
         if silent:
             return return_data
@@ -343,6 +1037,7 @@ class TMDBApi:
 
         return return_data
 
+    @coalesced
     def search_movie(self, title: str, year: str = None, language: str = 'zh-CN', silent: bool = False) -> dict:
         """
         在TMDB上搜索指定标题和年份的电影。
@@ -354,6 +1049,10 @@ class TMDBApi:
             raise ValueError("标题不能为空")
         if year and not year.isdigit():
             raise ValueError("年份必须为数字")
+        if self.is_known_miss('tmdb/search_movie', title, year):
+            if not silent:
+                print(Fore.YELLOW + f"已知未匹配，跳过电影搜索：{title}" + Style.RESET_ALL)
+            return empty_search_result()
 
         post_url = "{0}/search/movie".format(self.api_url)
         post_params = dict(api_key=self.key, query=title, language=language)
@@ -361,8 +1060,10 @@ class TMDBApi:
         if response is None:
             return None
 
-        return_data = response.json()
+        return_data = response.data
         return_data['request_code'] = response.status_code
+        if response.status_code == 200 and not return_data.get('results'):
+            self.remember_miss('tmdb/search_movie', title, year)
         if silent:
             return return_data
 
@@ -376,7 +1077,8 @@ class TMDBApi:
             print(f"{failure_msg} 关键词[{title}]查找不到任何相关电影")
             return return_data
         
-        filtered_results = [result for result in return_data['results'] if result.get('release_date', '')[:4] == year]
+        # 没有年份时不按年份筛选；年份对不上不算未匹配，只有TMDB本身没有返回结果时才记录
+        filtered_results = [result for result in return_data['results'] if not year or result.get('release_date', '')[:4] == year]
         
         if len(filtered_results) == 0:
             print(f"{failure_msg} 关键词[{title}]查找不到任何相关电影")
@@ -391,6 +1093,7 @@ class TMDBApi:
         return return_data
 
 
+    @coalesced
     def search_movie_info(self, title: str, year: str = None, language: str = 'zh-CN', silent: bool = False) -> dict:
         """
         在TMDB上搜索指定标题和年份的电影。
@@ -402,6 +1105,10 @@ class TMDBApi:
             raise ValueError("标题不能为空")
         if year and not year.isdigit():
             raise ValueError("年份必须为数字")
+        if self.is_known_miss('tmdb/search_movie_info', title, year):
+            if not silent:
+                print(Fore.YELLOW + f"已知未匹配，跳过电影搜索：{title}" + Style.RESET_ALL)
+            return empty_search_result()
 
         post_url = "{0}/search/movie".format(self.api_url)
         post_params = dict(api_key=self.key, query=title, language=language)
@@ -409,8 +1116,10 @@ class TMDBApi:
         if response is None:
             return None
 
-        return_data = response.json()
+        return_data = response.data
         return_data['request_code'] = response.status_code
+        if response.status_code == 200 and not return_data.get('results'):
+            self.remember_miss('tmdb/search_movie_info', title, year)
         if silent:
             return return_data
 
@@ -443,4 +1152,136 @@ class TMDBApi:
             print("{:<15}{:<10}{:<10}{}".format(result['release_date'], str(i + 1), str(result['id']), result['title']))
 
         return_data['results'] = movie
-        return return_data
\ No newline at end of file
+        return return_data
+
+    def _is_search_cached(self, kind: str, title: str, language: str) -> bool:
+        if self.cache is None or not title:
+            return False
+        params = dict(api_key=self.key, query=title, language=language)
+        return self.cache.contains(self.cache.make_key("{0}/search/{1}".format(self.api_url, kind), params))
+
+    def _bulk(self, func: Callable, kind: str, queries: Iterable[Tuple[str, Optional[str]]],
+              language: str, silent: bool) -> Dict[Tuple[str, Optional[str]], Optional[dict]]:
+        """
+        对 (标题, 年份) 去重后批量执行 func，返回查询到结果的映射。
+        响应已缓存的查询直接在当前线程完成，其余的按 concurrency 并发请求。
+        无效的查询（如标题为空）对应None。
+        """
+        unique = list(dict.fromkeys(tuple(query) for query in queries))
+
+        def run(query: Tuple[str, Optional[str]]) -> Optional[dict]:
+            return self.run_query(func, query, language, silent)
+
+        local = [query for query in unique if self._is_search_cached(kind, query[0], language)]
+        results = {query: run(query) for query in local}
+        remote = [query for query in unique if query not in results]
+        if remote:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(remote)))) as executor:
+                results.update(zip(remote, executor.map(run, remote)))
+        return {query: results[query] for query in unique}
+
+    @staticmethod
+    def run_query(func: Callable, query: Tuple[str, Optional[str]], language: str = 'zh-CN',
+                  silent: bool = False) -> Optional[dict]:
+        """
+        执行一次 (标题, 年份) 查询，无效的查询（如标题为空）返回None。
+        """
+        title, year = query
+        try:
+            return func(title, year, language=language, silent=silent)
+        except ValueError as e:
+            print(Fore.RED + f"跳过查询 {title} ({year}): {e}" + Style.RESET_ALL)
+            return None
+
+    def search_movies_bulk(self, queries: Iterable[Tuple[str, Optional[str]]], language: str = 'zh-CN',
+                           silent: bool = False) -> Dict[Tuple[str, Optional[str]], Optional[dict]]:
+        """
+        批量调用 search_movie，返回 (标题, 年份) 到搜索结果的映射。
+        """
+        return self._bulk(self.search_movie, 'movie', queries, language, silent)
+
+    def search_tv_bulk(self, queries: Iterable[Tuple[str, Optional[str]]], language: str = 'zh-CN',
+                       silent: bool = False) -> Dict[Tuple[str, Optional[str]], Optional[dict]]:
+        """
+        批量调用 search_tv，返回 (标题, 年份) 到搜索结果的映射。
+        """
+        return self._bulk(self.search_tv, 'tv', queries, language, silent)
+
+    def search_movie_info_bulk(self, queries: Iterable[Tuple[str, Optional[str]]], language: str = 'zh-CN',
+                               silent: bool = False) -> Dict[Tuple[str, Optional[str]], Optional[dict]]:
+        """
+        批量调用 search_movie_info，返回 (标题, 年份) 到电影信息的映射。
+        """
+        return self._bulk(self.search_movie_info, 'movie', queries, language, silent)
+
+
+class AsyncTMDBApi:
+    """
+    TMDBApi 的异步版本，方法与 TMDBApi 相同。
+    请求在线程池中复用 TMDBApi 的连接池和缓存执行，同时进行的请求数不超过 max_concurrency。
+    """
+
+    def __init__(self, tmdb: TMDBApi, max_concurrency: int = DEFAULT_CONCURRENCY):
+        self.tmdb = tmdb
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    async def _call(self, func, *args, semaphore: Optional[asyncio.Semaphore] = None, **kwargs):
+        # 线程池本身限制同时执行的请求数；信号量属于创建它的事件循环，每次 asyncio.run 需要重新创建，不能保存在实例上
+        loop = asyncio.get_running_loop()
+        if semaphore is None:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+        async with semaphore:
+            return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def search_movie(self, title: str, year: str = None, language: str = 'zh-CN', silent: bool = False) -> dict:
+        return await self._call(self.tmdb.search_movie, title, year, language=language, silent=silent)
+
+    async def search_movie_info(self, title: str, year: str = None, language: str = 'zh-CN', silent: bool = False) -> dict:
+        return await self._call(self.tmdb.search_movie_info, title, year, language=language, silent=silent)
+
+    async def movie_info(self, movie_id: str, language: str = 'zh-CN', silent: bool = False) -> dict:
+        return await self._call(self.tmdb.movie_info, movie_id, language=language, silent=silent)
+
+    async def search_tv(self, title: str, year: str = None, language: str = 'zh-CN', silent: bool = False) -> dict:
+        return await self._call(self.tmdb.search_tv, title, year, language=language, silent=silent)
+
+    async def tv_info(self, tv_id: str, language: str = 'zh-CN', silent: bool = False) -> dict:
+        return await self._call(self.tmdb.tv_info, tv_id, language=language, silent=silent)
+
+    async def tv_season_info(self, tv_id: str, season_number: int, language: str = 'zh-CN', silent: bool = False) -> dict:
+        return await self._call(self.tmdb.tv_season_info, tv_id, season_number, language=language, silent=silent)
+
+    async def tv_bundle(self, tv_id: str, seasons: Optional[List[int]] = None, language: str = 'zh-CN', silent: bool = False) -> Optional[dict]:
+        return await self._call(self.tmdb.tv_bundle, tv_id, seasons, language=language, silent=silent)
+
+    async def resolve_files_info(self, files_info: Dict[str, Dict[str, str]], language: str = 'zh-CN') -> Dict[str, Optional[dict]]:
+        """
+        并发查询 files_info 中每个文件对应的TMDB信息。
+        文件信息中带有 tmdb_id 时调用 movie_info，其余文件按标题和年份去重后各调用一次 search_movie_info。
+        每个请求各占信号量的一个名额，同时进行的请求不超过 max_concurrency。
+        返回文件路径到查询结果的映射，无法查询的文件对应None。
+        """
+        queries = {path: (elements.get('chinese_title') or elements.get('english_title'), elements.get('year'))
+                   for path, elements in files_info.items() if elements.get('tmdb_id') is None}
+        by_id = {path: elements['tmdb_id'] for path, elements in files_info.items() if elements.get('tmdb_id') is not None}
+
+        # 在当前事件循环中创建信号量，守护模式下每批文件各自调用一次 asyncio.run
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # 重复的标题和 tmdb_id 只查询一次
+        unique_queries = list(dict.fromkeys(queries.values()))
+        unique_ids = list(dict.fromkeys(by_id.values()))
+        found = await asyncio.gather(
+            *(self._call(self.tmdb.run_query, self.tmdb.search_movie_info, query, language, semaphore=semaphore)
+              for query in unique_queries),
+            *(self._call(self.tmdb.movie_info, tmdb_id, language=language, semaphore=semaphore)
+              for tmdb_id in unique_ids))
+        searches = dict(zip(unique_queries, found[:len(unique_queries)]))
+        movies = dict(zip(unique_ids, found[len(unique_queries):]))
+
+        results = {path: movies[tmdb_id] for path, tmdb_id in by_id.items()}
+        results.update({path: searches[query] for path, query in queries.items()})
+        return {path: results[path] for path in files_info}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
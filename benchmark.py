@@ -0,0 +1,792 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : benchmark.py
+
+"""
+性能基准测试，不访问网络。
+
+用法:
+    python benchmark.py json [--items 20000] [--rounds 5]
+    python benchmark.py e2e [--items 300] [--latency 0.02] [--error-rate 0] [--rate-limit 0]
+    python benchmark.py watch [--plex-items 100] [--folders 3]
+    python benchmark.py parse [--names 20000] [--rounds 3]
+    python benchmark.py parse-many [--names 50000] [--workers 1,2,4]
+    python benchmark.py golden [--repeat 200] [--min-rate 0] [--update]
+    python benchmark.py scan [--folders 2000] [--files 6] [--changed 0.01] [--latency 0.2]
+    python benchmark.py strip [--names 5000] [--sizes 10,100,500]
+    python benchmark.py memory [--files 100000]
+"""
+
+import os
+import sys
+import json
+import time
+import math
+import random
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from typing import Callable, Dict, List
+
+from colorama import init, Fore, Style
+
+init(autoreset=True)
+
+
+def timeit(func: Callable[[], object], rounds: int) -> float:
+    """
+    多次执行并返回最快一次的耗时（秒）。
+    """
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(title: str, results: Dict[str, float], baseline: str) -> None:
+    print(Fore.CYAN + title + Style.RESET_ALL)
+    base = results[baseline]
+    for name, seconds in results.items():
+        print(f"  {name:<28} {seconds * 1000:>10.2f} ms   x{base / seconds:.2f}")
+
+
+def percentile(samples: List[float], p: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, max(0, math.ceil(p / 100 * len(samples)) - 1))]
+
+
+def report_latency(name: str, seconds: float, count: int, samples: List[float]) -> None:
+    line = f"  {name:<34} {seconds:>7.2f} s  {count / seconds:>8.1f} 个/秒"
+    if samples:
+        line += (f"   p50 {percentile(samples, 50) * 1000:.0f} ms"
+                 f"  p95 {percentile(samples, 95) * 1000:.0f} ms"
+                 f"  p99 {percentile(samples, 99) * 1000:.0f} ms")
+    print(line)
+
+
+def plex_section_payload(items: int) -> bytes:
+    """
+    生成与 /library/sections/{key}/all 结构相同的大体积Plex响应。
+    """
+    metadata: List[Dict] = []
+    for i in range(items):
+        metadata.append({
+            'ratingKey': str(10000 + i),
+            'key': f'/library/metadata/{10000 + i}',
+            'type': 'movie',
+            'title': f'电影标题 {i}',
+            'originalTitle': f'Movie Title {i}',
+            'year': 1980 + i % 45,
+            'summary': '这是一段用来占位的剧情简介。' * 8,
+            'Guid': [{'id': f'imdb://tt{1000000 + i}'}, {'id': f'tmdb://{i}'}, {'id': f'tvdb://{i}'}],
+            'Media': [{
+                'videoResolution': '1080',
+                'videoCodec': 'hevc',
+                'audioCodec': 'truehd',
+                'Part': [{'file': f'/media/movies/电影标题 {i} ({1980 + i % 45})/Movie.Title.{i}.1080p.mkv',
+                          'size': 10 ** 10 + i}],
+            }],
+        })
+    return json.dumps({'MediaContainer': {'size': items, 'Metadata': metadata}}, ensure_ascii=False).encode('utf-8')
+
+
+def bench_json(args: argparse.Namespace) -> None:
+    import api
+
+    content = plex_section_payload(args.items)
+    print(f"Plex响应大小: {len(content) / 1024 / 1024:.1f} MB, {args.items} 个条目")
+
+    results = {
+        '旧流程 json 解析两次': timeit(lambda: (json.loads(content), json.loads(content)), args.rounds),
+        '新流程 json 解析一次': timeit(lambda: json.loads(content), args.rounds),
+    }
+    try:
+        import orjson
+        results['新流程 orjson 解析一次'] = timeit(lambda: orjson.loads(content), args.rounds)
+    except ImportError:
+        print(Fore.YELLOW + "未安装 orjson，跳过对比" + Style.RESET_ALL)
+    report(f"JSON解析（当前后端: {api.json_loads.__module__}）", results, '旧流程 json 解析两次')
+
+
+def bench_e2e(args: argparse.Namespace) -> None:
+    """
+    启动本地模拟服务器，分别测量逐个查询与批量查询TMDB、逐个搜索与本地索引查找PLEX的吞吐量和延迟。
+    """
+    from api import TMDBApi, PlexApi, PlexLibraryIndex, create_session
+    from stub_server import StubServer, FixtureStore, synthetic_year
+
+    server = StubServer(fixtures=FixtureStore(args.fixtures), latency=args.latency, jitter=args.latency / 2,
+                        error_rate=args.error_rate, rate_limit=args.rate_limit or None,
+                        plex_items=args.plex_items, seed=args.seed).start()
+    print(f"模拟服务器 {server.url}，延迟 {args.latency * 1000:.0f}±{args.latency * 500:.0f} ms，"
+          f"错误率 {args.error_rate:.1%}，限速 {args.rate_limit or '无'}")
+
+    # 每个标题重复出现 duplicates 次，模拟同一部电影的多个文件
+    titles = [f"基准电影{i % max(1, args.items // args.duplicates)}" for i in range(args.items)]
+    queries = [(title, synthetic_year(title)) for title in titles]
+
+    def tmdb_client() -> TMDBApi:
+        # 每个场景使用新的客户端，不共享合并结果；关闭响应缓存以测量网络路径
+        tmdb = TMDBApi('benchmark', session=create_session(), api_url=server.url + '/3',
+                       rate_limit=args.client_rate, rate_burst=args.client_rate)
+        tmdb.concurrency = args.concurrency
+        return tmdb
+
+    try:
+        print(Fore.CYAN + f"TMDB 电影搜索（{len(queries)} 个查询，{len(set(queries))} 个不同标题）" + Style.RESET_ALL)
+        tmdb = tmdb_client()
+        samples = []
+        start = time.perf_counter()
+        for title, year in queries:
+            begin = time.perf_counter()
+            tmdb.search_movie_info(title, year, silent=True)
+            samples.append(time.perf_counter() - begin)
+        report_latency('逐个查询 search_movie_info', time.perf_counter() - start, len(queries), samples)
+
+        tmdb = tmdb_client()
+        start = time.perf_counter()
+        tmdb.search_movie_info_bulk(queries, silent=True)
+        report_latency('批量查询 search_movie_info_bulk', time.perf_counter() - start, len(queries), [])
+
+        print(Fore.CYAN + f"PLEX 电影查找（媒体库 {args.plex_items} 个条目）" + Style.RESET_ALL)
+        plex_titles = [f"电影{i % args.plex_items}" for i in range(args.items)]
+        plex = PlexApi(server.url, 'benchmark', execute_request=False, session=create_session())
+        samples = []
+        start = time.perf_counter()
+        for title in plex_titles:
+            begin = time.perf_counter()
+            plex.search_movie(title)
+            samples.append(time.perf_counter() - begin)
+        report_latency('逐个搜索 PlexApi.search_movie', time.perf_counter() - start, len(plex_titles), samples)
+
+        index = PlexLibraryIndex(PlexApi(server.url, 'benchmark', execute_request=False, session=create_session()))
+        start = time.perf_counter()
+        for title in plex_titles:
+            index.find(title, item_type='movie')
+        report_latency('本地索引 PlexLibraryIndex.find', time.perf_counter() - start, len(plex_titles), [])
+    finally:
+        server.stop()
+    print(f"服务器统计: {server.counters}")
+
+
+CHINESE_TITLES = ['流浪地球', '让子弹飞', '霸王别姬', '无间道', '大话西游之大圣娶亲', '唐人街探案', '哪吒之魔童降世', '我不是药神']
+ENGLISH_TITLES = ['The Wandering Earth', 'Let the Bullets Fly', 'Farewell My Concubine', 'Infernal Affairs',
+                  'Blade Runner', 'The Dark Knight', 'Spirited Away', 'Mad Max Fury Road', 'Alien', 'Heat']
+RELEASE_TAGS = [
+    ['1080p', '2160p', '720p', '4K', 'HD1080P'],
+    ['BluRay', 'WEB-DL', 'WEBRip', 'BDRemux', 'HDTV', 'Blu-ray', 'DVDRip'],
+    ['x264', 'x265', 'HEVC', 'H.264', 'AV1'],
+    ['', 'HDR', 'DV', 'HDR10+', 'DoVi'],
+    ['AAC', 'DTS-HD.MA.5.1', 'TrueHD.7.1.Atmos', 'DDP5.1', 'FLAC', 'AC3'],
+    ['', '10bit', 'REPACK', 'IMAX', 'Directors.Cut'],
+]
+
+
+def bench_watch(args: argparse.Namespace) -> None:
+    """
+    在同一进程中连续处理两批文件夹，模拟守护模式：每批之间向模拟PLEX中加入新条目，
+    检查第二批仍能正常运行、能匹配到新条目、PLEX索引只补充新条目而不整体重新加载，且没有把索引中查找不到的标题记为未匹配。
+    第二批由监视器发现，处理后检查整理时的改名不会让这些文件夹再次进入队列。有问题时以非零状态退出。
+    """
+    from unittest import mock
+    from rename_moive_tmdb import MovieRenamer
+    from scanner import InventoryStore
+    from stub_server import StubServer
+    from watcher import Watcher
+
+    server = StubServer(plex_items=args.plex_items, seed=args.seed).start()
+    print(f"模拟服务器 {server.url}，媒体库 {args.plex_items} 个条目")
+    data = server.data
+    next_item = args.plex_items
+
+    def new_folders(library: str, count: int) -> List[str]:
+        # 按模拟PLEX条目的文件路径创建本地文件夹，条目本身由调用方决定何时加入媒体库
+        nonlocal next_item
+        items = [data.plex_movie(i) for i in range(next_item, next_item + count)]
+        next_item += count
+        folders = []
+        for item in items:
+            folder_name, file_name = item['Media'][0]['Part'][0]['file'].split('/')[-2:]
+            folder = os.path.join(library, folder_name)
+            os.makedirs(folder)
+            open(os.path.join(folder, file_name), 'wb').close()
+            folders.append((folder, file_name, item))
+        return folders
+
+    def publish(items: List[dict]) -> None:
+        for item in items:
+            data.plex_library.append(item)
+            data.plex_by_key[item['ratingKey']] = item
+            data.plex_by_title.setdefault(item['title'], []).append(item)
+
+    def unchanged(folders) -> List[str]:
+        return [file_name for folder, file_name, _ in folders if os.path.exists(os.path.join(folder, file_name))]
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        base_config = json.load(f)
+    failures = []
+    work = tempfile.mkdtemp(prefix='meidaao-watch-')
+    try:
+        for mode in ('plex', 'tmdb'):
+            root = os.path.join(work, mode)
+            library = os.path.join(root, 'library')
+            os.makedirs(library)
+            config = dict(base_config, PLEX_URL=server.url, PLEX_TOKEN='benchmark', TMDB_API_KEY='benchmark',
+                          tmdb_cache_path=os.path.join(root, 'cache.sqlite3'), parse_cache_persistent=False,
+                          incremental_scan=False, move_files=False, movie_delete_files=False)
+            for key in ('MOVIES_FOLDER', 'SHOWS_FOLDER', 'ANIME_FOLDER', 'CHINESE_DRAMA_FOLDER', 'DOCUMENTARY_FOLDER',
+                        'AMERICAN_DRAMA_FOLDER', 'JAPANESE_KOREAN_DRAMA_FOLDER', 'SPORTS_FOLDER', 'VARIETY_SHOW_FOLDER'):
+                config[key] = root
+            config_file = os.path.join(root, 'config.json')
+            with open(config_file, 'w', encoding='utf-8') as f:
+                json.dump(config, f, ensure_ascii=False)
+
+            print(Fore.CYAN + f"{mode} 模式" + Style.RESET_ALL)
+            with mock.patch('builtins.input', return_value=mode):
+                renamer = MovieRenamer(config_file)
+            renamer.tmdb.api_url = server.url + '/3'
+            # 与 watch() 相同的守护模式设置
+            renamer.interactive = False
+            renamer.plex_index.remember_misses = False
+            renamer.inventory_store = InventoryStore(':memory:')
+            # 守护模式下任何询问都会卡住进程
+            with mock.patch('builtins.input', side_effect=AssertionError("守护模式下不应请求输入")):
+                initial = new_folders(library, args.folders)
+                publish([item for _, _, item in initial])
+                renamer.process_library(library)
+                load = mock.patch.object(renamer.plex_index, 'load', wraps=renamer.plex_index.load).start()
+
+                # 第一批：文件夹已下载完成，但PLEX尚未扫描到
+                first = new_folders(library, args.folders)
+                if mode == 'tmdb':
+                    publish([item for _, _, item in first])
+                start = time.perf_counter()
+                renamer.process_batch(library, [folder for folder, _, _ in first])
+                print(f"  第一批 {len(first)} 个文件夹 {time.perf_counter() - start:.3f} 秒")
+                if mode == 'plex':
+                    if len(unchanged(first)) != len(first):
+                        failures.append(f"{mode}: 第一批中PLEX尚未收录的文件夹被整理")
+                    publish([item for _, _, item in first])
+
+                # 第二批：PLEX已收录第一批的条目，并且又有新的文件夹，由监视器发现；两种模式分别使用 inotify 和轮询
+                watcher = Watcher([library], mode='auto' if mode == 'plex' else 'poll', interval=0.3, settle=0.2)
+                try:
+                    second = new_folders(library, args.folders)
+                    publish([item for _, _, item in second])
+                    expected = {folder for folder, _, _ in second}
+                    found = set()
+                    deadline = time.time() + 10
+                    while not expected <= found and time.time() < deadline:
+                        found.update(watcher.poll(0.1))
+                    if not expected <= found:
+                        failures.append(f"{mode}: 监视器未发现 {len(expected - found)} 个新文件夹")
+                    batch = [folder for folder, _, _ in first if mode == 'plex'] + sorted(found)
+                    start = time.perf_counter()
+                    written = renamer.process_batch(library, batch)
+                    watcher.ignore(written)
+                    print(f"  第二批 {len(batch)} 个文件夹 {time.perf_counter() - start:.3f} 秒，"
+                          f"{type(watcher.backend).__name__} 忽略 {len(written)} 个自己写入的路径")
+                    # 整理时的改名不应让文件夹再次进入队列
+                    requeued = set()
+                    deadline = time.time() + watcher.ignore_seconds + 1
+                    while time.time() < deadline:
+                        requeued.update(watcher.poll(0.1))
+                    if requeued:
+                        failures.append(f"{mode}: 整理后又进入队列 {', '.join(sorted(requeued))}")
+                finally:
+                    watcher.close()
+                missed = unchanged((first if mode == 'plex' else []) + second)
+                if missed:
+                    failures.append(f"{mode}: 第二批未整理 {', '.join(missed)}")
+                mock.patch.stopall()
+                if load.call_count:
+                    failures.append(f"{mode}: 批次之间整体重新加载了PLEX索引 {load.call_count} 次")
+            plex_misses = [row for row in renamer.negative_cache.recorded if row[0].startswith('plex/')]
+            if plex_misses:
+                failures.append(f"{mode}: 守护模式下记录了PLEX未匹配 {plex_misses}")
+            renamer.release_parser.close()
+            renamer.inventory_store.close()
+    finally:
+        server.stop()
+        shutil.rmtree(work, ignore_errors=True)
+
+    for failure in failures:
+        print(Fore.RED + f"  {failure}" + Style.RESET_ALL)
+    print(f"问题 {len(failures)}")
+    if failures:
+        sys.exit(1)
+
+
+def release_names(count: int, seed: int = 0) -> List[str]:
+    """
+    生成带有常见发布组标记的电影文件名。
+    """
+    rng = random.Random(seed)
+    names = []
+    for i in range(count):
+        parts = []
+        style = rng.random()
+        if style < 0.4:
+            parts.append(rng.choice(CHINESE_TITLES))
+            parts.append(rng.choice(ENGLISH_TITLES).replace(' ', '.'))
+        elif style < 0.6:
+            parts.append(f"《{rng.choice(CHINESE_TITLES)}》")
+        elif style < 0.9:
+            parts.append(rng.choice(ENGLISH_TITLES).replace(' ', '.'))
+            if rng.random() < 0.2:
+                parts.append(rng.choice(['2', 'II', 'III']))
+        else:
+            parts.append(f"[{rng.choice(['国语中字', '简英双字'])}]{rng.choice(CHINESE_TITLES)}")
+        parts.append(str(rng.randint(1960, 2024)))
+        parts.extend(tag for tag in (rng.choice(group) for group in RELEASE_TAGS) if tag)
+        name = '.'.join(parts) + rng.choice(['-GROUP', '-CMCT', '@FRDS', '', '.国语中字']) + rng.choice(['.mkv', '.mp4'])
+        names.append(name)
+    return names
+
+
+def bench_parse(args: argparse.Namespace) -> None:
+    from cache import ParseCache
+    from release_parser import ReleaseParser, parse_release_legacy
+
+    # 直接读取配置文件，避免 ConfigManager 在缺少服务器信息时提示输入
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    elements_regex, elements_to_remove = config['elements_regex'], config['elements_to_remove']
+
+    with tempfile.TemporaryDirectory() as root:
+        # 只含英文标题的文件会读取父文件夹，放在一个真实存在的目录中
+        folder = os.path.join(root, '流浪地球 (2019) {tmdb-535167}')
+        os.makedirs(folder)
+        paths = [os.path.join(folder, name) for name in release_names(args.names, args.seed)]
+
+        parser = ReleaseParser(elements_regex, elements_to_remove)
+        expected = [parse_release_legacy(path, elements_regex, elements_to_remove) for path in paths]
+        actual = [parser.parse(path) for path in paths]
+        mismatches = [path for path, old, new in zip(paths, expected, actual) if old != new]
+        print(f"{len(paths)} 个文件名，结果不一致 {len(mismatches)}")
+        for path in mismatches[:5]:
+            print(Fore.RED + f"  不一致: {os.path.basename(path)}" + Style.RESET_ALL)
+
+        results = {
+            '旧流程 逐个正则': timeit(lambda: [parse_release_legacy(path, elements_regex, elements_to_remove)
+                                          for path in paths], args.rounds),
+            '新流程 ReleaseParser': timeit(lambda: [parser.parse(path) for path in paths], args.rounds),
+        }
+        # 重复的文件名直接使用缓存的解析结果
+        parser.cache = ParseCache('release', parser.fingerprint, max_size=len(paths))
+        results['新流程 解析缓存命中'] = timeit(lambda: [parser.parse(path) for path in paths], args.rounds)
+    report("文件名解析", results, '旧流程 逐个正则')
+    for name, seconds in results.items():
+        print(f"  {name:<28} {len(paths) / seconds:>10.0f} 个/秒")
+
+
+def bench_parse_many(args: argparse.Namespace) -> None:
+    """
+    对比逐个解析、parse_many（按估算决定是否使用进程池）和强制使用进程池的耗时，
+    并给出 release_parser 中进程池开销常数对应的盈亏平衡点。常数需要在多核机器上用本命令的结果校准。
+    """
+    import multiprocessing
+    from release_parser import ReleaseParser, POOL_STARTUP_SECONDS, POOL_TRANSFER_SECONDS, available_cpus
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+
+    with tempfile.TemporaryDirectory() as root:
+        folder = os.path.join(root, '流浪地球 (2019) {tmdb-535167}')
+        os.makedirs(folder)
+        # 不同的种子使文件名基本不重复，批量解析时不会因去重而少解析
+        paths = [os.path.join(folder, f'{index} {name}') for index, name in enumerate(release_names(args.names, args.seed))]
+
+        parser = ReleaseParser(config['elements_regex'], config['elements_to_remove'])
+        expected = [parser.parse_release(path) for path in paths]
+        names = [os.path.basename(path) for path in paths]
+        results = {'逐个解析': timeit(lambda: [parser.parse_release(path) for path in paths], args.rounds)}
+        for workers in [int(value) for value in args.workers.split(',')]:
+            actual = parser.parse_many(paths, max_workers=workers)
+            if actual != expected:
+                print(Fore.RED + f"{workers} 个进程的结果与逐个解析不一致" + Style.RESET_ALL)
+            results[f'parse_many {workers}进程'] = timeit(lambda: parser.parse_many(paths, max_workers=workers), args.rounds)
+            if workers > 1:
+                results[f'进程池 {workers}进程（强制）'] = timeit(lambda: parser._parse_names_parallel(names, workers), args.rounds)
+        per_name = timeit(lambda: parser._parse_names(names), args.rounds) / len(names)
+    method = multiprocessing.get_start_method()
+    base, per_worker = POOL_STARTUP_SECONDS.get(method, POOL_STARTUP_SECONDS['spawn'])
+    print(f"CPU核数: {os.cpu_count()}，可用: {available_cpus()}，进程启动方式: {method}")
+    print(f"解析一个文件名 {per_name * 1e6:.1f} 微秒")
+    for workers in [int(value) for value in args.workers.split(',')]:
+        if workers > 1:
+            margin = per_name * (1 - 1 / workers) - POOL_TRANSFER_SECONDS
+            breakeven = f"{(base + workers * per_worker) / margin:.0f} 个文件名" if margin > 0 else "不会更快"
+            print(f"  {workers} 个进程的盈亏平衡点（按 release_parser 中的常数）: {breakeven}")
+    report("批量解析", results, '逐个解析')
+    for name, seconds in results.items():
+        print(f"  {name:<28} {len(paths) / seconds:>10.0f} 个/秒")
+
+
+def bench_golden(args: argparse.Namespace) -> None:
+    """
+    用 golden_corpus.json 中的真实发布名校验解析结果，并测量吞吐量。
+    语料库自带解析规则，结果与本机 config.json 无关；有不一致时以非零状态退出。
+    """
+    from release_parser import ReleaseParser, parse_folder_name, parse_title_year
+
+    with open(args.corpus, 'r', encoding='utf-8') as f:
+        corpus = json.load(f)
+    rules = corpus['rules']
+    parser = ReleaseParser(rules['elements_regex'], rules['elements_to_remove'])
+    # 只用到父文件夹名，不需要真实的目录
+    release_paths = [os.path.join('golden', entry['folder'], entry['name']) for entry in corpus['release']]
+
+    sections = {
+        'release': (lambda entry, path: dict(parser.parse(path)), release_paths),
+        'folder': (lambda entry, path: list(parse_folder_name(entry['name'])), None),
+        'set_folder': (lambda entry, path: parse_title_year(entry['name']), None),
+    }
+    mismatches = 0
+    rates = {}
+    for section, (parse, paths) in sections.items():
+        entries = corpus[section]
+        paths = paths or [None] * len(entries)
+        for entry, path in zip(entries, paths):
+            actual = parse(entry, path)
+            if args.update:
+                entry['expected'] = actual
+            elif actual != entry['expected']:
+                mismatches += 1
+                print(Fore.RED + f"  [{section}] {entry['name']}" + Style.RESET_ALL)
+                print(f"    期望: {entry['expected']}")
+                print(f"    实际: {actual}")
+        seconds = timeit(lambda: [parse(entry, path) for _ in range(args.repeat) for entry, path in zip(entries, paths)],
+                         args.rounds)
+        rates[section] = len(entries) * args.repeat / seconds
+
+    if args.update:
+        with open(args.corpus, 'w', encoding='utf-8', newline='\r\n') as f:
+            json.dump(corpus, f, ensure_ascii=False, indent=4)
+            f.write('\n')
+        print(Fore.YELLOW + f"已按当前解析结果更新 {args.corpus}" + Style.RESET_ALL)
+
+    print(Fore.CYAN + "黄金语料库" + Style.RESET_ALL)
+    for section, rate in rates.items():
+        print(f"  {section:<12} {len(corpus[section]):>5} 条   {rate:>10.0f} 个/秒")
+    print(f"结果不一致 {mismatches}")
+    if args.min_rate and rates['release'] < args.min_rate:
+        print(Fore.RED + f"发布名解析吞吐量 {rates['release']:.0f} 个/秒 低于 {args.min_rate:.0f}" + Style.RESET_ALL)
+        sys.exit(1)
+    if mismatches:
+        sys.exit(1)
+
+
+class SlowDirEntry:
+    """
+    os.DirEntry 的包装，stat() 前等待 latency 秒，模拟网络挂载上的一次往返。
+    """
+
+    def __init__(self, entry: os.DirEntry, latency: float):
+        self._entry = entry
+        self._latency = latency
+        self.name = entry.name
+        self.path = entry.path
+
+    def is_dir(self) -> bool:
+        return self._entry.is_dir()
+
+    def is_symlink(self) -> bool:
+        return self._entry.is_symlink()
+
+    def stat(self) -> os.stat_result:
+        time.sleep(self._latency)
+        return self._entry.stat()
+
+
+def slow_filesystem(latency: float):
+    """
+    返回替换 os.scandir 和 os.stat 的上下文，每次列目录和取文件信息都等待 latency 秒。
+    """
+    import contextlib
+    from unittest import mock
+
+    real_scandir, real_stat = os.scandir, os.stat
+
+    @contextlib.contextmanager
+    def scandir(path):
+        time.sleep(latency)
+        with real_scandir(path) as entries:
+            yield [SlowDirEntry(entry, latency) for entry in entries]
+
+    def stat(path, *args, **kwargs):
+        time.sleep(latency)
+        return real_stat(path, *args, **kwargs)
+
+    stack = contextlib.ExitStack()
+    stack.enter_context(mock.patch('os.scandir', side_effect=scandir))
+    stack.enter_context(mock.patch('os.stat', side_effect=stat))
+    return stack
+
+
+def bench_scan(args: argparse.Namespace) -> None:
+    """
+    对比电影脚本原先的四次目录遍历（删除、移动、解析、字幕）与一次 scandir 扫描后读取清单的耗时，
+    并统计访问文件系统的次数（网盘挂载时每次都要一次网络往返）。
+    增量扫描分别在本地磁盘和模拟的高延迟挂载（每次文件系统调用等待 --latency 毫秒）上与完整扫描比较。
+    """
+    from unittest import mock
+    from scanner import InventoryStore, scan_library
+
+    suffixes = ['mkv', 'mp4', 'srt', 'ass', 'nfo', 'jpg']
+    with tempfile.TemporaryDirectory() as root:
+        for i in range(args.folders):
+            folder = os.path.join(root, f'电影{i} (2019)')
+            os.makedirs(os.path.join(folder, 'Subs'))
+            for j in range(args.files):
+                open(os.path.join(folder, f'Movie.{i}.{j}.{suffixes[j % len(suffixes)]}'), 'w').close()
+            open(os.path.join(folder, 'Subs', f'Movie.{i}.chs.srt'), 'w').close()
+
+        def legacy() -> None:
+            for _ in os.walk(root, topdown=False):
+                pass
+            for _ in os.walk(root, topdown=False):
+                pass
+            for folder in os.listdir(root):
+                path = os.path.join(root, folder)
+                if os.path.isdir(path):
+                    for _ in os.walk(path):
+                        pass
+            for _ in os.walk(root):
+                pass
+
+        def single_pass() -> None:
+            inventory = scan_library(root, ['mkv', 'mp4'], ['srt', 'ass'])
+            for _ in inventory.walk(root, topdown=False):
+                pass
+            for _ in inventory.walk(root, topdown=False):
+                pass
+            for folder in inventory.listdir(root):
+                path = os.path.join(root, folder)
+                if inventory.isdir(path):
+                    for _ in inventory.walk(path):
+                        pass
+            for _ in inventory.walk(root):
+                pass
+
+        calls = {}
+        for name, func in (('原流程 四次遍历', legacy), ('scandir 一次扫描', single_pass)):
+            # os.walk 内部同样使用 os.scandir，统计 scandir、listdir、stat 的调用次数
+            with mock.patch('os.scandir', side_effect=os.scandir) as scandir, \
+                    mock.patch('os.listdir', side_effect=os.listdir) as listdir, \
+                    mock.patch('os.stat', side_effect=os.stat) as stat:
+                func()
+                calls[name] = scandir.call_count + listdir.call_count + stat.call_count
+        results = {
+            '原流程 四次遍历': timeit(legacy, args.rounds),
+            'scandir 一次扫描': timeit(single_pass, args.rounds),
+        }
+        # 增量扫描：先完整扫描一次保存清单，之后每轮修改一部分文件夹再重新扫描
+        inventory_dir = tempfile.mkdtemp()
+        store = InventoryStore(os.path.join(inventory_dir, 'inventory.sqlite3'))
+        scan_library(root, store=store)
+        rng = random.Random(0)
+        folders = sorted(name for name in os.listdir(root) if name.startswith('电影'))
+        changes = iter(range(1 << 30))
+
+        def incremental_scan():
+            change = next(changes)
+            for name in rng.sample(folders, max(1, int(len(folders) * args.changed))):
+                open(os.path.join(root, name, f'new{change}.mkv'), 'w').close()
+            start = time.perf_counter()
+            inventory = scan_library(root, store=store)
+            return time.perf_counter() - start, inventory
+
+        with mock.patch('os.scandir', side_effect=os.scandir) as scandir, mock.patch('os.stat', side_effect=os.stat) as stat:
+            _, inventory = incremental_scan()
+            incremental_calls = scandir.call_count + stat.call_count
+        # 重新列出的目录中，每个文件和子目录还有一次 DirEntry.stat()
+        rescanned = [os.path.join(root, name) for name in folders if os.path.join(root, name) in inventory.dirty]
+        incremental_calls += 0 if os.name == 'nt' else sum(len(inventory.listdir(path)) for path in rescanned)
+        incremental = min(incremental_scan()[0] for _ in range(args.rounds))
+        full = timeit(lambda: scan_library(root), args.rounds)
+        slow = {}
+        if args.latency > 0:
+            with slow_filesystem(args.latency / 1000):
+                slow['full'] = timeit(lambda: scan_library(root), 1)
+                slow['incremental'] = incremental_scan()[0]
+        store.close()
+        shutil.rmtree(inventory_dir)
+
+        # 清单中每个文件的大小和修改时间来自 DirEntry.stat()：Windows 下随目录列表一起返回，其他系统每个文件一次 stat
+        file_stats = 0 if os.name == 'nt' else len(scan_library(root).files)
+    report(f"媒体库遍历（{args.folders} 个文件夹）", results, '原流程 四次遍历')
+    for name, count in calls.items():
+        print(f"  {name:<28} 目录/文件系统调用 {count} 次")
+    print(f"  另有读取文件大小和修改时间的 stat {file_stats} 次")
+    print(Fore.CYAN + f"增量扫描（{args.changed:.0%} 的文件夹有变化）" + Style.RESET_ALL)
+    print(f"  本地磁盘：完整扫描 {full * 1000:.2f} ms，增量扫描 {incremental * 1000:.2f} ms，"
+          f"重新列出 {inventory.listed} 个目录，沿用 {inventory.reused} 个")
+    print(f"  增量扫描的目录/文件系统调用 {incremental_calls} 次（完整扫描 {calls['scandir 一次扫描'] + file_stats} 次）")
+    if slow:
+        print(f"  模拟挂载（每次调用 {args.latency:g} ms）：完整扫描 {slow['full'] * 1000:.0f} ms，"
+              f"增量扫描 {slow['incremental'] * 1000:.0f} ms，x{slow['full'] / slow['incremental']:.2f}")
+
+
+def junk_elements(count: int, seed: int = 0) -> List[str]:
+    """
+    生成类似 elements_to_remove 的发布组标记，如 国语中字、简英双字。
+    """
+    rng = random.Random(seed)
+    languages = ['国语', '粤语', '国粤', '简英', '繁英', '中英', '泰语', '日语', '韩语', '双语', '简繁', '英语']
+    suffixes = ['中字', '双字', '特效', '字幕', '双语', '内封', '外挂', '无字']
+    elements = {'%7C', '3D', 'HD中字'}
+    while len(elements) < count:
+        elements.add(rng.choice(languages) + rng.choice(suffixes) + (str(rng.randint(1, 99)) if len(elements) > 90 else ''))
+    return sorted(elements)
+
+
+def bench_strip(args: argparse.Namespace) -> None:
+    import re
+    from aho_corasick import AhoCorasick
+
+    names = [name.rsplit('.', 1)[0].replace('.', ' ').upper() for name in release_names(args.names, args.seed)]
+    print(Fore.CYAN + f"删除 elements_to_remove（{len(names)} 个文件名）" + Style.RESET_ALL)
+    for size in (int(size) for size in args.sizes.split(',')):
+        elements = junk_elements(size, args.seed)
+        stripper = AhoCorasick(elements)
+
+        def legacy() -> List[str]:
+            result = []
+            for name in names:
+                for element in elements:
+                    name = re.sub(element, '', name)
+                result.append(name)
+            return result
+
+        expected = legacy()
+        mismatches = sum(old != stripper.remove(name) for old, name in zip(expected, names))
+        old = timeit(legacy, args.rounds)
+        new = timeit(lambda: [stripper.remove(name) for name in names], args.rounds)
+        print(f"  {size:>5} 个元素   逐个 re.sub {len(names) / old:>9.0f} 个/秒   "
+              f"Aho-Corasick {len(names) / new:>9.0f} 个/秒   x{old / new:.2f}   结果不一致 {mismatches}")
+
+
+def retained_bytes(build: Callable[[], object]) -> int:
+    """
+    返回 build 返回的对象占用的内存（字节）。
+    """
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_memory(args: argparse.Namespace) -> None:
+    from release_parser import ReleaseParser, ParsedRelease
+
+    with open(args.config, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    parser = ReleaseParser.from_config(config)
+    with tempfile.TemporaryDirectory() as root:
+        folder = os.path.join(root, '流浪地球 (2019) {tmdb-535167}')
+        os.makedirs(folder)
+        paths = [os.path.join(folder, f"{i:06d}.{name}") for i, name in enumerate(release_names(args.files, args.seed))]
+        # 先解析好，只比较 total_files_info 保存解析结果的开销
+        parsed = [parser.parse(path) for path in paths]
+
+    def fresh(elements: Dict) -> Dict:
+        # 与实际解析一样，每个文件的取值都是新创建的字符串
+        return {key: (' ' + value)[1:] if isinstance(value, str) else value for key, value in elements.items()}
+
+    print(Fore.CYAN + f"total_files_info 内存占用（{len(paths)} 个文件）" + Style.RESET_ALL)
+    results = {
+        '每个文件一个字典': retained_bytes(lambda: {path: fresh(elements) for path, elements in zip(paths, parsed)}),
+        'ParsedRelease': retained_bytes(lambda: {path: ParsedRelease(fresh(elements)) for path, elements in zip(paths, parsed)}),
+    }
+    base = results['每个文件一个字典']
+    for name, size in results.items():
+        print(f"  {name:<28} {size / 1024 / 1024:>8.1f} MB   {size / len(paths):>6.0f} 字节/文件   x{base / size:.2f}")
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description='MeidaAO 性能基准测试')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    json_parser = subparsers.add_parser('json', help='对比Plex大响应的JSON解析开销')
+    json_parser.add_argument('--items', type=int, default=20000)
+    json_parser.add_argument('--rounds', type=int, default=5)
+    json_parser.set_defaults(func=bench_json)
+
+    e2e_parser = subparsers.add_parser('e2e', help='基于本地模拟服务器的端到端吞吐量和延迟')
+    e2e_parser.add_argument('--items', type=int, default=300, help='查询次数')
+    e2e_parser.add_argument('--duplicates', type=int, default=3, help='每个标题重复的次数')
+    e2e_parser.add_argument('--latency', type=float, default=0.02, help='模拟服务器的平均延迟（秒）')
+    e2e_parser.add_argument('--error-rate', type=float, default=0.0, help='模拟服务器返回500的比例')
+    e2e_parser.add_argument('--rate-limit', type=float, default=0, help='模拟服务器每秒请求上限，0表示不限')
+    e2e_parser.add_argument('--client-rate', type=float, default=1000, help='客户端令牌桶速率')
+    e2e_parser.add_argument('--concurrency', type=int, default=8, help='批量查询的并发数')
+    e2e_parser.add_argument('--plex-items', type=int, default=2000, help='模拟PLEX媒体库的条目数')
+    e2e_parser.add_argument('--fixtures', help='录制的夹具文件（JSON）')
+    e2e_parser.add_argument('--seed', type=int, default=0)
+    e2e_parser.set_defaults(func=bench_e2e)
+
+    watch_parser = subparsers.add_parser('watch', help='在同一进程中连续处理两批文件夹，检查守护模式的每批状态')
+    watch_parser.add_argument('--plex-items', type=int, default=100)
+    watch_parser.add_argument('--folders', type=int, default=3, help='每批新增的文件夹数')
+    watch_parser.add_argument('--seed', type=int, default=0)
+    watch_parser.add_argument('--config', default='config.json')
+    watch_parser.set_defaults(func=bench_watch)
+
+    parse_parser = subparsers.add_parser('parse', help='对比文件名解析的吞吐量并校验结果一致')
+    parse_parser.add_argument('--names', type=int, default=20000)
+    parse_parser.add_argument('--rounds', type=int, default=3)
+    parse_parser.add_argument('--seed', type=int, default=0)
+    parse_parser.add_argument('--config', default='config.json')
+    parse_parser.set_defaults(func=bench_parse)
+
+    parse_many_parser = subparsers.add_parser('parse-many', help='对比逐个解析与进程池批量解析的吞吐量')
+    parse_many_parser.add_argument('--names', type=int, default=50000)
+    parse_many_parser.add_argument('--workers', default='1,2,4', help='进程数，逗号分隔')
+    parse_many_parser.add_argument('--rounds', type=int, default=3)
+    parse_many_parser.add_argument('--seed', type=int, default=0)
+    parse_many_parser.add_argument('--config', default='config.json')
+    parse_many_parser.set_defaults(func=bench_parse_many)
+
+    golden_parser = subparsers.add_parser('golden', help='用黄金语料库校验解析结果并测量吞吐量')
+    golden_parser.add_argument('--corpus', default='golden_corpus.json')
+    golden_parser.add_argument('--repeat', type=int, default=200, help='测量吞吐量时语料库重复的次数')
+    golden_parser.add_argument('--rounds', type=int, default=3)
+    golden_parser.add_argument('--min-rate', type=float, default=0, help='发布名每秒至少解析的数量，0表示不检查')
+    golden_parser.add_argument('--update', action='store_true', help='有意修改解析逻辑后，用当前结果重写语料库')
+    golden_parser.set_defaults(func=bench_golden)
+
+    scan_parser = subparsers.add_parser('scan', help='对比多次 os.walk 与一次 scandir 扫描')
+    scan_parser.add_argument('--folders', type=int, default=2000)
+    scan_parser.add_argument('--files', type=int, default=6, help='每个文件夹中的文件数')
+    scan_parser.add_argument('--changed', type=float, default=0.01, help='增量扫描前修改的文件夹比例')
+    scan_parser.add_argument('--rounds', type=int, default=3)
+    scan_parser.add_argument('--latency', type=float, default=0.2,
+                             help='模拟网络挂载时每次文件系统调用的延迟（毫秒），0表示不测')
+    scan_parser.set_defaults(func=bench_scan)
+
+    strip_parser = subparsers.add_parser('strip', help='对比 elements_to_remove 逐个替换与多模式匹配的耗时')
+    strip_parser.add_argument('--names', type=int, default=5000)
+    strip_parser.add_argument('--sizes', default='10,100,500', help='elements_to_remove 的元素数量，逗号分隔')
+    strip_parser.add_argument('--rounds', type=int, default=3)
+    strip_parser.add_argument('--seed', type=int, default=0)
+    strip_parser.set_defaults(func=bench_strip)
+
+    memory_parser = subparsers.add_parser('memory', help='对比解析结果使用字典和 ParsedRelease 的内存占用')
+    memory_parser.add_argument('--files', type=int, default=100000)
+    memory_parser.add_argument('--seed', type=int, default=0)
+    memory_parser.add_argument('--config', default='config.json')
+    memory_parser.set_defaults(func=bench_memory)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
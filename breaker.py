@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : breaker.py
+
+import time
+import threading
+from typing import Dict, List, Optional, Tuple
+from colorama import Fore, Style
+
+# 连续失败多少次后熔断，熔断后多少秒再放行一次探测请求
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_COOLDOWN = 30.0
+# 探测失败时冷却时间翻倍，最长不超过 MAX_COOLDOWN
+MAX_COOLDOWN = 600.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后进入 open 状态，冷却期内的请求直接失败；
+    冷却结束后进入 half_open，只放行一个探测请求，成功则恢复 closed，失败则重新 open 并延长冷却时间。
+    """
+
+    def __init__(self, name: str, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 cooldown: float = DEFAULT_COOLDOWN):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = float(cooldown)
+        self.cooldown = float(cooldown)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self._lock = threading.Lock()
+        # 熔断统计
+        self.rejected = 0
+        self.transitions: List[Tuple[float, str, str]] = []
+
+    def _transition(self, state: str) -> None:
+        previous, self.state = self.state, state
+        self.transitions.append((time.time(), previous, state))
+        color = Fore.GREEN if state == CLOSED else Fore.YELLOW if state == HALF_OPEN else Fore.RED
+        message = f"[熔断器] {self.name}: {previous} -> {state}"
+        if state == OPEN:
+            message += f"，{self.cooldown:.0f}秒内的请求直接失败"
+        print(color + message + Style.RESET_ALL)
+
+    def allow(self) -> bool:
+        """
+        是否允许发送请求。open 状态冷却结束后转为 half_open 并只放行一个探测请求。
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == OPEN and time.monotonic() - self.opened_at < self.cooldown
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != CLOSED:
+                self.cooldown = self.base_cooldown
+                self._transition(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN:
+                # 探测失败，重新熔断并延长冷却时间
+                self.probing = False
+                self.cooldown = min(MAX_COOLDOWN, self.cooldown * 2)
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'transitions': len(self.transitions),
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str, failure_threshold: Optional[int] = None, cooldown: Optional[float] = None) -> CircuitBreaker:
+    """
+    返回指定名称（主机/接口）的共享熔断器，首次调用时按给定参数创建。
+    """
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(name,
+                                     failure_threshold if failure_threshold is not None else DEFAULT_FAILURE_THRESHOLD,
+                                     cooldown if cooldown is not None else DEFAULT_COOLDOWN)
+            _breakers[name] = breaker
+        return breaker
+
+
+def all_stats() -> Dict[str, Dict[str, object]]:
+    """
+    返回所有熔断器的统计。
+    """
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.stats() for name, breaker in breakers.items()}
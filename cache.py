@@ -0,0 +1,483 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : cache.py
+
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlencode
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from colorama import Fore, Style
+
+# 各类接口的缓存有效期（秒）：搜索结果和电影信息很少变化，剧集及季信息随更新而变化
+DEFAULT_TTLS = {
+    'search/movie': 7 * 24 * 3600,
+    'search/tv': 7 * 24 * 3600,
+    'movie': 30 * 24 * 3600,
+    'tv': 24 * 3600,
+    'tv/season': 24 * 3600,
+}
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_CACHE_PATH = 'tmdb_cache.sqlite3'
+# 查找不到结果（未匹配）的有效期较短，媒体库或TMDB补充条目后能较快重新查询
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+
+# 文件名解析缓存在内存中保留的条目数；保存到文件时每积累这么多条写入一次
+DEFAULT_PARSE_CACHE_SIZE = 10000
+PARSE_CACHE_FLUSH = 500
+
+# 不参与缓存键的参数，避免密钥写入缓存文件
+IGNORED_PARAMS = ('api_key', 'X-Plex-Token')
+
+
+def normalize_title(title: Optional[str]) -> str:
+    """
+    标准化标题：统一全半角和大小写，去掉空白和标点。
+    """
+    if not title:
+        return ''
+    title = unicodedata.normalize('NFKC', str(title)).lower()
+    return ''.join(char for char in title if char.isalnum())
+
+
+class ResponseCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttls: Optional[Dict[str, int]] = None, negative_ttl: int = DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        # 搜索结果为空的响应使用较短的有效期
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                status INTEGER NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                expires REAL NOT NULL,
+                accessed REAL NOT NULL,
+                etag TEXT,
+                last_modified TEXT
+            )""")
+        # 旧版本创建的缓存文件没有校验字段，补上列
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(responses)")}
+        for column in ('etag', 'last_modified'):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE responses ADD COLUMN {column} TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['ResponseCache']:
+        """
+        根据配置文件创建缓存，未开启缓存时返回None。
+        """
+        if not config.get('tmdb_cache_enabled', True):
+            return None
+        return cls(path=config.get('tmdb_cache_path', DEFAULT_CACHE_PATH),
+                   max_bytes=int(config.get('tmdb_cache_max_mb', DEFAULT_MAX_BYTES // (1024 * 1024))) * 1024 * 1024,
+                   ttls=config.get('tmdb_cache_ttl'),
+                   negative_ttl=int(config.get('negative_cache_ttl', DEFAULT_NEGATIVE_TTL)))
+
+    @staticmethod
+    def endpoint_of(url: str) -> str:
+        """
+        把请求路径归类为接口名，例如 /3/tv/1399/season/2 归类为 tv/season。
+        """
+        parts = [part for part in urlsplit(url).path.split('/') if part]
+        if parts and parts[0].isdigit():
+            parts = parts[1:]  # 去掉 API 版本号
+        if not parts:
+            return ''
+        if parts[0] == 'search':
+            return '/'.join(parts[:2])
+        if parts[0] == 'tv' and 'season' in parts:
+            return 'tv/season'
+        return parts[0]
+
+    @staticmethod
+    def make_key(url: str, params: Optional[Dict[str, str]] = None) -> str:
+        """
+        以接口路径和排序后的参数（包括语言）作为缓存键。
+        """
+        items = sorted((k, str(v)) for k, v in (params or {}).items() if k not in IGNORED_PARAMS)
+        return urlsplit(url).path + '?' + urlencode(items)
+
+    def ttl_for(self, endpoint: str) -> int:
+        return int(self.ttls.get(endpoint, DEFAULT_TTL))
+
+    def get(self, key: str) -> Optional[Tuple[int, bytes]]:
+        """
+        返回未过期的缓存响应 (状态码, 响应体)，并更新最近访问时间；没有命中时返回None。
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT status, body, expires FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or row[2] < now:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return row[0], bytes(row[1])
+
+    def contains(self, key: str) -> bool:
+        """
+        是否有未过期的缓存，不计入命中统计。
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT expires FROM responses WHERE key = ?", (key,)).fetchone()
+        return row is not None and row[0] >= time.time()
+
+    def get_stale(self, key: str) -> Optional[Tuple[int, bytes, Dict[str, str]]]:
+        """
+        返回已过期的缓存响应 (状态码, 响应体, 条件请求头)，没有缓存时返回None。
+        带有 ETag 或 Last-Modified 时条件请求头用于向服务器发送条件请求，请求失败时也可退回使用过期的内容。
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT status, body, etag, last_modified FROM responses WHERE key = ?",
+                                     (key,)).fetchone()
+        if row is None:
+            return None
+        headers = {}
+        if row[2]:
+            headers['If-None-Match'] = row[2]
+        if row[3]:
+            headers['If-Modified-Since'] = row[3]
+        return row[0], bytes(row[1]), headers
+
+    def refresh(self, key: str, endpoint: str, ttl: Optional[int] = None) -> None:
+        """
+        服务器返回 304 时调用：内容未变化，只延长有效期。
+        """
+        now = time.time()
+        if ttl is None:
+            ttl = self.ttl_for(endpoint)
+        with self._lock:
+            self._conn.execute("UPDATE responses SET expires = ?, accessed = ? WHERE key = ?", (now + ttl, now, key))
+            self._conn.commit()
+            self.revalidated += 1
+
+    def set(self, key: str, endpoint: str, status_code: int, content: bytes, ttl: Optional[int] = None,
+            etag: Optional[str] = None, last_modified: Optional[str] = None) -> None:
+        """
+        写入一条响应及其 ETag、Last-Modified，超出容量时按最近最少使用的顺序淘汰。
+        未指定 ttl 时按接口使用配置的有效期。
+        """
+        now = time.time()
+        if ttl is None:
+            ttl = self.ttl_for(endpoint)
+        size = len(key) + len(content)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, endpoint, status, body, size, created, expires, accessed, etag, last_modified) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, status_code, sqlite3.Binary(content), size, now, now + ttl, now, etag, last_modified))
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        # 先删除已过期的条目，仍超出容量时再按访问时间从旧到新删除
+        now = time.time()
+        self.evictions += self._conn.execute("DELETE FROM responses WHERE expires < ?", (now,)).rowcount
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if self._total_bytes <= self.max_bytes:
+            return
+        cursor = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC")
+        to_delete = []
+        for key, size in cursor:
+            if self._total_bytes <= self.max_bytes:
+                break
+            to_delete.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", to_delete)
+        self.evictions += len(to_delete)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'revalidated': self.revalidated,
+            'entries': entries,
+            'bytes': self._total_bytes,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class NegativeCache:
+    """
+    记录查找不到结果的查询（未匹配），按来源和标准化后的标题、年份保存。
+    有效期内再次遇到同样的查询时直接跳过，不再请求网络，也不再提示手动输入。
+    与响应缓存分开计数，运行结束时可列出本次跳过和新增的未匹配查询。
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, ttl: int = DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.skipped: List[Tuple[str, str, str]] = []
+        self.recorded: List[Tuple[str, str, str]] = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS misses (
+                source TEXT NOT NULL,
+                query TEXT NOT NULL,
+                title TEXT NOT NULL,
+                year TEXT NOT NULL,
+                created REAL NOT NULL,
+                expires REAL NOT NULL,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (source, query)
+            )""")
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['NegativeCache']:
+        """
+        根据配置文件创建未匹配缓存，与TMDB响应缓存使用同一个文件；未开启时返回None。
+        """
+        if not config.get('negative_cache_enabled', True):
+            return None
+        return cls(path=config.get('tmdb_cache_path', DEFAULT_CACHE_PATH),
+                   ttl=int(config.get('negative_cache_ttl', DEFAULT_NEGATIVE_TTL)))
+
+    @staticmethod
+    def make_query(title: str, year: Optional[str] = None) -> str:
+        return normalize_title(title) + '|' + (str(year) if year else '')
+
+    def is_known_miss(self, source: str, title: str, year: Optional[str] = None) -> bool:
+        """
+        查询是否为有效期内的已知未匹配，是则计入本次跳过的列表。
+        """
+        query = self.make_query(title, year)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT expires FROM misses WHERE source = ? AND query = ?",
+                                     (source, query)).fetchone()
+            if row is None or row[0] < now:
+                return False
+            self._conn.execute("UPDATE misses SET skipped = skipped + 1 WHERE source = ? AND query = ?", (source, query))
+            self._conn.commit()
+            self.skipped.append((source, str(title), str(year or '')))
+        return True
+
+    def add(self, source: str, title: str, year: Optional[str] = None) -> None:
+        """
+        记录一次未匹配。
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO misses (source, query, title, year, created, expires, skipped) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (source, self.make_query(title, year), str(title), str(year or ''), now, now + self.ttl))
+            self._conn.commit()
+            self.recorded.append((source, str(title), str(year or '')))
+
+    def discard(self, source: str, title: str, year: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM misses WHERE source = ? AND query = ?", (source, self.make_query(title, year)))
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM misses WHERE expires >= ?", (time.time(),)).fetchone()[0]
+            return {'skipped': len(self.skipped), 'recorded': len(self.recorded), 'entries': entries}
+
+    def print_report(self) -> None:
+        """
+        列出本次运行跳过的已知未匹配查询和新记录的未匹配查询。
+        """
+        for caption, rows in (("已知未匹配，本次跳过", self.skipped), ("新增未匹配", self.recorded)):
+            if not rows:
+                continue
+            print(Fore.YELLOW + f"{caption}（{len(rows)}）：" + Style.RESET_ALL)
+            for source, title, year in sorted(set(rows)):
+                print(f"  [{source}] {title}" + (f" ({year})" if year else ""))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM misses")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def config_fingerprint(*parts: Any) -> str:
+    """
+    计算解析规则的指纹，规则变化后以旧规则缓存的解析结果不再命中。
+    """
+    data = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()[:16]
+
+
+class ParseCache:
+    """
+    文件名解析结果的缓存：内存中按LRU保留最近使用的结果，可选保存到SQLite文件供之后的运行使用。
+    缓存键为文件名和解析规则的指纹，配置中的规则变化后旧结果自动失效。
+    """
+
+    def __init__(self, namespace: str, fingerprint: str, max_size: int = DEFAULT_PARSE_CACHE_SIZE,
+                 path: Optional[str] = None):
+        self.namespace = namespace
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: 'OrderedDict[str, Any]' = OrderedDict()
+        self._pending: List[Tuple[str, str, str, str, float]] = []
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS parsed (
+                    namespace TEXT NOT NULL,
+                    name TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    PRIMARY KEY (namespace, name)
+                )""")
+            # 规则已经变化的旧结果不会再命中，直接删除
+            self._conn.execute("DELETE FROM parsed WHERE namespace = ? AND fingerprint != ?", (namespace, fingerprint))
+            self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config: Dict, namespace: str, fingerprint: str) -> Optional['ParseCache']:
+        """
+        根据配置文件创建解析缓存，未开启时返回None；开启保存时与TMDB响应缓存使用同一个文件。
+        """
+        if not config.get('parse_cache_enabled', True):
+            return None
+        path = config.get('tmdb_cache_path', DEFAULT_CACHE_PATH) if config.get('parse_cache_persistent', False) else None
+        return cls(namespace, fingerprint, max_size=int(config.get('parse_cache_size', DEFAULT_PARSE_CACHE_SIZE)), path=path)
+
+    def _remember(self, name: str, value: Any) -> None:
+        self._entries[name] = value
+        self._entries.move_to_end(name)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, name: str) -> Optional[Any]:
+        """
+        返回缓存的解析结果，没有时返回None。
+        """
+        with self._lock:
+            if name in self._entries:
+                self._entries.move_to_end(name)
+                self.hits += 1
+                return self._entries[name]
+            if self._conn is not None:
+                row = self._conn.execute("SELECT value FROM parsed WHERE namespace = ? AND name = ? AND fingerprint = ?",
+                                         (self.namespace, name, self.fingerprint)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._remember(name, value)
+                    self.hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def set(self, name: str, value: Any) -> None:
+        with self._lock:
+            self._remember(name, value)
+            if self._conn is not None:
+                self._pending.append((self.namespace, name, self.fingerprint,
+                                      json.dumps(value, ensure_ascii=False), time.time()))
+                if len(self._pending) >= PARSE_CACHE_FLUSH:
+                    self._flush()
+
+    def _flush(self) -> None:
+        if self._pending:
+            self._conn.executemany("INSERT OR REPLACE INTO parsed (namespace, name, fingerprint, value, created) "
+                                   "VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._conn.commit()
+            self._pending = []
+
+    def flush(self) -> None:
+        """
+        把尚未写入的解析结果保存到文件。
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._flush()
+
+    def prune(self, names: Iterable[str]) -> int:
+        """
+        删除文件中保存的、不在 names 中的解析结果（文件已改名或删除），返回删除的条数。
+        names 应为本次完整扫描遇到的全部名称；内存中的结果由LRU自行淘汰。
+        """
+        keep = set(names)
+        with self._lock:
+            if self._conn is None:
+                return 0
+            self._flush()
+            rows = self._conn.execute("SELECT name FROM parsed WHERE namespace = ?", (self.namespace,)).fetchall()
+            stale = [(self.namespace, name) for (name,) in rows if name not in keep]
+            if stale:
+                self._conn.executemany("DELETE FROM parsed WHERE namespace = ? AND name = ?", stale)
+                self._conn.commit()
+            return len(stale)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(self._entries)}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._pending = []
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM parsed WHERE namespace = ?", (self.namespace,))
+                self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._flush()
+                self._conn.close()
+                self._conn = None
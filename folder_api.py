@@ -3,34 +3,31 @@
 # @File : folder_api.py
 
 import os
-import re
-from typing import Tuple, Union, List, Dict
+from typing import Tuple, Union, List, Dict, Optional
+from cache import ParseCache, config_fingerprint
+from release_parser import PARSER_VERSION, parse_folder_name
+
+# 文件夹名解析逻辑变化时加一，使保存在文件中的旧解析结果失效；解析器本身的版本见 release_parser.PARSER_VERSION
+FOLDER_PARSER_VERSION = 1
 
 class FolderAPI:
-    def __init__(self):
-        pass
+    def __init__(self, cache: Optional[ParseCache] = None):
+        # 文件夹名解析结果的缓存，不同匹配模式会反复解析同一个文件夹名
+        self.cache = cache
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'FolderAPI':
+        return cls(ParseCache.from_config(config, 'folder', config_fingerprint(FOLDER_PARSER_VERSION, PARSER_VERSION)))
 
     # 从文件夹名称中提取信息
     def extract_folder_info(self, folder_name: str) -> Tuple[str, str]:
-        # 从文件夹名称中提取信息
-        folder_name = re.sub(r'剧场版', '', folder_name)
-        folder_name = re.sub(r'4K', '', folder_name)
-        year = re.search(r'\((19[0-9]{2}|20[0-2][0-9]|2030)\)', folder_name)
-        if year:
-            year = year.group().strip('()')
-        else:
-            year = re.search(r'(19[0-9]{2}|20[0-2][0-9]|2030)', folder_name)
-            if year:
-                year = year.group()
-        folder_without_year = re.sub(str(year), '', folder_name) if year else folder_name
-        chinese_titles = re.findall(r'[\u4e00-\u9fff]+[0-9a-zA-Z：，·]*', folder_without_year)
-        english_title = ' '.join(re.findall(r'[a-zA-Z\s]+(?![^\(]*\))', folder_without_year))
-        if not chinese_titles and not english_title:
-            title = ''.join(re.findall(r'(?<!\()\d+(?!\))', folder_without_year))
-        else:
-            title = chinese_titles[0] if chinese_titles else english_title
-        title = title.strip()
-        return title, year
+        if self.cache is None:
+            return parse_folder_name(folder_name)
+        cached = self.cache.get(folder_name)
+        if cached is None:
+            cached = parse_folder_name(folder_name)
+            self.cache.set(folder_name, cached)
+        return tuple(cached)
 
     # 处理文件夹
     def process_folder(self, folder_path: str, new_folder_name: str, match_data: dict) -> None:
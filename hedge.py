@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : hedge.py
+
+import math
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, Optional
+
+# 至少积累这么多次耗时样本后才开始对冲，避免冷启动时按不可靠的分位数发送重复请求
+DEFAULT_MIN_SAMPLES = 20
+DEFAULT_WINDOW = 200
+DEFAULT_MIN_DELAY = 0.05
+DEFAULT_MAX_WORKERS = 16
+
+
+class Hedger:
+    """
+    对冲请求：请求在最近耗时的指定分位数内仍未返回时，再发送一个相同的请求，采用先返回的结果。
+    用于在网络不稳定时把长尾延迟限制在分位数附近，代价是少量重复请求。
+    """
+
+    def __init__(self, percentile: float = 95, min_samples: int = DEFAULT_MIN_SAMPLES,
+                 window: int = DEFAULT_WINDOW, min_delay: float = DEFAULT_MIN_DELAY,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        self.percentile = float(percentile)
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+        # 对冲统计
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _quantile(self, percentile: float) -> Optional[float]:
+        samples = sorted(self._latencies)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, math.ceil(percentile / 100 * len(samples)) - 1))
+        return samples[index]
+
+    def delay(self) -> Optional[float]:
+        """
+        返回发送对冲请求前的等待秒数，样本不足时返回None（不对冲）。
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            return max(self.min_delay, self._quantile(self.percentile))
+
+    def _timed(self, func: Callable[[], Any]) -> Any:
+        start = time.monotonic()
+        result = func()
+        with self._lock:
+            self._latencies.append(time.monotonic() - start)
+        return result
+
+    def run(self, func: Callable[[], Any], duplicate: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        执行 func，超过分位数耗时仍未完成时执行 duplicate（默认与 func 相同），返回先成功的结果。
+        两个请求都失败时抛出最后一个异常。
+        """
+        with self._lock:
+            self.requests += 1
+        delay = self.delay()
+        if delay is None:
+            return self._timed(func)
+
+        primary = self._executor.submit(self._timed, func)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self._lock:
+            self.hedged += 1
+        backup = self._executor.submit(self._timed, duplicate or func)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            p50 = self._quantile(50)
+            p99 = self._quantile(99)
+            return {
+                'requests': self.requests,
+                'hedged': self.hedged,
+                'hedge_wins': self.hedge_wins,
+                'p50': round(p50, 3) if p50 is not None else None,
+                'p99': round(p99, 3) if p99 is not None else None,
+            }
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
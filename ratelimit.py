@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : ratelimit.py
+
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+# TMDB 允许的请求速率约为每秒 50 次，默认留出余量
+DEFAULT_RATE = 40.0
+DEFAULT_CAPACITY = 20.0
+# 收到 429 后速率乘以该系数，之后每次成功请求按 RECOVERY_STEP 逐步恢复
+DECREASE_FACTOR = 0.7
+RECOVERY_STEP = 0.1
+MIN_RATE = 1.0
+MAX_BACKOFF = 60.0
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 头，支持秒数和 HTTP 日期两种格式，无法解析时返回None。
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+
+class TokenBucket:
+    """
+    令牌桶限速器，同一主机的所有线程和协程共享一个实例。
+    收到 429 时降低速率并暂停发送，成功请求后逐步恢复到配置的速率。
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, capacity: float = DEFAULT_CAPACITY):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.last_refill = time.monotonic()
+        self.blocked_until = 0.0
+        self.consecutive_limited = 0
+        self._lock = threading.Lock()
+        # 限速统计
+        self.requests = 0
+        self.throttled = 0
+        self.throttle_seconds = 0.0
+        self.rate_limited = 0
+        self.min_rate_seen = float(rate)
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self) -> float:
+        """
+        取得一个令牌，必要时阻塞等待，返回等待的秒数。
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self.blocked_until > now:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.requests += 1
+                    if waited:
+                        self.throttled += 1
+                        self.throttle_seconds += waited
+                    return waited
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self, headers: Optional[Dict[str, str]] = None) -> None:
+        """
+        请求成功后逐步恢复速率，并根据限速响应头调整剩余额度。
+        """
+        with self._lock:
+            self.consecutive_limited = 0
+            self.rate = min(self.max_rate, self.rate + RECOVERY_STEP)
+            if headers:
+                self._apply_headers(headers)
+
+    def _apply_headers(self, headers: Dict[str, str]) -> None:
+        # 兼容 X-RateLimit-* 与 RateLimit-* 两种写法，Reset 可能是时间戳也可能是剩余秒数
+        remaining = headers.get('X-RateLimit-Remaining', headers.get('RateLimit-Remaining'))
+        reset = headers.get('X-RateLimit-Reset', headers.get('RateLimit-Reset'))
+        try:
+            remaining = int(remaining) if remaining is not None else None
+            reset = float(reset) if reset is not None else None
+        except ValueError:
+            return
+        if remaining is None:
+            return
+        self.tokens = min(self.tokens, float(remaining))
+        if remaining == 0 and reset is not None:
+            delay = reset - time.time() if reset > 1e9 else reset
+            if delay > 0:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + min(delay, MAX_BACKOFF))
+
+    def penalize(self, retry_after: Optional[float] = None) -> float:
+        """
+        收到 429 时调用：降低速率并暂停发送，返回暂停的秒数。
+        服务器给出 Retry-After 时按其等待，否则按连续限速次数指数退避，并加入随机抖动。
+        """
+        with self._lock:
+            self.rate_limited += 1
+            self.consecutive_limited += 1
+            self.rate = max(MIN_RATE, self.rate * DECREASE_FACTOR)
+            self.min_rate_seen = min(self.min_rate_seen, self.rate)
+            if retry_after is None:
+                retry_after = min(MAX_BACKOFF, 2 ** (self.consecutive_limited - 1))
+            delay = retry_after + random.uniform(0, 0.1 + retry_after * 0.1)
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+            self.tokens = 0.0
+            return delay
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'throttle_seconds': round(self.throttle_seconds, 3),
+                'rate_limited': self.rate_limited,
+                'rate': round(self.rate, 2),
+                'max_rate': self.max_rate,
+                'min_rate_seen': round(self.min_rate_seen, 2),
+            }
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(host: str, rate: Optional[float] = None, capacity: Optional[float] = None) -> TokenBucket:
+    """
+    返回指定主机的共享令牌桶，首次调用时按给定速率创建。
+    """
+    with _buckets_lock:
+        bucket = _buckets.get(host)
+        if bucket is None:
+            bucket = TokenBucket(rate if rate is not None else DEFAULT_RATE,
+                                 capacity if capacity is not None else DEFAULT_CAPACITY)
+            _buckets[host] = bucket
+        return bucket
+
+
+def all_stats() -> Dict[str, Dict[str, float]]:
+    """
+    返回所有主机的限速统计。
+    """
+    with _buckets_lock:
+        buckets = dict(_buckets)
+    return {host: bucket.stats() for host, bucket in buckets.items()}
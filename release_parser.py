@@ -0,0 +1,608 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : release_parser.py
+
+import os
+import re
+import sys
+import math
+import time
+import pickle
+import multiprocessing
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from aho_corasick import AhoCorasick
+from cache import ParseCache, config_fingerprint
+from colorama import Fore, Style
+
+# 片源写法统一，等价于原先依次执行的 REMUX / BD / HQCAM 三次替换
+SOURCE_ALIASES = {
+    'REMUX': 'REMUX', 'BDREMUX': 'REMUX', 'BD-REMUX': 'REMUX',
+    'BLURAY': 'BD', 'BD': 'BD', 'BLU-RAY': 'BD', 'BD1080P': 'BD',
+    'HQCAM': 'HQCAM', 'HQ-CAM': 'HQCAM',
+}
+SOURCE_ALIAS_RE = re.compile(r'\b(REMUX|BDREMUX|BD-REMUX|BLURAY|BD|BLU-RAY|BD1080P|HQCAM|HQ-CAM)\b', re.IGNORECASE)
+BRACKET_RES = (re.compile(r'【.*?】'), re.compile(r'\{.*?\}'), re.compile(r'\[.*?\]'))
+
+SERIES_ARABIC_RE = re.compile(r'\b[2-5]\b')
+SERIES_ROMAN_RE = re.compile(r'\b(?:M{0,3})(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3})\b')
+BOOK_TITLE_RE = re.compile(r'《.*?》')
+TITLE_CHARS_RE = re.compile(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]+')
+FOLDER_TITLE_RE = re.compile(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]*')
+CHINESE_RE = re.compile(r'[\u4e00-\u9fff]')
+ENGLISH_TITLE_RE = re.compile(r'[a-zA-Z0-9]+(\s[a-zA-Z0-9]+)*')
+TMDB_ID_RE = re.compile(r'\{tmdb-(\d+)\}')
+YEAR_RE = re.compile(r'\b\d{4}\b')
+
+# 文件夹名（如 rename_folder 处理的电影、剧集文件夹）使用的正则
+FOLDER_JUNK = ('剧场版', '4K')
+FOLDER_YEAR_PAREN_RE = re.compile(r'\((19[0-9]{2}|20[0-2][0-9]|2030)\)')
+FOLDER_YEAR_RE = re.compile(r'(19[0-9]{2}|20[0-2][0-9]|2030)')
+FOLDER_CHINESE_TITLES_RE = re.compile(r'[\u4e00-\u9fff]+[0-9a-zA-Z：，·]*')
+FOLDER_ENGLISH_TITLE_RE = re.compile(r'[a-zA-Z\s]+(?![^\(]*\))')
+FOLDER_NUMBER_TITLE_RE = re.compile(r'(?<!\()\d+(?!\))')
+
+# 文件名已转为大写，模式中的字母也转为大写后可以不用 IGNORECASE 匹配，速度约快一倍。
+# 文件名中含有非ASCII的大小写字母（如 K 开尔文符号、İ）时两者结果可能不同，仍使用 IGNORECASE 的模式
+ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+
+DEFAULT_SIBLING_LIMIT = 15
+# 以下数值由 `benchmark.py parse-many` 测得：解析一个文件名约 50 微秒，主进程接收一个结果约 3 微秒，
+# fork 方式启动进程池约 8 毫秒、每个进程再加约 4 毫秒，spawn 方式（Windows、macOS）分别约 150 和 120 毫秒。
+# 按这些数值，2 个以上的核在 fork 方式下约 700 个文件名起才比逐个解析快，spawn 方式要上万个。
+# 待解析的文件名少于该数量时直接在当前进程解析，不估算进程池是否划算
+PARALLEL_MIN_FILES = 1000
+# 每个进程一次处理的文件名数量下限（约 12 毫秒的解析量，分派一块的开销不到其 1%），也是估算解析耗时的样本数
+MIN_CHUNK_SIZE = 250
+# 主进程接收一个解析结果的开销（秒）
+POOL_TRANSFER_SECONDS = 4e-6
+# 进程池的启动开销（秒）：(固定部分, 每个进程)，按进程的启动方式区分
+POOL_STARTUP_SECONDS = {'fork': (0.008, 0.004), 'spawn': (0.15, 0.12), 'forkserver': (0.15, 0.12)}
+# 解析逻辑变化时加一，使保存在文件中的旧解析结果失效；修改时同时更新 golden_corpus.json
+PARSER_VERSION = 1
+# 不含这些字符的 elements_to_remove 元素按普通文本处理
+REGEX_METACHARS = frozenset('.^$*+?{}[]\\|()')
+
+
+def fold_pattern(regex: str) -> Optional[str]:
+    """
+    把正则中的ASCII字母转为大写（转义序列保持不变），用于匹配已转为大写的文件名。
+    含有非ASCII字母、\\N{...} 或无法编译（如内联标志 (?i)）时返回None。
+    """
+    chars = []
+    escaped = False
+    for char in regex:
+        if escaped:
+            if char == 'N':
+                return None
+            chars.append(char)
+            escaped = False
+        elif char == '\\':
+            chars.append(char)
+            escaped = True
+        elif not char.isascii() and char.lower() != char.upper():
+            return None
+        else:
+            chars.append(char.upper() if char.isascii() else char)
+    folded = ''.join(chars)
+    try:
+        re.compile(folded)
+    except re.error:
+        return None
+    return folded
+
+
+def split_removals(elements: Iterable[str]) -> Tuple[List[str], List[str]]:
+    """
+    把 elements_to_remove 分为普通文本和正则两类，忽略空元素和重复元素。
+    """
+    literals, patterns = [], []
+    for element in elements:
+        if not element:
+            continue
+        target = patterns if REGEX_METACHARS.intersection(element) else literals
+        if element not in target:
+            target.append(element)
+    return literals, patterns
+
+
+# ParsedRelease 的字段，顺序与 get_file_info 原先返回的字典相同
+RELEASE_FIELDS = ('year', 'resolution', 'source', 'codec', 'bit_depth', 'hdr_info', 'audio_format', 'edit_version',
+                  'series_number', 'chinese_title', 'english_title', 'tmdb_id')
+_RELEASE_FIELD_SET = frozenset(RELEASE_FIELDS)
+# 取值范围有限的字段使用驻留字符串，所有文件共用同一个字符串对象
+INTERNED_FIELDS = frozenset(('year', 'resolution', 'source', 'codec', 'bit_depth', 'hdr_info', 'audio_format',
+                             'edit_version', 'series_number'))
+
+
+class ParsedRelease(Mapping):
+    """
+    从文件名解析出的信息。用 __slots__ 保存字段，比每个文件一个字典占用的内存少得多；
+    分辨率、片源、编码、HDR等取值有限的字段使用驻留字符串。
+    可以像字典一样读取（release['year']、release.get('tmdb_id')、items()），没有解析出的
+    series_number、tmdb_id 与原先的字典一样不存在；elements_regex 中自定义的字段保存在 extra 中。
+    """
+
+    __slots__ = RELEASE_FIELDS + ('extra',)
+
+    def __init__(self, elements: Dict[str, Optional[str]]):
+        extra = None
+        for key, value in elements.items():
+            if key in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            if key in _RELEASE_FIELD_SET:
+                setattr(self, key, value)
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        self.extra = extra
+
+    def __getitem__(self, key: str) -> Optional[str]:
+        if key in _RELEASE_FIELD_SET:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in RELEASE_FIELDS:
+            if hasattr(self, key):
+                yield key
+        if self.extra is not None:
+            yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def copy(self) -> Dict[str, Optional[str]]:
+        """
+        返回可修改的字典副本。
+        """
+        return dict(self.items())
+
+    def __repr__(self) -> str:
+        return f"ParsedRelease({self.copy()!r})"
+
+
+def _compile_pair(regex: str) -> Tuple[re.Pattern, re.Pattern]:
+    """
+    返回 (按大写编译的模式, 原始的 IGNORECASE 模式)。
+    """
+    pattern = re.compile(regex, re.IGNORECASE)
+    folded = fold_pattern(regex)
+    return (re.compile(folded) if folded is not None else pattern), pattern
+
+
+@lru_cache(maxsize=16)
+def _compile_rules(elements_regex: Tuple[Tuple[str, str], ...], elements_to_remove: Tuple[str, ...]) -> tuple:
+    """
+    编译一套解析规则。同一进程中规则相同的解析器共用编译结果，各个脚本各自创建解析器也只编译一次。
+    """
+    # 普通文本用 Aho-Corasick 一次扫描全部删除，列表再长耗时也基本不变；正则元素合并为一个模式，在普通文本之后应用
+    literals, patterns = split_removals(elements_to_remove)
+    literal_removals = AhoCorasick(literals)
+    regex_removals = re.compile('|'.join(f'(?:{pattern})' for pattern in patterns)) if patterns else None
+    fields = tuple((key, key == 'year') + _compile_pair(regex) for key, regex in elements_regex)
+    return literal_removals, regex_removals, fields, _compile_pair(SOURCE_ALIAS_RE.pattern)
+
+
+class ReleaseParser:
+    """
+    发布名解析器：配置中的正则在创建时编译一次。
+    elements_to_remove 中的普通文本先用 Aho-Corasick 一次扫描全部删除（从左到右、取最长、不重叠），之后再删除正则元素。
+    这与原先 get_file_info 按列表顺序逐个 re.sub 不同：删除后新拼出来的元素不会再被删除，元素在列表中的顺序也不影响结果，
+    例如 "简英国语中字双字" 原先连续删除为空、改用父文件夹名，现在得到 "简英双字"；这些情况记录在 golden_corpus.json 带 note 的条目中。
+    其余步骤与原先的流程一致。文件名转为大写后，字段正则使用大写的模式区分大小写地匹配，避免 IGNORECASE 的逐字符大小写折叠。
+    """
+
+    def __init__(self, elements_regex: Dict[str, str], elements_to_remove: Union[str, Iterable[str]],
+                 parse_tmdb_id: bool = True):
+        if isinstance(elements_to_remove, str):
+            elements_to_remove = elements_to_remove.split(',')
+        self.elements_regex = dict(elements_regex)
+        self.elements_to_remove = list(elements_to_remove)
+        self.parse_tmdb_id = parse_tmdb_id
+
+        self.literal_removals, self.regex_removals, self.fields, self.source_aliases = _compile_rules(
+            tuple(self.elements_regex.items()), tuple(self.elements_to_remove))
+        # 文件名解析结果的缓存，见 from_config
+        self.cache: Optional[ParseCache] = None
+        # parse_many 使用的进程数，0 表示按可用的CPU核数
+        self.workers = 0
+
+    @classmethod
+    def from_config(cls, config: Dict, **kwargs) -> 'ReleaseParser':
+        parser = cls(config['elements_regex'], config['elements_to_remove'], **kwargs)
+        parser.cache = ParseCache.from_config(config, 'release', parser.fingerprint)
+        parser.workers = int(config.get('parse_workers', 0))
+        return parser
+
+    def clean(self, file_name_no_ext: str) -> Tuple[str, bool]:
+        """
+        去掉无用元素、统一片源写法并删除各类括号内容，返回 (文件名, 是否可以使用大写模式)。
+        """
+        file_name_no_ext = file_name_no_ext.replace('.', ' ').upper()
+        file_name_no_ext = self.literal_removals.remove(file_name_no_ext)
+        if self.regex_removals is not None:
+            file_name_no_ext = self.regex_removals.sub('', file_name_no_ext)
+        # 转为大写后仍有小写形式的非ASCII字母时，只能使用 IGNORECASE 的模式
+        folded = file_name_no_ext.lower() == file_name_no_ext.translate(ASCII_LOWER)
+        aliases = self.source_aliases[0 if folded else 1]
+        file_name_no_ext = aliases.sub(lambda match: SOURCE_ALIASES[match.group(0).upper()], file_name_no_ext)
+        for bracket, opening in zip(BRACKET_RES, '【{['):
+            if opening in file_name_no_ext:
+                file_name_no_ext = bracket.sub('', file_name_no_ext)
+        return file_name_no_ext, folded
+
+    def extract(self, name: str, folded: bool = False) -> Tuple[Dict[str, Optional[str]], str]:
+        """
+        按配置顺序依次提取 elements_regex 的各个字段，返回 (字段, 剩余文件名)。
+        year 只取第一个匹配，其余字段取全部匹配，匹配到的内容从文件名中删除。
+        """
+        elements = {}
+        for key, is_year, folded_pattern, pattern in self.fields:
+            pattern = folded_pattern if folded else pattern
+            elements[key] = None
+            if is_year:
+                match = pattern.search(name)
+                if match:
+                    elements[key] = match.group(0)
+                    name = name.replace(match.group(0), '')
+            else:
+                matches = pattern.findall(name)
+                if matches:
+                    elements[key] = ' '.join(matches)
+                    for match in matches:
+                        name = name.replace(match, '')
+        return elements, name
+
+    def parse_name(self, file_name: str) -> Dict[str, Optional[str]]:
+        """
+        解析只由文件名本身决定的字段；中文标题需要用父文件夹名补充时为None。
+        """
+        file_name_no_ext, _ = os.path.splitext(file_name)
+        elements, file_name_no_ext = self.extract(*self.clean(file_name_no_ext))
+        file_name_no_ext = file_name_no_ext.split('-')[0]
+
+        series_number_arabic = SERIES_ARABIC_RE.search(file_name_no_ext)
+        series_number_roman = SERIES_ROMAN_RE.search(file_name_no_ext)
+        if series_number_arabic:
+            elements['series_number'] = series_number_arabic.group(0)
+            file_name_no_ext = file_name_no_ext.replace(series_number_arabic.group(0), '')
+        elif series_number_roman:
+            elements['series_number'] = series_number_roman.group(0)
+            file_name_no_ext = file_name_no_ext.replace(series_number_roman.group(0), '')
+
+        chinese_title = BOOK_TITLE_RE.search(file_name_no_ext) if '《' in file_name_no_ext else None
+        if chinese_title:
+            elements['chinese_title'] = chinese_title.group(0)[1:-1]
+            file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
+        else:
+            chinese_title = TITLE_CHARS_RE.search(file_name_no_ext)
+            if chinese_title and CHINESE_RE.search(chinese_title.group(0)):
+                elements['chinese_title'] = chinese_title.group(0)
+                file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
+            else:
+                elements['chinese_title'] = None
+
+        english_title = ENGLISH_TITLE_RE.search(file_name_no_ext)
+        elements['english_title'] = english_title.group(0) if english_title else None
+        return elements
+
+    def parse(self, file_path: str) -> Dict[str, Optional[str]]:
+        """
+        从文件名提取信息，返回与原先 get_file_info 相同的字典。
+        文件名部分的解析结果按文件名缓存，父文件夹相关的字段每次重新计算。
+        """
+        file_name = os.path.basename(file_path)
+        elements = self.cache.get(file_name) if self.cache is not None else None
+        if elements is None:
+            elements = self.parse_name(file_name)
+            if self.cache is not None:
+                self.cache.set(file_name, elements)
+        return self._with_folder(file_path, elements)
+
+    def _with_folder(self, file_path: str, elements: Dict[str, Optional[str]]) -> Dict[str, Optional[str]]:
+        """
+        复制文件名的解析结果，并补充由父文件夹决定的字段。
+        """
+        elements = dict(elements)
+        elements.update(self._folder_fields(file_path, elements))
+        return elements
+
+    def _folder_fields(self, file_path: str, elements: Mapping) -> Dict[str, Optional[str]]:
+        """
+        返回由父文件夹决定、与文件名解析结果不同的字段，没有时为空字典。
+        """
+        fields = {}
+        parent_folder_name = os.path.basename(os.path.dirname(file_path))
+        # 原先按父文件夹的条目数决定是否使用文件夹名，但条目数多时随后仍会使用，结果相同，不必再列出父文件夹
+        if elements['chinese_title'] is None:
+            fields['chinese_title'] = FOLDER_TITLE_RE.search(parent_folder_name).group(0)
+        if self.parse_tmdb_id:
+            tmdb_id_match = TMDB_ID_RE.search(parent_folder_name)
+            if tmdb_id_match and elements.get('tmdb_id') != tmdb_id_match.group(1):
+                fields['tmdb_id'] = tmdb_id_match.group(1)
+        return fields
+
+    def parse_release(self, file_path: str) -> ParsedRelease:
+        """
+        与 parse 相同，返回占用内存更少的 ParsedRelease。
+        """
+        return ParsedRelease(self.parse(file_path))
+
+    def parse_many(self, file_paths: Iterable[str], max_workers: Optional[int] = None) -> List[Union[ParsedRelease, Exception]]:
+        """
+        批量解析，返回与 file_paths 顺序相同的列表，解析出错的文件对应位置为异常对象。
+        相同的文件名只解析一次；未缓存的文件名较多、且按实测耗时估算进程池更快时分块交给进程池并行解析，
+        否则在当前进程逐个解析。进程数不超过可用的CPU核数。
+        """
+        file_paths = list(file_paths)
+        workers = min(max_workers or self.workers or available_cpus(), available_cpus())
+        names: Dict[str, Union[Dict[str, Optional[str]], Exception]] = {}
+        pending = []
+        for file_path in file_paths:
+            file_name = os.path.basename(file_path)
+            if file_name in names:
+                continue
+            cached = self.cache.get(file_name) if self.cache is not None else None
+            names[file_name] = cached
+            if cached is None:
+                pending.append(file_name)
+
+        if workers > 1 and len(pending) >= PARALLEL_MIN_FILES:
+            # 先在当前进程解析一块，按实际耗时估算剩下的交给进程池是否划算
+            start = time.perf_counter()
+            parsed = self._parse_names(pending[:MIN_CHUNK_SIZE])
+            rest = pending[MIN_CHUNK_SIZE:]
+            if pool_saves_time(len(rest), (time.perf_counter() - start) / MIN_CHUNK_SIZE, workers):
+                parsed += self._parse_names_parallel(rest, workers)
+            else:
+                parsed += self._parse_names(rest)
+        else:
+            parsed = self._parse_names(pending)
+        for file_name, elements in zip(pending, parsed):
+            names[file_name] = elements
+            if self.cache is not None and not isinstance(elements, Exception):
+                self.cache.set(file_name, elements)
+
+        # 父文件夹不改变任何字段时，同名文件共用一个 ParsedRelease
+        releases: Dict[str, ParsedRelease] = {}
+        results = []
+        for file_path in file_paths:
+            file_name = os.path.basename(file_path)
+            elements = names[file_name]
+            if not isinstance(elements, Exception):
+                try:
+                    fields = self._folder_fields(file_path, elements)
+                    if fields:
+                        elements = ParsedRelease(dict(elements, **fields))
+                    else:
+                        if file_name not in releases:
+                            releases[file_name] = ParsedRelease(elements)
+                        elements = releases[file_name]
+                except Exception as e:
+                    elements = e
+            results.append(elements)
+        return results
+
+    def _parse_names(self, file_names: List[str]) -> List[Union[Dict[str, Optional[str]], Exception]]:
+        results = []
+        for file_name in file_names:
+            try:
+                results.append(self.parse_name(file_name))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _parse_names_parallel(self, file_names: List[str], workers: int) -> List[Union[Dict[str, Optional[str]], Exception]]:
+        # 每个进程分到约4块，进度较慢的进程不会拖住整体
+        chunk_size = max(MIN_CHUNK_SIZE, math.ceil(len(file_names) / (workers * 4)))
+        chunks = [file_names[i:i + chunk_size] for i in range(0, len(file_names), chunk_size)]
+        try:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), initializer=_init_worker,
+                                     initargs=(self.elements_regex, self.elements_to_remove)) as pool:
+                results = []
+                for parsed in pool.map(_parse_names_in_worker, chunks):
+                    results.extend(parsed)
+                return results
+        except (OSError, BrokenProcessPool) as e:
+            print(Fore.YELLOW + f"无法使用多进程解析（{e}），改为单进程解析。" + Style.RESET_ALL)
+            return self._parse_names(file_names)
+
+    @property
+    def fingerprint(self) -> str:
+        return config_fingerprint(PARSER_VERSION, self.elements_regex, self.elements_to_remove)
+
+    def prune_cache(self, file_names: Iterable[str]) -> None:
+        """
+        扫描完整个媒体库后调用，删除保存在文件中、已不属于任何媒体文件的解析结果。
+        """
+        if self.cache is not None:
+            removed = self.cache.prune(file_names)
+            if removed:
+                print(Fore.GREEN + f"删除 {removed} 条已不存在的文件的解析结果" + Style.RESET_ALL)
+
+    def close(self) -> None:
+        if self.cache is not None:
+            self.cache.close()
+
+
+def parse_title_year(file_name: str) -> Dict[str, Optional[str]]:
+    """
+    只提取中文标题和年份（set_folder 按此给媒体文件建文件夹），不做 elements_regex 的字段提取。
+    """
+    file_name_no_ext, _ = os.path.splitext(file_name)
+    file_name_no_ext = file_name_no_ext.replace('.', ' ').upper()
+
+    elements = {'chinese_title': None, 'year': None}
+    chinese_title = BOOK_TITLE_RE.search(file_name_no_ext) if '《' in file_name_no_ext else None
+    if chinese_title:
+        elements['chinese_title'] = chinese_title.group(0)[1:-1]
+        file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
+    else:
+        chinese_title = TITLE_CHARS_RE.search(file_name_no_ext)
+        if chinese_title and CHINESE_RE.search(chinese_title.group(0)):
+            elements['chinese_title'] = chinese_title.group(0)
+            file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
+
+    year = YEAR_RE.search(file_name_no_ext)
+    if year:
+        elements['year'] = year.group(0)
+    return elements
+
+
+def parse_folder_name(folder_name: str) -> Tuple[str, Optional[str]]:
+    """
+    从文件夹名提取 (标题, 年份)。有中文时取第一段中文，否则取括号外的英文，都没有时取括号外的数字。
+    """
+    for junk in FOLDER_JUNK:
+        folder_name = folder_name.replace(junk, '')
+    year = FOLDER_YEAR_PAREN_RE.search(folder_name)
+    if year:
+        year = year.group().strip('()')
+    else:
+        year = FOLDER_YEAR_RE.search(folder_name)
+        if year:
+            year = year.group()
+    # 年份只含数字，按普通文本删除即可
+    folder_without_year = folder_name.replace(year, '') if year else folder_name
+    chinese_titles = FOLDER_CHINESE_TITLES_RE.findall(folder_without_year)
+    english_title = ' '.join(FOLDER_ENGLISH_TITLE_RE.findall(folder_without_year))
+    if not chinese_titles and not english_title:
+        title = ''.join(FOLDER_NUMBER_TITLE_RE.findall(folder_without_year))
+    else:
+        title = chinese_titles[0] if chinese_titles else english_title
+    return title.strip(), year
+
+
+# 进程池中每个子进程各自的解析器，由 _init_worker 创建
+_worker_parser: Optional[ReleaseParser] = None
+
+
+def available_cpus() -> int:
+    """
+    当前进程可以使用的CPU核数（容器或 taskset 限制后的数量），不能获取时为 os.cpu_count()。
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def pool_saves_time(count: int, seconds_per_name: float, workers: int) -> bool:
+    """
+    估算用 workers 个进程并行解析 count 个文件名节省的时间是否超过进程池的启动和传输开销。
+    """
+    base, per_worker = POOL_STARTUP_SECONDS.get(multiprocessing.get_start_method(), POOL_STARTUP_SECONDS['spawn'])
+    saved = count * seconds_per_name * (1 - 1 / workers)
+    return saved > base + workers * per_worker + count * POOL_TRANSFER_SECONDS
+
+
+def _init_worker(elements_regex: Dict[str, str], elements_to_remove: List[str]) -> None:
+    global _worker_parser
+    _worker_parser = ReleaseParser(elements_regex, elements_to_remove)
+
+
+def _parse_names_in_worker(file_names: List[str]) -> List[Union[Dict[str, Optional[str]], Exception]]:
+    """
+    在子进程中解析一块文件名，出错的文件返回异常对象；无法在进程间传递的异常换成带原类型名的 RuntimeError。
+    """
+    results = []
+    for file_name in file_names:
+        try:
+            results.append(_worker_parser.parse_name(file_name))
+        except Exception as e:
+            try:
+                pickle.loads(pickle.dumps(e))
+            except Exception:
+                e = RuntimeError(f"{type(e).__name__}: {e}")
+            results.append(e)
+    return results
+
+
+def parse_release_legacy(file_path: str, elements_regex: Dict[str, str], elements_to_remove: str,
+                         sibling_limit: int = DEFAULT_SIBLING_LIMIT, parse_tmdb_id: bool = True) -> Dict[str, Optional[str]]:
+    """
+    原先电影脚本中 get_file_info 的实现，保留作为基准测试和结果校验的参照。
+    """
+    parent_folder_name = os.path.basename(os.path.dirname(file_path))
+    file_name_no_ext, file_ext = os.path.splitext(os.path.basename(file_path))
+    file_name_no_ext = file_name_no_ext.replace('.', ' ')
+    file_name_no_ext = file_name_no_ext.upper()
+    for element in elements_to_remove.split(','):
+        file_name_no_ext = re.sub(element, '', file_name_no_ext)
+    file_name_no_ext = re.sub(r'\b(REMUX|BDREMUX|BD-REMUX)\b', 'REMUX', file_name_no_ext, flags=re.IGNORECASE)
+    file_name_no_ext = re.sub(r'\b(BLURAY|BD|BLU-RAY|BD1080P)\b', 'BD', file_name_no_ext, flags=re.IGNORECASE)
+    file_name_no_ext = re.sub(r'\b(HQCAM|HQ-CAM)\b', 'HQCAM', file_name_no_ext, flags=re.IGNORECASE)
+    file_name_no_ext = re.sub(r'【.*?】', '', file_name_no_ext)
+    file_name_no_ext = re.sub(r'\{.*?\}', '', file_name_no_ext)
+    file_name_no_ext = re.sub(r'\[.*?\]', '', file_name_no_ext)
+
+    elements = {key: None for key in elements_regex.keys()}
+    for key, regex in elements_regex.items():
+        if key == 'year':
+            match = re.search(regex, file_name_no_ext, re.IGNORECASE)
+            if match:
+                elements[key] = match.group(0)
+                file_name_no_ext = file_name_no_ext.replace(match.group(0), '')
+        else:
+            matches = re.findall(regex, file_name_no_ext, re.IGNORECASE)
+            if matches:
+                elements[key] = ' '.join(matches)
+                for match in matches:
+                    file_name_no_ext = file_name_no_ext.replace(match, '')
+    file_name_no_ext = file_name_no_ext.split('-')[0]
+    series_number_arabic = re.search(r'\b[2-5]\b', file_name_no_ext)
+    series_number_roman = re.search(r'\b(?:M{0,3})(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3})\b', file_name_no_ext)
+    if series_number_arabic:
+        elements['series_number'] = series_number_arabic.group(0)
+        file_name_no_ext = file_name_no_ext.replace(series_number_arabic.group(0), '')
+    elif series_number_roman:
+        elements['series_number'] = series_number_roman.group(0)
+        file_name_no_ext = file_name_no_ext.replace(series_number_roman.group(0), '')
+
+    chinese_title = re.search(r'《.*?》', file_name_no_ext)
+    if chinese_title:
+        elements['chinese_title'] = chinese_title.group(0)[1:-1]
+        file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
+    else:
+        chinese_title = re.search(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]+', file_name_no_ext)
+        if chinese_title:
+            if re.search(r'[\u4e00-\u9fff]', chinese_title.group(0)):
+                elements['chinese_title'] = chinese_title.group(0)
+                file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
+            else:
+                elements['chinese_title'] = None
+        else:
+            elements['chinese_title'] = None
+    if elements['chinese_title'] is None and file_path and len(os.listdir(os.path.dirname(file_path))) < sibling_limit:
+        parent_folder_name = os.path.basename(os.path.dirname(file_path))
+        chinese_title = re.search(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]*', parent_folder_name)
+        if chinese_title:
+            elements['chinese_title'] = chinese_title.group(0)
+    english_title = re.search(r'[a-zA-Z0-9]+(\s[a-zA-Z0-9]+)*', file_name_no_ext)
+
+    if english_title:
+        elements['english_title'] = english_title.group(0)
+        file_name_no_ext = file_name_no_ext.replace(english_title.group(0), '')
+    else:
+        elements['english_title'] = None
+
+    if elements['chinese_title'] is None:
+        parent_folder_name = os.path.basename(os.path.dirname(file_path))
+        chinese_title = re.search(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]*', parent_folder_name)
+        if chinese_title:
+            elements['chinese_title'] = chinese_title.group(0)
+    if parse_tmdb_id:
+        tmdb_id_match = re.search(r'\{tmdb-(\d+)\}', parent_folder_name)
+        if tmdb_id_match:
+            elements['tmdb_id'] = tmdb_id_match.group(1)
+    return elements
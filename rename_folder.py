@@ -1,12 +1,18 @@
 # 导入所需的类型和模块
 import os
+import sys
 import json
 import shutil
 import csv
-from typing import Tuple, Union, List, Dict
+from typing import Tuple, Union, List, Dict, Optional
 from colorama import Fore, Style
-from api import PlexApi, TMDBApi
+from api import PlexApi, PlexLibraryIndex, TMDBApi, session_from_config
+from cache import NegativeCache
 from folder_api import FolderAPI
+from watcher import run_daemon
+
+# process_single_folder 的 prefetched 默认值，表示没有经过批量查询（批量查询未匹配时为None）
+_NOT_PREFETCHED = object()
 
 
 class MediaRenamer:
@@ -16,12 +22,17 @@ class MediaRenamer:
             self.config = json.load(f)
         # 从配置中获取服务器信息和密钥
         server_info_and_key = self.config
-        self.folder_api = FolderAPI()
+        self.folder_api = FolderAPI.from_config(self.config)
         # 创建TMDBApi和PlexApi实例
-        self.tmdb_api = TMDBApi(server_info_and_key['TMDB_API_KEY'])
-        self.plex_api = PlexApi(server_info_and_key['PLEX_URL'], server_info_and_key['PLEX_TOKEN'], execute_request=False)
-        self.folder_api = FolderAPI()
+        self.session = session_from_config(self.config)
+        self.negative_cache = NegativeCache.from_config(self.config)
+        self.tmdb_api = TMDBApi.from_config(self.config, session=self.session, negative_cache=self.negative_cache)
+        self.plex_api = PlexApi.from_config(self.config, server_info_and_key['PLEX_URL'], server_info_and_key['PLEX_TOKEN'], execute_request=False, session=self.session, negative_cache=self.negative_cache)
+        # Plex匹配模式在本地索引中查找，首次查找时一次性拉取整个媒体库
+        self.plex_index = PlexLibraryIndex(self.plex_api)
         self.processed_folders = []
+        # 守护模式下未匹配时不再请求手动输入
+        self.interactive = True
         self.append_data = self.config['append_data']
         if self.append_data:
             self.matched_contents = []
@@ -148,7 +159,7 @@ class MediaRenamer:
             return False
 
 
-    def process_single_folder(self, folder_path, mode=1):
+    def process_single_folder(self, folder_path, mode=1, prefetched=_NOT_PREFETCHED):
         print(Fore.RED + "正在处理文件夹：" + Style.RESET_ALL + f"{folder_path}")
         if folder_path in self.processed_folders:
             return
@@ -157,13 +168,17 @@ class MediaRenamer:
         title, year = self.folder_api.extract_folder_info(folder_name)
 
         matched_content = None
-        api = self.plex_api if mode == 1 else self.tmdb_api
+        api = self.plex_index if mode == 1 else self.tmdb_api
 
         search_function = api.search_movie if self.library_type_index == 1 else api.search_tv
-        print(Fore.GREEN + f"正在搜索{'电影' if self.library_type_index == 1 else '剧集'}中：" + Style.RESET_ALL + f"{title} ({year})")
-        matched_content = search_function(title, year)
+        if prefetched is not _NOT_PREFETCHED:
+            # 批量查询已有结论（包括未匹配和出错），不再逐个重新搜索
+            matched_content = prefetched
+        else:
+            print(Fore.GREEN + f"正在搜索{'电影' if self.library_type_index == 1 else '剧集'}中：" + Style.RESET_ALL + f"{title} ({year})")
+            matched_content = search_function(title, year)
 
-        if matched_content is None and mode == 2:
+        if matched_content is None and mode == 2 and self.interactive:
             title = input(f"未找到匹配的{'电影' if self.library_type_index == 1 else '剧集'}。请手动输入标题（留空表示跳过）：")
             year = input("请手动输入年份（留空表示跳过）：")
             if title and year:
@@ -209,6 +224,8 @@ class MediaRenamer:
         if not os.path.exists(target_path):
             os.rename(folder_path, target_path)
             print(Fore.GREEN + "文件夹已成功重命名并移动到：" + Style.RESET_ALL + f"{target_path}")
+            # 守护模式下改名后的文件夹会再次被监视到，无需重复处理
+            self.processed_folders.append(target_path)
         else:
             for filename in os.listdir(folder_path):
                 source = os.path.join(folder_path, filename)
@@ -230,25 +247,42 @@ class MediaRenamer:
                 if row[0] == title and row[1] == year:
                     return row
         return None
+
+    def folder_names(self, folders: Optional[List[str]] = None) -> List[str]:
+        """
+        返回要处理的文件夹名；folders 不为None时只处理其中列出的文件夹。
+        """
+        if folders is None:
+            return os.listdir(self.parent_folder_path)
+        return [os.path.basename(folder) for folder in folders]
     
     # 匹配模式1
-    def match_mode_1(self):
-        for folder_name in os.listdir(self.parent_folder_path):
+    def match_mode_1(self, folders: Optional[List[str]] = None):
+        for folder_name in self.folder_names(folders):
             folder_path = os.path.join(self.parent_folder_path, folder_name)
             self.process_single_folder(folder_path, mode=1)
         self.write_to_file()
 
     # 匹配模式2
-    def match_mode_2(self):
-        for folder_name in os.listdir(self.parent_folder_path):
+    def match_mode_2(self, folders: Optional[List[str]] = None):
+        # 只查询尚未处理的文件夹，目录中的普通文件跳过
+        folder_names = [folder_name for folder_name in self.folder_names(folders)
+                        if os.path.isdir(os.path.join(self.parent_folder_path, folder_name))
+                        and os.path.join(self.parent_folder_path, folder_name) not in self.processed_folders]
+        # 先对整个目录做一次批量查询，重复的标题只请求一次，再逐个处理文件夹
+        queries = {folder_name: self.folder_api.extract_folder_info(folder_name) for folder_name in folder_names}
+        bulk_search = self.tmdb_api.search_movies_bulk if self.library_type_index == 1 else self.tmdb_api.search_tv_bulk
+        print(Fore.GREEN + f"正在批量搜索{len(set(queries.values()))}个标题..." + Style.RESET_ALL)
+        results = bulk_search(queries.values())
+        for folder_name in folder_names:
             folder_path = os.path.join(self.parent_folder_path, folder_name)
-            self.process_single_folder(folder_path, mode=2)
+            self.process_single_folder(folder_path, mode=2, prefetched=results.get(queries[folder_name]))
         self.write_to_file()
 
 
     # 匹配模式3
-    def match_mode_3(self):
-        for folder_name in os.listdir(self.parent_folder_path):
+    def match_mode_3(self, folders: Optional[List[str]] = None):
+        for folder_name in self.folder_names(folders):
             folder_path = os.path.join(self.parent_folder_path, folder_name)
             print(Fore.RED + "正在处理文件夹：" + Style.RESET_ALL + f"{folder_path}")
             if folder_path in self.processed_folders:
@@ -262,11 +296,12 @@ class MediaRenamer:
                 print(Fore.GREEN + f"从库中获取内容: {matched_content[0]} ({matched_content[1]}) {{tmdbid-{matched_content[2]}}}" + Style.RESET_ALL)
                 new_folder_name = self.folder_title_format(matched_content[0], matched_content[1], matched_content[2])
                 self.folder_api.process_folder(folder_path, new_folder_name, matched_content)
+                self.processed_folders.append(os.path.join(self.parent_folder_path, new_folder_name))
 
 
     # 匹配模式4
-    def match_mode_4(self):
-        for folder_name in os.listdir(self.parent_folder_path):
+    def match_mode_4(self, folders: Optional[List[str]] = None):
+        for folder_name in self.folder_names(folders):
             folder_path = os.path.join(self.parent_folder_path, folder_name)
             print(Fore.RED + "正在处理文件夹：" + Style.RESET_ALL + f"{folder_path}")
             if folder_path in self.processed_folders:
@@ -282,22 +317,54 @@ class MediaRenamer:
                 new_folder_name = self.folder_title_format(title, year, None)
 
             self.folder_api.process_folder(folder_path, new_folder_name, None)
+            self.processed_folders.append(os.path.join(self.parent_folder_path, new_folder_name))
 
-    def process(self):
+    def process(self, folders: Optional[List[str]] = None):
         if self.match_mode_index == 1:
-            self.match_mode_1()
+            self.match_mode_1(folders)
         elif self.match_mode_index == 2:
-            self.match_mode_2()
+            self.match_mode_2(folders)
         elif self.match_mode_index == 3:
-            self.match_mode_3()
+            self.match_mode_3(folders)
         elif self.match_mode_index == 4:
-            self.match_mode_4()
-            exit()
+            self.match_mode_4(folders)
+
+    def watch(self):
+        """
+        守护模式：先按所选模式处理一遍目录，之后监视目录，新的文件夹下载或复制完成后只处理这些文件夹，不再询问。
+        TMDB缓存和PLEX索引在整个运行期间一直保留，PLEX索引查找不到时只补充新加入的条目；合并调用的结果每批清空。
+        """
+        self.interactive = False
+        # PLEX中随时会加入新条目，本地索引中查找不到的不记为未匹配
+        self.plex_index.remember_misses = False
+        self.process()
+        run_daemon([self.parent_folder_path], self.config, self.process_batch)
+
+    def process_batch(self, folders: List[str]) -> List[str]:
+        """
+        守护模式下处理一批文件夹：先标记PLEX索引可能缺少新条目并清空合并调用记住的结果，再处理这些文件夹。
+        返回本批修改过的路径，监视器据此忽略这些路径产生的事件。
+        """
+        self.plex_index.mark_stale()
+        self.plex_api.forget_results()
+        self.tmdb_api.forget_results()
+        before = len(self.processed_folders)
+        self.process(folders)
+        return folders + self.processed_folders[before:]
 
 def main() -> None:
     print(Fore.RED + '开始程序:注意输入的目录结构必须是【你的目录/剧集或电影文件夹/媒体文件或其他子目录】' + Style.RESET_ALL)
     media_renamer: MediaRenamer = MediaRenamer()
-    media_renamer.process()
+    if '--watch' in sys.argv[1:]:
+        media_renamer.watch()
+    else:
+        media_renamer.process()
+        if media_renamer.match_mode_index == 4:
+            exit()
+    media_renamer.tmdb_api.print_stats()
+    media_renamer.tmdb_api.print_miss_report()
+    if media_renamer.folder_api.cache is not None:
+        media_renamer.folder_api.cache.close()
 
 if __name__ == "__main__":
     main()
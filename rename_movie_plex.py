@@ -7,8 +7,11 @@ import re
 import json
 import requests
 import shutil
-from api import PlexApi
+from api import PlexApi, PlexLibraryIndex, plex_movie_details, session_from_config
+from cache import config_fingerprint
 from config import ConfigManager
+from release_parser import ReleaseParser, ParsedRelease
+from scanner import VIDEO, Inventory, InventoryStore, file_signature, scan_library
 from colorama import Fore, Style
 from typing import Dict, Optional, Union, List, Tuple
 from difflib import SequenceMatcher
@@ -21,7 +24,9 @@ class MovieRenamer:
         self.config_manager = ConfigManager(self.config_file)
         self.config = self.config_manager.config
         server_info_and_key = self.config_manager.get_server_info_and_key()
-        self.plex_api = PlexApi(server_info_and_key['plex_url'], server_info_and_key['plex_token'])
+        self.session = session_from_config(self.config)
+        self.plex_api = PlexApi.from_config(self.config, server_info_and_key['plex_url'], server_info_and_key['plex_token'], session=self.session)
+        self.plex_index = PlexLibraryIndex(self.plex_api)
         self.video_suffix_list = self.config['video_suffix_list'].split(',')
         self.subtitle_suffix_list = self.config['subtitle_suffix_list'].split(',')
         self.other_suffix_list = self.config['other_suffix_list'].split(',')
@@ -30,6 +35,13 @@ class MovieRenamer:
         self.movie_delete_files = self.config['movie_delete_files']
         self.process_media = self.config['process_media']
         self.process_subtitle = self.config['process_subtitle']
+        # 文件名解析规则在启动时编译一次
+        self.release_parser = ReleaseParser.from_config(self.config, parse_tmdb_id=False)
+        # 媒体库的文件清单，main 开始时扫描一次
+        self.inventory: Optional[Inventory] = None
+        # 增量扫描：保存媒体库清单和已整理好的文件，未开启时为None
+        self.inventory_store = InventoryStore.from_config(self.config)
+        self.organized: Dict[str, Tuple[str, str]] = {}
 
     def main(self) -> None:
         """
@@ -41,6 +53,12 @@ class MovieRenamer:
             print(Fore.RED + "输入的路径不存在，请检查后重新输入。" + Fore.RESET)
             return
         print(Fore.GREEN + f"预处理所有文件名: {parent_folder_path}" + Style.RESET_ALL)
+        # 只遍历一次目录树，之后的删除、移动、解析和字幕处理都使用这份清单
+        self.inventory = scan_library(parent_folder_path, self.video_suffix_list, self.subtitle_suffix_list,
+                                      store=self.inventory_store)
+        if self.inventory_store is not None:
+            self.organized = self.inventory_store.results(self.results_namespace(), self.results_fingerprint())
+            print(Fore.GREEN + f"增量扫描: {self.inventory.reused} 个文件夹没有变化" + Style.RESET_ALL)
         # 在处理文件信息之前，先预处理文件
 
         if self.movie_delete_files:
@@ -53,6 +71,7 @@ class MovieRenamer:
             rename_dict = self.process_movie_files(parent_folder_path)
             if rename_dict is not None:
                 self.rename_files(rename_dict)
+                self.record_organized(rename_dict)
                 print(Fore.RED + "媒体文件重命名执行完毕。" + Style.RESET_ALL)
 
         if self.process_subtitle:
@@ -61,8 +80,31 @@ class MovieRenamer:
                 self.rename_files(subtitle_rename_dict)
                 print(Fore.RED + "字幕文件重命名执行完毕。" + Style.RESET_ALL)
 
+        self.plex_api.print_miss_report()
+        # 整个目录处理完后，删除已改名或删除的文件的解析结果
+        self.release_parser.prune_cache(os.path.basename(path) for path, entry in self.inventory.files.items() if entry.kind == VIDEO)
+        self.release_parser.close()
+        if self.inventory_store is not None:
+            self.inventory_store.close()
+
+    def results_namespace(self) -> str:
+        return 'rename_movie'
+
+    def results_fingerprint(self) -> str:
+        # 文件名格式或解析规则变化后，之前整理好的文件需要重新处理
+        return config_fingerprint(self.movie_title_format, self.release_parser.fingerprint)
+
+    def get_inventory(self, directory_path: str) -> Inventory:
+        """
+        返回包含该目录的文件清单；main 开始时已扫描，单独调用各步骤时才重新扫描。
+        """
+        if self.inventory is None or directory_path not in self.inventory.directories:
+            self.inventory = scan_library(directory_path, self.video_suffix_list, self.subtitle_suffix_list)
+        return self.inventory
+
     def move_files(self, parent_folder_path):
-        for root, dirs, files in os.walk(parent_folder_path, topdown=False):
+        inventory = self.get_inventory(parent_folder_path)
+        for root, dirs, files in inventory.walk(parent_folder_path, topdown=False):
             # 跳过父文件夹和直接子目录
             if root == parent_folder_path or os.path.dirname(root) == parent_folder_path:
                 continue
@@ -71,18 +113,20 @@ class MovieRenamer:
                 file_path = os.path.join(root, filename)
 
                 # 检查文件是否已经移动，如果已移动则跳过
-                if not os.path.exists(file_path):
+                if not inventory.exists(file_path):
                     continue
 
                 # 移动文件
                 if self.move_files:
                     movie_folder_path = os.path.dirname(root)
                     target_path = os.path.join(movie_folder_path, filename)
-                    if not os.path.exists(target_path):
+                    if not inventory.exists(target_path):
                         shutil.move(file_path, target_path)
+                        inventory.move_file(file_path, target_path)
 
     def delete_files(self, parent_folder_path):
-        for root, dirs, files in os.walk(parent_folder_path, topdown=False):
+        inventory = self.get_inventory(parent_folder_path)
+        for root, dirs, files in inventory.walk(parent_folder_path, topdown=False):
             # 跳过父文件夹和直接子目录
             if root == parent_folder_path:
                 continue
@@ -93,12 +137,14 @@ class MovieRenamer:
 
                 # 删除指定扩展名的文件
                 if self.movie_delete_files and extension in self.other_suffix_list:
-                    if os.path.exists(file_path):
+                    if inventory.exists(file_path):
                         os.remove(file_path)
+                        inventory.remove_file(file_path)
 
             # 检查并删除空目录
-            if not os.listdir(root):
+            if not inventory.listdir(root):
                 os.rmdir(root)
+                inventory.remove_dir(root)
         print(Fore.RED + "执行移动删除完成。" + Style.RESET_ALL)
 
 
@@ -134,7 +180,11 @@ class MovieRenamer:
         media_files = {}
         media_file_counts = {}
 
-        for root, dirs, files in os.walk(directory_path):
+        inventory = self.get_inventory(directory_path)
+        for root, dirs, files in inventory.walk(directory_path):
+            # 增量扫描时跳过上次运行后没有变化的目录
+            if not inventory.changed(root):
+                continue
             media_files_in_dir = [file for file in files if file.endswith(tuple('.' + ext for ext in self.video_suffix_list))]
             subtitles_in_dir = [file for file in files if file.endswith(tuple('.' + ext for ext in self.subtitle_suffix_list))]
 
@@ -165,7 +215,7 @@ class MovieRenamer:
                     new_name = new_name_base + subtitle_ext
 
                     identifier = 1
-                    while os.path.exists(os.path.join(root, new_name_base + f"_{identifier}" + subtitle_ext)) or new_name_base + f"_{identifier}" + subtitle_ext in subtitle_files.values():
+                    while inventory.exists(os.path.join(root, new_name_base + f"_{identifier}" + subtitle_ext)) or new_name_base + f"_{identifier}" + subtitle_ext in subtitle_files.values():
                         identifier += 1
                     if identifier > 1:
                         new_name = new_name_base + f"_{identifier}" + subtitle_ext
@@ -187,19 +237,46 @@ class MovieRenamer:
         total_files_info = {}
         total_filenames = []
 
-        for movie_folder in os.listdir(parent_folder_path):
+        # 先列出所有电影文件夹中的媒体文件，再一次性批量解析，文件较多时可以使用多个进程
+        media_files = []
+        inventory = self.get_inventory(parent_folder_path)
+        for movie_folder in inventory.listdir(parent_folder_path):
             movie_folder_path = os.path.join(parent_folder_path, movie_folder)
-            if not os.path.isdir(movie_folder_path):
+            if not inventory.isdir(movie_folder_path):
                 continue
+            media_files.extend(self.list_media_files(movie_folder_path))
 
-            files_info, all_filenames = self.process_directory(movie_folder_path)
-            total_files_info.update(files_info)
-            total_filenames.extend(all_filenames)
+        if self.organized:
+            pending = [file_path for file_path in media_files if not self.is_organized(file_path)]
+            print(Fore.GREEN + f"跳过 {len(media_files) - len(pending)} 个上次已整理好且没有变化的文件" + Style.RESET_ALL)
+            media_files = pending
+
+        total_files_info, total_filenames = self.parse_media_files(media_files)
 
         print(Fore.RED + "文件名预处理完成。" + Style.RESET_ALL)
         return total_files_info, total_filenames
 
-    def process_directory(self, directory_path: str) -> Tuple[Dict[str, Dict[str, str]], List[str]]:
+    def is_organized(self, file_path: str) -> bool:
+        """
+        文件在上次运行时已是目标文件名（或已改名成功），且大小和修改时间都没有变化。
+        """
+        entry = self.inventory.files.get(file_path) if self.inventory is not None else None
+        return entry is not None and self.organized.get(file_path) == (file_signature(entry), 'organized')
+
+    def record_organized(self, rename_dict: Dict[str, str]) -> None:
+        """
+        增量扫描时记录已整理好的媒体文件：已是目标文件名，或本次改名成功。用户跳过或目标已存在的文件下次仍会处理。
+        """
+        if self.inventory_store is None:
+            return
+        for old_name, new_name in rename_dict.items():
+            if old_name == new_name or (self.inventory.exists(new_name) and not self.inventory.exists(old_name)):
+                entry = self.inventory.files.get(new_name)
+                if entry is not None:
+                    self.inventory_store.set_result(self.results_namespace(), self.results_fingerprint(),
+                                                    new_name, file_signature(entry), 'organized')
+
+    def process_directory(self, directory_path: str) -> Tuple[Dict[str, ParsedRelease], List[str]]:
         """
         遍历指定目录，处理所有媒体文件。
 
@@ -207,29 +284,41 @@ class MovieRenamer:
         directory_path (str): 要处理的目录路径。
 
         返回:
-        Tuple[Dict[str, Dict[str, str]], List[str]]: 包含两个元素的元组，第一个是文件路径到文件信息的映射字典，第二个是所有文件名的列表。
+        Tuple[Dict[str, ParsedRelease], List[str]]: 包含两个元素的元组，第一个是文件路径到文件信息的映射字典，第二个是所有文件名的列表。
         """
-        files_info = {}  # type: Dict[str, Dict[str, str]]
-        all_filenames = []  # type: List[str]
+        return self.parse_media_files(self.list_media_files(directory_path))
 
-        for root, dirs, files in os.walk(directory_path):
+    def list_media_files(self, directory_path: str) -> List[str]:
+        """
+        列出目录（含子目录）中所有扩展名在 video_suffix_list 中的文件路径。
+        """
+        media_files = []
+        inventory = self.get_inventory(directory_path)
+        for root, dirs, files in inventory.walk(directory_path):
             for filename in files:
-                try:
-                    file_path = os.path.join(root, filename)
-                    extension = os.path.splitext(filename)[1].lower().lstrip('.')
-
-                    # 处理媒体
-                    if extension in self.video_suffix_list:
-                        file_info = self.get_file_info(file_path)
-                        if file_info:
-                            files_info[file_path] = file_info
-                            all_filenames.append(filename)
-                except Exception as e:
-                    print(f"处理文件 {filename} 时发生错误: {e}")
+                if inventory.classify(filename) == VIDEO:
+                    media_files.append(os.path.join(root, filename))
+        return media_files
+
+    def parse_media_files(self, media_files: List[str]) -> Tuple[Dict[str, ParsedRelease], List[str]]:
+        """
+        批量提取媒体文件的信息，返回值与 process_directory 相同；解析出错的文件打印错误后跳过。
+        """
+        files_info = {}  # type: Dict[str, ParsedRelease]
+        all_filenames = []  # type: List[str]
+
+        for file_path, file_info in zip(media_files, self.release_parser.parse_many(media_files)):
+            filename = os.path.basename(file_path)
+            print(Fore.GREEN + "文件正在提取元素: " + Style.RESET_ALL + f"{filename}")
+            if isinstance(file_info, Exception):
+                print(f"处理文件 {filename} 时发生错误: {file_info}")
+                continue
+            files_info[file_path] = file_info
+            all_filenames.append(filename)
 
         return files_info, all_filenames
 
-    def process_file_info(self, file_path: str, files_info: Dict[str, Dict[str, str]], plex_api: PlexApi) -> Dict[str, str]:
+    def process_file_info(self, file_path: str, files_info: Dict[str, ParsedRelease], plex_api: PlexApi) -> Dict[str, str]:
         """
         处理文件信息。
 
@@ -268,7 +357,7 @@ class MovieRenamer:
                 final_elements['hdr_info'] = plex_info['hdr_info']
 
         else:
-            final_elements = elements_from_file  # 如果 Plex 无法匹配到电影信息，返回从文件名中提取的元素
+            final_elements = elements_from_file.copy()  # 如果 Plex 无法匹配到电影信息，返回从文件名中提取的元素
 
         # 处理最终元素大小写问题
         for key, value in final_elements.items():
@@ -288,7 +377,7 @@ class MovieRenamer:
         #print("提取的信息：", final_elements)
         return final_elements
 
-    def get_file_info(self, file_path: str) -> Dict[str, str]:
+    def get_file_info(self, file_path: str) -> ParsedRelease:
         """
         从文件名提取信息。
 
@@ -296,83 +385,10 @@ class MovieRenamer:
         file_path (str): 文件的路径。
 
         返回:
-        Dict[str, str]: 一个字典，包含从文件名中提取的信息。
+        ParsedRelease: 从文件名中提取的信息，可以像字典一样读取。
         """
         print(Fore.GREEN + "文件正在提取元素: " + Style.RESET_ALL + f"{os.path.basename(file_path)}")
-        file_name_no_ext, file_ext = os.path.splitext(os.path.basename(file_path))
-        file_ext = file_ext[1:]  # 获取不包含点号的扩展名
-        file_name_no_ext = file_name_no_ext.replace('.', ' ')
-        file_name_no_ext = file_name_no_ext.upper()
-        self.elements_to_remove = self.config['elements_to_remove'].split(',')
-        for element in self.elements_to_remove:
-            file_name_no_ext = re.sub(element, '', file_name_no_ext)
-        file_name_no_ext = re.sub(r'\b(REMUX|BDREMUX|BD-REMUX)\b', 'REMUX', file_name_no_ext, flags=re.IGNORECASE)
-        file_name_no_ext = re.sub(r'\b(BLURAY|BD|BLU-RAY|BD1080P)\b', 'BD', file_name_no_ext, flags=re.IGNORECASE)
-        file_name_no_ext = re.sub(r'\b(HQCAM|HQ-CAM)\b', 'HQCAM', file_name_no_ext, flags=re.IGNORECASE)
-        file_name_no_ext = re.sub(r'【.*?】', '', file_name_no_ext)
-        file_name_no_ext = re.sub(r'\{.*?\}', '', file_name_no_ext)
-        file_name_no_ext = re.sub(r'\[.*?\]', '', file_name_no_ext)
-
-        self.elements_regex = self.config['elements_regex']
-        elements = {key: None for key in self.elements_regex.keys()}
-        for key, regex in self.elements_regex.items():
-            if key == 'year':
-                match = re.search(regex, file_name_no_ext, re.IGNORECASE)
-                if match:
-                    elements[key] = match.group(0)
-                    file_name_no_ext = file_name_no_ext.replace(match.group(0), '')
-            else:
-                matches = re.findall(regex, file_name_no_ext, re.IGNORECASE)
-                if matches:
-                    elements[key] = ' '.join(matches)
-                    for match in matches:
-                        file_name_no_ext = file_name_no_ext.replace(match, '')
-        file_name_no_ext = file_name_no_ext.split('-')[0]
-        #print(Fore.GREEN + f"剩余的文件名: {file_name_no_ext}" + Style.RESET_ALL)
-        series_number_arabic = re.search(r'\b[2-5]\b', file_name_no_ext)
-        series_number_roman = re.search(r'\b(?:M{0,3})(?:CM|CD|D?C{0,3})(?:XC|XL|L?X{0,3})(?:IX|IV|V?I{0,3})\b', file_name_no_ext)
-        if series_number_arabic:
-            elements['series_number'] = series_number_arabic.group(0)
-            file_name_no_ext = file_name_no_ext.replace(series_number_arabic.group(0), '')
-        elif series_number_roman:
-            elements['series_number'] = series_number_roman.group(0)
-            file_name_no_ext = file_name_no_ext.replace(series_number_roman.group(0), '')
-
-        chinese_title = re.search(r'《.*?》', file_name_no_ext)
-        if chinese_title:
-            elements['chinese_title'] = chinese_title.group(0)[1:-1]
-            file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
-        else:
-            chinese_title = re.search(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]+', file_name_no_ext)
-            if chinese_title:
-                if re.search(r'[\u4e00-\u9fff]', chinese_title.group(0)):
-                    elements['chinese_title'] = chinese_title.group(0)
-                    file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
-                else:
-                    elements['chinese_title'] = None
-            else:
-                elements['chinese_title'] = None
-        if elements['chinese_title'] is None and file_path and len(os.listdir(os.path.dirname(file_path))) < 8:
-            parent_folder_name = os.path.basename(os.path.dirname(file_path))
-            chinese_title = re.search(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]*', parent_folder_name)
-            if chinese_title:
-                elements['chinese_title'] = chinese_title.group(0)
-                #print(Fore.GREEN + f"提取的中文标题: {elements['chinese_title']}" + Style.RESET_ALL)
-        english_title = re.search(r'[a-zA-Z0-9]+(\s[a-zA-Z0-9]+)*', file_name_no_ext)
-
-        if english_title:
-            elements['english_title'] = english_title.group(0)
-            file_name_no_ext = file_name_no_ext.replace(english_title.group(0), '')
-        else:
-            elements['english_title'] = None
-
-        if elements['chinese_title'] is None:
-            parent_folder_name = os.path.basename(os.path.dirname(file_path))
-            chinese_title = re.search(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]*', parent_folder_name)
-            if chinese_title:
-                elements['chinese_title'] = chinese_title.group(0)
-
-        return elements
+        return self.release_parser.parse_release(file_path)
 
     def search_movie(self, file_path: str, chinese_title: str = None, english_title: str = None, year: str = None) -> str:
         parent_folder_name = os.path.basename(os.path.dirname(file_path))
@@ -386,10 +402,18 @@ class MovieRenamer:
         movie_info_found = False
         extracted_info = {}
 
-        if chinese_title is not None:
-            movies = self.plex_api.search_movie(chinese_title)
+        # 优先按媒体文件路径在本地索引中查找，找不到时再按标题查找
+        indexed_item = self.plex_index.find_by_file(file_path)
+        if indexed_item is not None:
+            movies = plex_movie_details(indexed_item)
+        elif self.plex_api.is_known_miss('plex/movie', chinese_title if chinese_title is not None else english_title):
+            # 之前已确认匹配不到的标题直接跳过，不再请求手动输入
+            print(Fore.YELLOW + "已知未匹配，跳过：" + Style.RESET_ALL, os.path.join(parent_folder_name, file_name))
+            return {}
+        elif chinese_title is not None:
+            movies = self.plex_index.search_movie(chinese_title)
         else:
-            movies = self.plex_api.search_movie(english_title)
+            movies = self.plex_index.search_movie(english_title)
 
         if movies:
             movie_info_found = True
@@ -455,10 +479,12 @@ class MovieRenamer:
             return 'REMUX'
 
 
-    def get_hdr_info(self, media: Dict) -> str:
+    def get_hdr_info(self, media: Dict) -> Optional[str]:
+        has_streams = False
         if 'Part' in media:
             for part in media['Part']:
                 if 'Stream' in part:
+                    has_streams = True
                     for stream in part['Stream']:
                         display_title = stream.get('displayTitle', '')
                         if display_title:
@@ -466,7 +492,8 @@ class MovieRenamer:
                             hdr_info = re.search(r'(DOLBY VISION|DOVI|DV|HDR10\+|HDR10|HLG|DISPLAYHDR)', display_title)
                             if hdr_info:
                                 return hdr_info.group(0)
-        return 'SDR'
+        # 媒体库索引中没有音视频流信息时无法判断，保留从文件名中提取的值
+        return 'SDR' if has_streams else None
 
 
     def rename_files(self, rename_dict: Dict[str, str]):
@@ -499,9 +526,12 @@ class MovieRenamer:
                     print("输入的不是有效的数字，请重新输入。")
 
         for old_name, new_name in rename_dict.items():
-            if not os.path.exists(new_name):     
+            if not (self.inventory.exists(new_name) if self.inventory is not None else os.path.exists(new_name)):
                 print(self.format_file_info(index, old_name, new_name))
                 os.rename(old_name, new_name)
+                if self.inventory is not None:
+                    # 字幕处理读取清单中改名后的媒体文件名
+                    self.inventory.rename_file(old_name, new_name)
             else:
                 print(Fore.RED + f"跳过重命名：{os.path.basename(new_name)}" + Style.RESET_ALL)
 
@@ -6,18 +6,24 @@ import re
 import os
 import time
 import json
+import sys
 import shutil
 import colorama
+from typing import List, Optional
 from natsort import natsorted
 from colorama import Fore, Style
 from api import TMDBApi
+from cache import config_fingerprint
+from scanner import InventoryStore, scan_library
+from watcher import run_daemon
 
 
 class LocalMediaRename:
     def __init__(self, config_file: str):
         with open(config_file, 'r', encoding='utf-8') as f:
             config = json.load(f)
-        self.tmdb = TMDBApi(config['TMDB_API_KEY'])
+        self.config = config
+        self.tmdb = TMDBApi.from_config(config)
         self.tmdb_language = self.select_language(config)
         self.tv_name_format = config['tv_name_format']
         self.video_suffix_list = [suffix.lower() for suffix in config['video_suffix_list'].split(',')]
@@ -29,6 +35,13 @@ class LocalMediaRename:
         self.auto_rename = config['auto_rename']
         self.debug = config['debug']
         self.destination_folder = config['destination_folder']
+        # 增量扫描：记录因缺集等原因没有移走的剧集文件夹，文件夹内容不变时下次直接跳过
+        self.inventory_store = InventoryStore.from_config(config)
+        self.results_fingerprint = config_fingerprint(self.tv_name_format, self.tmdb_language)
+        # 守护模式下不再询问，查找到多个结果的剧集跳过
+        self.interactive = True
+        # 守护模式下记录移动到目标目录的剧集文件夹，监视器忽略这些路径产生的事件
+        self.moved_folders: List[str] = []
 
     def select_language(self, config):
         if config['ask_language_change']:
@@ -45,10 +58,57 @@ class LocalMediaRename:
         else:
             return config['language_option']
 
-    def rename_files(self, folder_path: str):
+    def process(self, root_folder_path: str, folders: Optional[List[str]] = None):
+        """
+        整理根目录中的剧集文件夹；folders 不为None时只处理其中列出的文件夹。
+        """
+        for path in ([root_folder_path] if folders is None else folders):
+            # 重命名季度文件夹
+            self.rename_season_folders(path, rename_seasons=self.rename_seasons)
+            # 删除指定格式的文件
+            self.delete_files(path, show_delete_files=self.show_delete_files)
+        self.rename_files(root_folder_path, folders)
+        self.tmdb.print_stats()
+        self.tmdb.print_miss_report()
+
+    def watch(self, root_folder_path: str):
+        """
+        守护模式：先整理一遍根目录，之后监视根目录，新的剧集文件夹下载或复制完成后自动整理，不再询问。
+        TMDB缓存在整个运行期间一直保留；合并调用的结果每批清空。
+        """
+        self.interactive = False
+        self.auto_rename = True
+        if self.inventory_store is None:
+            # 未开启增量扫描时使用只在本进程中保存的清单
+            self.inventory_store = InventoryStore(':memory:')
+        self.process(root_folder_path)
+        run_daemon([root_folder_path], self.config, lambda folders: self.process_batch(root_folder_path, folders))
+
+    def process_batch(self, root_folder_path: str, folders: List[str]) -> List[str]:
+        """
+        守护模式下处理一批文件夹：先清空合并调用记住的结果，再整理这些文件夹。
+        返回本批修改过的路径，监视器据此忽略这些路径产生的事件。
+        """
+        self.tmdb.forget_results()
+        self.moved_folders = []
+        self.process(root_folder_path, folders)
+        return folders + self.moved_folders
+
+    def rename_files(self, folder_path: str, folders: Optional[List[str]] = None):
+        inventory = None
+        unfinished = {}
+        if self.inventory_store is not None:
+            inventory = scan_library(folder_path, self.video_suffix_list, self.subtitle_suffix_list, store=self.inventory_store)
+            unfinished = self.inventory_store.results('rename_show', self.results_fingerprint)
+            print(colorama.Fore.GREEN + f"增量扫描: {inventory.reused} 个文件夹没有变化" + colorama.Fore.RESET)
         for folder_name in os.listdir(folder_path):
             sub_folder_path = os.path.join(folder_path, folder_name)
+            if folders is not None and sub_folder_path not in folders:
+                continue
             if os.path.isdir(sub_folder_path):
+                if inventory is not None and sub_folder_path in unfinished and not inventory.changed(sub_folder_path):
+                    print(colorama.Fore.GREEN + f"跳过上次未完成且没有变化的文件夹: {folder_name}" + colorama.Fore.RESET)
+                    continue
                 match = re.search(r'(.*) \((\d{4})\) {tmdb-(\d+)}', folder_name)
                 title = folder_name  # 假设整个文件夹名就是标题
                 if match:
@@ -59,11 +119,16 @@ class LocalMediaRename:
                 season_folders = [name for name in os.listdir(sub_folder_path) if os.path.isdir(os.path.join(sub_folder_path, name)) and re.search(r'(S\d+|SEASON \d+|第\d+季)', name.upper())]
                 if season_folders:
                     all_skipped_episodes = []
+                    bundle = None
+                    if match:
+                        # 一次请求获取剧集信息和所有季文件夹对应的季信息
+                        seasons = [self.season_number_from_folder(name) or 1 for name in season_folders]
+                        bundle = self.tmdb.tv_bundle(tmdb_id, seasons, language=self.tmdb_language)
                     for season_folder in season_folders:
                         season_folder_path = os.path.join(sub_folder_path, season_folder)
                         #print(f"正在处理的季文件夹: {season_folder}") 
                         if match:
-                            skipped_episodes = self.tv_rename_id(tmdb_id, season_folder_path)
+                            skipped_episodes = self.tv_rename_id(tmdb_id, season_folder_path, bundle=bundle)
                             all_skipped_episodes.extend(skipped_episodes)
                         else:
                             skipped_episodes = self.tv_rename_keyword(title, season_folder_path)
@@ -79,6 +144,7 @@ class LocalMediaRename:
 
                         try:
                             shutil.move(sub_folder_path, new_folder_path)
+                            self.moved_folders.append(new_folder_path)
                             print(f"成功移动文件夹: {sub_folder_path} -> {new_folder_path}")
                         except Exception as e:
                             print(f"移动文件夹时发生错误: {e}")
@@ -98,6 +164,7 @@ class LocalMediaRename:
 
                             try:
                                 shutil.move(sub_folder_path, new_folder_path)
+                                self.moved_folders.append(new_folder_path)
                                 print(f"成功移动文件夹: {sub_folder_path} -> {new_folder_path}")
                             except Exception as e:
                                 print(f"移动文件夹时发生错误: {e}")
@@ -116,6 +183,7 @@ class LocalMediaRename:
 
                             try:
                                 shutil.move(sub_folder_path, new_folder_path)
+                                self.moved_folders.append(new_folder_path)
                                 #print(f"成功移动文件夹: {sub_folder_path} -> {new_folder_path}")
                             except Exception as e:
                                 print(f"移动文件夹时发生错误: {e}")
@@ -123,8 +191,27 @@ class LocalMediaRename:
                             if self.debug:
                                 print(colorama.Fore.GREEN + "正在移动: {} -> {}".format(sub_folder_path, new_folder_path) + colorama.Fore.RESET)
 
+                # 处理完仍留在原处的文件夹（缺集、未匹配或移动失败）记为未完成
+                if inventory is not None and os.path.isdir(sub_folder_path):
+                    self.inventory_store.set_result('rename_show', self.results_fingerprint, sub_folder_path, '', 'unfinished')
 
-    def tv_rename_id(self, tv_id: str, folder_path: str, first_number: int = 1, auto_rename=False):
+        if self.inventory_store is not None:
+            self.inventory_store.flush()
+
+
+    def season_number_from_folder(self, folder_path: str) -> Optional[int]:
+        """
+        从季文件夹名中提取季数，无法提取时返回None。
+        """
+        season_folder_name = os.path.basename(os.path.normpath(folder_path)).upper()
+        patterns = [r'S(\d+)', r'SEASON (\d+)', r'第(\d+)季']
+        for pattern in patterns:
+            match = re.search(pattern, season_folder_name, re.IGNORECASE)
+            if match:
+                return int(match.group(1))
+        return None
+
+    def tv_rename_id(self, tv_id: str, folder_path: str, first_number: int = 1, auto_rename=False, bundle: Optional[dict] = None):
         skipped_episodes = []  # 在函数开始处初始化 skipped_episodes
         folder_path = os.path.normpath(folder_path) + os.sep
         notice_msg = colorama.Fore.GREEN + '[提示!]' + colorama.Fore.RESET
@@ -136,12 +223,15 @@ class LocalMediaRename:
                                 first_number=first_number),
                     result=[])
 
-        # 根据剧集id 查找TMDB剧集信息
-        tv_info_result = self.tmdb.tv_info(tv_id, language=self.tmdb_language, silent=False)
+        # 根据剧集id 查找TMDB剧集信息，同一请求中附带当前文件夹对应的季信息
+        folder_season_number = self.season_number_from_folder(folder_path)
+        if bundle is None:
+            bundle = self.tmdb.tv_bundle(tv_id, [folder_season_number or 1], language=self.tmdb_language, silent=False)
+        tv_info_result = bundle
         result['result'].append(tv_info_result)
 
         # 若查找失败则停止，并返回结果
-        if tv_info_result['request_code'] != 200:
+        if tv_info_result is None or tv_info_result['request_code'] != 200:
             return result
 
         episodes = []  # 给episodes一个默认值
@@ -153,18 +243,13 @@ class LocalMediaRename:
             # 获取到多项匹配结果，从文件夹名中提取季数
             season_folder_name = os.path.basename(os.path.normpath(folder_path)).upper()
             print(f"正在处理的文件夹: {season_folder_name}") 
-            patterns = [r'S(\d+)', r'SEASON (\d+)', r'第(\d+)季']
-            for pattern in patterns:
-                match = re.search(pattern, season_folder_name, re.IGNORECASE)
-                if match:
-                    season_number = int(match.group(1))
-                    break
-            if not match:
-                season_number = 1
+            season_number = folder_season_number or 1
 
 
-        # 获取剧集对应季每集信息
-        tv_season_info = self.tmdb.tv_season_info(tv_id, season_number, language=self.tmdb_language, silent=self.debug)
+        # 获取剧集对应季每集信息，已随剧集信息一起获取时不再单独请求
+        tv_season_info = tv_info_result.get('season_details', {}).get(season_number)
+        if tv_season_info is None:
+            tv_season_info = self.tmdb.tv_season_info(tv_id, season_number, language=self.tmdb_language, silent=self.debug)
         result['result'].append(tv_season_info)
 
         # 若获取失败则停止， 并返回结果
@@ -321,6 +406,9 @@ class LocalMediaRename:
             return result
 
         # 若有多项, 则手动选择
+        if not self.interactive:
+            result['result'].append("查找到多个结果, 守护模式下不手动选择, 已跳过")
+            return result
         while True:
             tv_number = input(f"{notice_msg} 查找到多个结果, 请输入对应[序号], 输入[n]退出\t")
             active_number = list(range(len(search_result['results'])))
@@ -395,10 +483,10 @@ if __name__ == '__main__':
     print(Fore.RED + '开始程序:注意输入的目录结构必须是【你的目录/剧集或电影文件夹/媒体文件或其他子目录】' + Style.RESET_ALL)
     root_folder_path = input("请输入你的目录的路径：")
 
-    # 重命名季度文件夹
-    renamer.rename_season_folders(root_folder_path, rename_seasons=renamer.rename_seasons)
-
-    # 删除指定格式的文件
-    renamer.delete_files(root_folder_path, show_delete_files=renamer.show_delete_files)
-    # 使用LocalMediaRename对象来重命名文件
-    renamer.rename_files(root_folder_path)
\ No newline at end of file
+    # 使用LocalMediaRename对象来重命名文件，--watch 时持续监视目录
+    if '--watch' in sys.argv[1:]:
+        renamer.watch(os.path.normpath(root_folder_path))
+    else:
+        renamer.process(root_folder_path)
+    if renamer.inventory_store is not None:
+        renamer.inventory_store.close()
\ No newline at end of file
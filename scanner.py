@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : scanner.py
+
+import os
+import json
+import time
+import sqlite3
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+from cache import DEFAULT_CACHE_PATH
+
+# 文件类型
+VIDEO = 'video'
+SUBTITLE = 'subtitle'
+OTHER = 'other'
+
+
+class FileEntry(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    kind: str
+
+
+class InventoryStore:
+    """
+    保存在SQLite中的媒体库清单：每个目录的修改时间和内容，以及各脚本对文件、文件夹的处理结果。
+    下次扫描时修改时间没有变化的目录直接使用保存的内容，不再列目录；处理结果用于跳过已整理好的文件。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._pending_folders: List[Tuple[str, float, str]] = []
+        self._pending_results: List[Tuple[str, str, str, str, str, float]] = []
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS inventory_folders (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                entries TEXT NOT NULL
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS inventory_results (
+                namespace TEXT NOT NULL,
+                path TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                result TEXT NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (namespace, path)
+            )""")
+        self._conn.commit()
+
+    @classmethod
+    def from_config(cls, config: Dict) -> Optional['InventoryStore']:
+        """
+        开启 incremental_scan 时返回清单，与TMDB响应缓存使用同一个文件；未开启时返回None。
+        """
+        if not config.get('incremental_scan', False):
+            return None
+        return cls(config.get('tmdb_cache_path', DEFAULT_CACHE_PATH))
+
+    def folders(self, root: str) -> Dict[str, Tuple[float, str]]:
+        """
+        一次读取 root 及其下所有目录保存的 {路径: (修改时间, 目录内容JSON)}。
+        """
+        prefix = os.path.join(root, '')
+        rows = self._conn.execute("SELECT path, mtime, entries FROM inventory_folders WHERE path = ? OR substr(path, 1, ?) = ?",
+                                  (root, len(prefix), prefix))
+        return {path: (mtime, entries) for path, mtime, entries in rows}
+
+    def save_folder(self, path: str, mtime: float, entries: dict) -> None:
+        self._pending_folders.append((path, mtime, json.dumps(entries, ensure_ascii=False)))
+
+    def prune(self, root: str, visited: Set[str], files: Iterable[str] = (), stored: Optional[Iterable[str]] = None) -> None:
+        """
+        删除 root 下本次扫描没有遇到的目录（已被删除或移走），以及路径已不存在的文件、文件夹的处理结果。
+        stored 为扫描开始时读取的已保存目录，传入时不再重新读取。
+        """
+        self.flush()
+        stale = [(path,) for path in (self.folders(root) if stored is None else stored) if path not in visited]
+        if stale:
+            self._conn.executemany("DELETE FROM inventory_folders WHERE path = ?", stale)
+        existing = visited.union(files)
+        prefix = os.path.join(root, '')
+        rows = self._conn.execute("SELECT namespace, path FROM inventory_results WHERE substr(path, 1, ?) = ?",
+                                  (len(prefix), prefix)).fetchall()
+        stale_results = [(namespace, path) for namespace, path in rows if path not in existing]
+        if stale_results:
+            self._conn.executemany("DELETE FROM inventory_results WHERE namespace = ? AND path = ?", stale_results)
+        self._conn.commit()
+
+    def results(self, namespace: str, fingerprint: str) -> Dict[str, Tuple[str, str]]:
+        """
+        读取某个脚本的全部处理结果 {路径: (签名, 结果)}；配置变化（指纹不同）的旧结果删除。
+        """
+        self._conn.execute("DELETE FROM inventory_results WHERE namespace = ? AND fingerprint != ?", (namespace, fingerprint))
+        self._conn.commit()
+        rows = self._conn.execute("SELECT path, signature, result FROM inventory_results WHERE namespace = ?", (namespace,))
+        return {path: (signature, result) for path, signature, result in rows}
+
+    def set_result(self, namespace: str, fingerprint: str, path: str, signature: str, result: str) -> None:
+        self._pending_results.append((namespace, path, fingerprint, signature, result, time.time()))
+
+    def flush(self) -> None:
+        if self._pending_folders:
+            self._conn.executemany("INSERT OR REPLACE INTO inventory_folders (path, mtime, entries) VALUES (?, ?, ?)",
+                                   self._pending_folders)
+            self._pending_folders = []
+        if self._pending_results:
+            self._conn.executemany("INSERT OR REPLACE INTO inventory_results "
+                                   "(namespace, path, fingerprint, signature, result, updated) VALUES (?, ?, ?, ?, ?, ?)",
+                                   self._pending_results)
+            self._pending_results = []
+        self._conn.commit()
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self.flush()
+            self._conn.close()
+            self._conn = None
+
+
+def file_signature(entry: FileEntry) -> str:
+    """
+    文件的签名（大小和修改时间），签名不变视为文件没有变化。
+    """
+    return f"{entry.size}:{entry.mtime}"
+
+
+class Inventory:
+    """
+    一次 os.scandir 遍历得到的媒体库清单：每个目录的子目录和文件（保持 os.walk 的顺序）以及文件的大小、修改时间、类型。
+    删除、移动、重命名等各个步骤都读取这份清单，并在修改文件后同步更新，不再各自重复遍历目录树。
+    与 os.walk 一样不进入指向目录的符号链接；清单中没有的目录仍然直接访问文件系统。
+    使用 InventoryStore 扫描时只重新列出修改时间变化的目录，changed() 可以判断某个目录是否需要重新处理。
+    """
+
+    def __init__(self, root: str, video_suffixes: Iterable[str] = (), subtitle_suffixes: Iterable[str] = ()):
+        self.root = root
+        self.video_suffixes = frozenset(suffix.lower().lstrip('.') for suffix in video_suffixes)
+        self.subtitle_suffixes = frozenset(suffix.lower().lstrip('.') for suffix in subtitle_suffixes)
+        # 目录 -> (子目录名, 文件名)
+        self.directories: Dict[str, Tuple[List[str], List[str]]] = {}
+        self.files: Dict[str, FileEntry] = {}
+        # 已知存在的路径（按 os.path.normcase 规范化，Windows 下不区分大小写）
+        self._paths = set()
+        # 增量扫描时，内容有变化的目录及其所有上级目录；不是增量扫描时为None，视为全部有变化
+        self.dirty: Optional[Set[str]] = None
+        # 本次扫描中实际列出的目录数和沿用保存内容的目录数
+        self.listed = 0
+        self.reused = 0
+        # 本次运行中通过下面的 remove_file、move_file 等方法修改过的路径
+        self.written: List[str] = []
+
+    def classify(self, filename: str) -> str:
+        extension = os.path.splitext(filename)[1].lower().lstrip('.')
+        if extension in self.video_suffixes:
+            return VIDEO
+        if extension in self.subtitle_suffixes:
+            return SUBTITLE
+        return OTHER
+
+    def scan(self, store: Optional[InventoryStore] = None) -> 'Inventory':
+        """
+        从 root 开始逐层 os.scandir，一次得到所有目录和文件的信息。无法读取的目录与 os.walk 一样跳过。
+        传入 store 时，修改时间与上次相同的目录直接使用保存的内容，只对其子目录各取一次修改时间：
+        目录的修改时间只随其直接包含的条目增删改名而变化，更深层的变化要到子目录中才能发现。
+        """
+        stored_folders = {}
+        if store is not None:
+            self.dirty = set()
+            stored_folders = store.folders(self.root)
+        visited = set()
+        pending: List[Tuple[str, Optional[float]]] = [(self.root, None)]
+        while pending:
+            directory, mtime = pending.pop()
+            if store is not None and mtime is None:
+                try:
+                    mtime = os.stat(directory).st_mtime
+                except OSError:
+                    continue
+            stored = stored_folders.get(directory)
+            if stored is not None and stored[0] == mtime:
+                entries = json.loads(stored[1])
+                dirnames, filenames = entries['dirs'], []
+                # 与 DirEntry.path 相同的拼接方式，比逐个 os.path.join 快
+                prefix = os.path.join(directory, '')
+                for name, size, file_mtime in entries['files']:
+                    filenames.append(name)
+                    self._add_file(FileEntry(prefix + name, size, file_mtime, self.classify(name)))
+                self._paths.update(os.path.normcase(prefix + name) for name in dirnames)
+                links = entries['links']
+                subdirectories = [(prefix + name, None) for name in dirnames if name not in links]
+                self.reused += 1
+            else:
+                try:
+                    dirnames, filenames, links, subdirectories = self._scandir(directory, store is not None)
+                except OSError:
+                    continue
+                self.listed += 1
+                if store is not None:
+                    files = [[name, self.files[os.path.join(directory, name)].size,
+                              self.files[os.path.join(directory, name)].mtime] for name in filenames]
+                    store.save_folder(directory, mtime, {'dirs': dirnames, 'links': links, 'files': files})
+                    self._touch(directory)
+            self.directories[directory] = (dirnames, filenames)
+            self._paths.add(os.path.normcase(directory))
+            visited.add(directory)
+            # 倒序入栈，出栈顺序与目录内的顺序一致
+            pending.extend(reversed(subdirectories))
+        if store is not None:
+            store.prune(self.root, visited, self.files, stored_folders)
+        return self
+
+    def _scandir(self, directory: str, with_mtime: bool) -> Tuple[List[str], List[str], List[str], List[Tuple[str, Optional[float]]]]:
+        dirnames, filenames, links = [], [], []
+        subdirectories = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    dirnames.append(entry.name)
+                    self._paths.add(os.path.normcase(entry.path))
+                    if entry.is_symlink():
+                        links.append(entry.name)
+                        continue
+                    mtime = None
+                    if with_mtime:
+                        try:
+                            mtime = entry.stat().st_mtime
+                        except OSError:
+                            pass
+                    subdirectories.append((entry.path, mtime))
+                    continue
+                try:
+                    stat = entry.stat()
+                    size, mtime = stat.st_size, stat.st_mtime
+                except OSError:
+                    size, mtime = 0, 0.0
+                filenames.append(entry.name)
+                self._add_file(FileEntry(entry.path, size, mtime, self.classify(entry.name)))
+        return dirnames, filenames, links, subdirectories
+
+    def _touch(self, directory: str) -> None:
+        """
+        标记目录及其上级目录有变化。
+        """
+        if self.dirty is None:
+            return
+        while directory not in self.dirty:
+            self.dirty.add(directory)
+            parent = os.path.dirname(directory)
+            if directory == self.root or parent == directory:
+                break
+            directory = parent
+
+    def changed(self, path: str) -> bool:
+        """
+        该目录或其中任一子目录的内容与上次扫描时不同（或本次运行中被修改过）。
+        """
+        return self.dirty is None or path in self.dirty
+
+    def _add_file(self, entry: FileEntry) -> None:
+        self.files[entry.path] = entry
+        self._paths.add(os.path.normcase(entry.path))
+
+    def walk(self, top: str, topdown: bool = True) -> Iterator[Tuple[str, List[str], List[str]]]:
+        """
+        与 os.walk(top, topdown) 相同的 (目录, 子目录名, 文件名) 序列，但从清单读取。
+        每个目录的名称列表在进入该目录时复制，遍历过程中修改清单不影响本次返回的内容。
+        """
+        if top not in self.directories:
+            yield from os.walk(top, topdown=topdown)
+            return
+        dirnames, filenames = (list(names) for names in self.directories[top])
+        if topdown:
+            yield top, dirnames, filenames
+        for dirname in dirnames:
+            path = os.path.join(top, dirname)
+            if path in self.directories:
+                yield from self.walk(path, topdown)
+        if not topdown:
+            yield top, dirnames, filenames
+
+    def listdir(self, directory: str) -> List[str]:
+        if directory not in self.directories:
+            return os.listdir(directory)
+        dirnames, filenames = self.directories[directory]
+        return dirnames + filenames
+
+    def isdir(self, path: str) -> bool:
+        parent = os.path.dirname(path)
+        if parent in self.directories:
+            return os.path.basename(path) in self.directories[parent][0]
+        return os.path.isdir(path)
+
+    def exists(self, path: str) -> bool:
+        if os.path.normcase(path) in self._paths:
+            return True
+        # 父目录已完整列出时，清单中没有的路径就不存在
+        if os.path.dirname(path) in self.directories:
+            return False
+        return os.path.exists(path)
+
+    # 以下方法在修改文件后调用，使清单与文件系统保持一致，修改过的路径记录在 written 中
+
+    def remove_file(self, path: str) -> None:
+        self.written.append(path)
+        self._touch(os.path.dirname(path))
+        self.files.pop(path, None)
+        self._paths.discard(os.path.normcase(path))
+        listing = self.directories.get(os.path.dirname(path))
+        if listing and os.path.basename(path) in listing[1]:
+            listing[1].remove(os.path.basename(path))
+
+    def remove_dir(self, path: str) -> None:
+        self.written.append(path)
+        self._touch(os.path.dirname(path))
+        self.directories.pop(path, None)
+        self._paths.discard(os.path.normcase(path))
+        listing = self.directories.get(os.path.dirname(path))
+        if listing and os.path.basename(path) in listing[0]:
+            listing[0].remove(os.path.basename(path))
+
+    def move_file(self, source: str, destination: str) -> None:
+        entry = self.files.get(source)
+        self.remove_file(source)
+        filename = os.path.basename(destination)
+        if entry is None:
+            entry = FileEntry(destination, 0, 0.0, self.classify(filename))
+        self._add_file(entry._replace(path=destination, kind=self.classify(filename)))
+        self.written.append(destination)
+        self._touch(os.path.dirname(destination))
+        listing = self.directories.get(os.path.dirname(destination))
+        if listing is not None and filename not in listing[1]:
+            listing[1].append(filename)
+
+    def rename_file(self, source: str, destination: str) -> None:
+        """
+        同一目录内改名时保持文件在目录中的位置。
+        """
+        listing = self.directories.get(os.path.dirname(source))
+        if os.path.dirname(source) != os.path.dirname(destination) or not listing or os.path.basename(source) not in listing[1]:
+            self.move_file(source, destination)
+            return
+        self.written.extend((source, destination))
+        self._touch(os.path.dirname(source))
+        filenames = listing[1]
+        filenames[filenames.index(os.path.basename(source))] = os.path.basename(destination)
+        entry = self.files.pop(source, None) or FileEntry(source, 0, 0.0, OTHER)
+        self._paths.discard(os.path.normcase(source))
+        self._add_file(entry._replace(path=destination, kind=self.classify(os.path.basename(destination))))
+
+
+def scan_library(root: str, video_suffixes: Iterable[str] = (), subtitle_suffixes: Iterable[str] = (),
+                 store: Optional[InventoryStore] = None) -> Inventory:
+    """
+    扫描媒体库目录并返回清单，传入 store 时增量扫描。
+    """
+    return Inventory(root, video_suffixes, subtitle_suffixes).scan(store)
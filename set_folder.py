@@ -1,12 +1,17 @@
 import os
 import shutil
-import re
+from cache import ParseCache, config_fingerprint
+from release_parser import PARSER_VERSION, parse_title_year
+
+# 文件名解析逻辑变化时加一，使保存在文件中的旧解析结果失效
+FILE_PARSER_VERSION = 1
 
 class MediaFileHandler:
     def __init__(self, config):
         self.video_suffix_list = config['video_suffix_list'].split(',')
         self.source_dir = config['source_dir']
         self.target_dir = config['target_dir']
+        self.parse_cache = ParseCache.from_config(config, 'set_folder', config_fingerprint(FILE_PARSER_VERSION, PARSER_VERSION))
 
     def get_media_files(self):
         media_files = []
@@ -46,31 +51,19 @@ class MediaFileHandler:
         return f"{elements['chinese_title']} ({elements['year']})"
 
     def get_file_info(self, file_path: str) -> dict:
-        file_name_no_ext, _ = os.path.splitext(os.path.basename(file_path))
-        file_name_no_ext = file_name_no_ext.replace('.', ' ')
-        file_name_no_ext = file_name_no_ext.upper()
-
-        elements = {'chinese_title': None, 'year': None}
-        chinese_title = re.search(r'《.*?》', file_name_no_ext)
-        if chinese_title:
-            elements['chinese_title'] = chinese_title.group(0)[1:-1]
-            file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
-        else:
-            chinese_title = re.search(r'[\u4e00-\u9fff0-9a-zA-Z：，·-]+', file_name_no_ext)
-            if chinese_title:
-                if re.search(r'[\u4e00-\u9fff]', chinese_title.group(0)):
-                    elements['chinese_title'] = chinese_title.group(0)
-                    file_name_no_ext = file_name_no_ext.replace(chinese_title.group(0), '')
-                else:
-                    elements['chinese_title'] = None
-            else:
-                elements['chinese_title'] = None
+        # 结果只由文件名决定，按文件名缓存
+        file_name = os.path.basename(file_path)
+        if self.parse_cache is None:
+            return self.parse_file_name(file_name)
+        elements = self.parse_cache.get(file_name)
+        if elements is None:
+            elements = self.parse_file_name(file_name)
+            self.parse_cache.set(file_name, elements)
+        return dict(elements)
 
-        year = re.search(r'\b\d{4}\b', file_name_no_ext)
-        if year:
-            elements['year'] = year.group(0)
+    def parse_file_name(self, file_name: str) -> dict:
+        return parse_title_year(file_name)
 
-        return elements
 
 config = {
     'video_suffix_list': '.mp4,.mkv,.flv,.avi,.mpg,.mpeg,.mov,.ts,.wmv,.rm,.rmvb,.3gp,.3g2,.webm,.mp4a,.f4v',
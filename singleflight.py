@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : singleflight.py
+
+import copy
+import time
+import inspect
+import functools
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+# 保留的结果数量上限，超出时淘汰最久未使用的结果
+DEFAULT_MAX_ENTRIES = 1024
+# 结果保留的秒数；过期后重新调用，由响应缓存决定是否需要重新请求或重新验证
+DEFAULT_TTL = 300.0
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    合并相同的调用：同一个键同一时间只执行一次，其余调用等待并共享结果。
+    执行成功的结果保留 ttl 秒，期间相同的调用直接返回；最多保留 max_entries 个，超出时淘汰最久未使用的。
+    失败（None或异常）不保留。长时间运行时在每批处理之间调用 forget()。
+    """
+
+    def __init__(self, remember: bool = True, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL):
+        self.remember = remember and max_entries > 0 and ttl > 0
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.calls = 0
+        self.saved = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, _Call] = {}
+        # 键 -> (过期时间, 结果)，按最近使用排序
+        self._results: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+
+    def do(self, key: str, func: Callable[[], Any]) -> Any:
+        with self._lock:
+            remembered = self._results.get(key)
+            if remembered is not None:
+                if remembered[0] > time.monotonic():
+                    self._results.move_to_end(key)
+                    self.saved += 1
+                    return copy.copy(remembered[1])
+                del self._results[key]
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._inflight[key] = call
+                self.calls += 1
+            else:
+                self.saved += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.copy(call.result)
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+                if self.remember and call.error is None and call.result is not None:
+                    # 保存一份浅拷贝，调用方修改返回的字典不会影响之后的调用
+                    self._results[key] = (time.monotonic() + self.ttl, copy.copy(call.result))
+                    self._results.move_to_end(key)
+                    while len(self._results) > self.max_entries:
+                        self._results.popitem(last=False)
+            call.event.set()
+        return call.result
+
+    def forget(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'calls': self.calls, 'saved': self.saved}
+
+
+def coalesced(func: Callable) -> Callable:
+    """
+    方法装饰器：按方法名和规范化后的参数合并实例上的重复调用。
+    实例的 singleflight 属性为None时直接调用。
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        flight = getattr(self, 'singleflight', None)
+        if flight is None:
+            return func(self, *args, **kwargs)
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = func.__name__ + repr(list(bound.arguments.items())[1:])
+        return flight.do(key, lambda: func(self, *args, **kwargs))
+
+    return wrapper
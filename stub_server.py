@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : stub_server.py
+
+"""
+模拟 TMDB 和 PLEX 接口的本地HTTP服务器，用于离线的可重复基准测试。
+
+响应优先从录制的夹具文件中读取，没有录制的请求按路径和参数确定性地生成数据。
+可以注入延迟、错误率和限速（429），并支持 ETag 条件请求。
+
+用法:
+    python stub_server.py --port 8765 --latency 0.05 --error-rate 0.01 --rate-limit 40
+    python stub_server.py --fixtures fixtures.json --record --upstream https://api.themoviedb.org
+"""
+
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import hashlib
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from colorama import init, Fore, Style
+
+from cache import ResponseCache
+
+init(autoreset=True)
+
+DEFAULT_PLEX_ITEMS = 1000
+# 生成的TMDB数据中，标题以该前缀开头的查询查找不到结果，用于测试未匹配
+MISS_PREFIX = 'miss'
+
+
+def stable_id(text: str, base: int = 100000) -> int:
+    return base + zlib.crc32(text.encode('utf-8')) % 900000
+
+
+def synthetic_year(title: str) -> str:
+    """
+    生成数据中标题对应的上映年份，基准测试按此构造能匹配的 (标题, 年份)。
+    """
+    return str(1980 + zlib.crc32(title.encode('utf-8')) % 45)
+
+
+class FixtureStore:
+    """
+    录制的响应，键与 ResponseCache 的缓存键相同（路径和排序后的参数，不含密钥）。
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.responses: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.dirty = False
+        if path:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.responses = json.load(f)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def make_key(path: str, params: Dict[str, str]) -> str:
+        return ResponseCache.make_key(path, params)
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.responses.get(key)
+
+    def put(self, key: str, body: dict) -> None:
+        with self._lock:
+            self.responses[key] = body
+            self.dirty = True
+
+    def save(self) -> None:
+        if not self.path or not self.dirty:
+            return
+        with self._lock:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.responses, f, ensure_ascii=False, indent=1, sort_keys=True)
+            self.dirty = False
+
+
+class SyntheticData:
+    """
+    按请求确定性地生成 TMDB 和 PLEX 响应。
+    """
+
+    def __init__(self, plex_items: int = DEFAULT_PLEX_ITEMS):
+        self.plex_library = [self.plex_movie(i) for i in range(plex_items)]
+        self.plex_by_key = {item['ratingKey']: item for item in self.plex_library}
+        self.plex_by_title: Dict[str, List[dict]] = {}
+        for item in self.plex_library:
+            self.plex_by_title.setdefault(item['title'], []).append(item)
+
+    # TMDB
+    def search_movie(self, query: str) -> dict:
+        if not query or query.lower().startswith(MISS_PREFIX):
+            return {'page': 1, 'results': [], 'total_pages': 0, 'total_results': 0}
+        movie_id = stable_id(query)
+        results = [{'id': movie_id, 'title': query, 'original_title': query,
+                    'release_date': f"{synthetic_year(query)}-01-01"}]
+        return {'page': 1, 'results': results, 'total_pages': 1, 'total_results': len(results)}
+
+    def search_tv(self, query: str) -> dict:
+        if not query or query.lower().startswith(MISS_PREFIX):
+            return {'page': 1, 'results': [], 'total_pages': 0, 'total_results': 0}
+        tv_id = stable_id(query)
+        results = [{'id': tv_id, 'name': query, 'original_name': query,
+                    'first_air_date': f"{synthetic_year(query)}-01-01"}]
+        return {'page': 1, 'results': results, 'total_pages': 1, 'total_results': len(results)}
+
+    def movie(self, movie_id: int) -> dict:
+        return {'id': movie_id, 'title': f"电影{movie_id}", 'original_title': f"Movie {movie_id}",
+                'release_date': f"{1980 + movie_id % 45}-01-01", 'runtime': 90 + movie_id % 60}
+
+    def tv(self, tv_id: int) -> dict:
+        seasons = [{'season_number': n, 'episode_count': 10} for n in range(1, tv_id % 5 + 2)]
+        return {'id': tv_id, 'name': f"剧集{tv_id}", 'original_name': f"Show {tv_id}",
+                'first_air_date': f"{1980 + tv_id % 45}-01-01", 'seasons': seasons}
+
+    def season(self, tv_id: int, season_number: int) -> dict:
+        episodes = [{'episode_number': n, 'name': f"第{n}集", 'air_date': f"{1980 + tv_id % 45}-01-{n:02d}"}
+                    for n in range(1, 11)]
+        return {'id': tv_id * 100 + season_number, 'season_number': season_number, 'episodes': episodes}
+
+    # PLEX
+    @staticmethod
+    def plex_movie(i: int) -> dict:
+        title = f"电影{i}"
+        year = 1980 + i % 45
+        return {
+            'ratingKey': str(i + 1), 'key': f"/library/metadata/{i + 1}", 'type': 'movie',
+            'title': title, 'year': year, 'addedAt': 1600000000 + i,
+            'Guid': [{'id': f"imdb://tt{1000000 + i}"}, {'id': f"tmdb://{100000 + i}"}],
+            'Media': [{'videoResolution': '1080', 'bitrate': 9000, 'videoCodec': 'hevc', 'audioCodec': 'aac',
+                       'Part': [{'file': f"/media/movies/{title} ({year})/{title}.{year}.1080p.mkv"}]}],
+        }
+
+
+class StubServer:
+    """
+    模拟服务器。延迟、错误率和限速在请求处理前注入，统计各类响应的次数。
+    upstream 不为空时开启录制：夹具中没有的请求转发到上游并保存响应。
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, fixtures: Optional[FixtureStore] = None,
+                 latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 rate_limit: Optional[float] = None, plex_items: int = DEFAULT_PLEX_ITEMS,
+                 upstream: Optional[str] = None, seed: int = 0):
+        self.fixtures = fixtures if fixtures is not None else FixtureStore()
+        self.data = SyntheticData(plex_items)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.upstream = upstream.rstrip('/') if upstream else None
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self.counters = {'requests': 0, 'errors': 0, 'throttled': 0, 'not_modified': 0, 'recorded': 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubServer':
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.fixtures.save()
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _throttled(self) -> bool:
+        # 固定1秒窗口计数，超过 rate_limit 时返回429
+        if not self.rate_limit:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start, self._window_count = now, 0
+            self._window_count += 1
+            return self._window_count > self.rate_limit
+
+    def _fail(self) -> bool:
+        with self._lock:
+            return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def _delay(self) -> float:
+        with self._lock:
+            return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def respond(self, path: str, params: Dict[str, str], headers: Dict[str, str]) -> Tuple[int, Dict[str, str], bytes]:
+        """
+        返回 (状态码, 响应头, 响应体)。
+        """
+        self._count('requests')
+        if self._throttled():
+            self._count('throttled')
+            return 429, {'Retry-After': '1'}, b'{"status_code": 25, "status_message": "Rate limit exceeded"}'
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+        if self._fail():
+            self._count('errors')
+            return 500, {}, b'{"status_message": "injected error"}'
+
+        key = self.fixtures.make_key(path, params)
+        body = self.fixtures.get(key)
+        if body is None and self.upstream:
+            body = self.record(key, path, params, headers)
+        if body is None:
+            body = self.generate(path, params)
+        if body is None:
+            return 404, {}, b'{"status_code": 34, "status_message": "The resource you requested could not be found."}'
+
+        content = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        etag = 'W/"' + hashlib.md5(content).hexdigest() + '"'
+        if headers.get('If-None-Match') == etag:
+            self._count('not_modified')
+            return 304, {'ETag': etag}, b''
+        return 200, {'ETag': etag, 'Content-Type': 'application/json;charset=utf-8'}, content
+
+    def record(self, key: str, path: str, params: Dict[str, str], headers: Dict[str, str]) -> Optional[dict]:
+        forward = {name: value for name, value in headers.items() if name in ('X-Plex-Token', 'Accept')}
+        try:
+            response = requests.get(self.upstream + path, params=params, headers=forward, timeout=(5, 30))
+            body = response.json() if response.status_code == 200 else None
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        if body is not None:
+            self.fixtures.put(key, body)
+            self._count('recorded')
+        return body
+
+    def generate(self, path: str, params: Dict[str, str]) -> Optional[dict]:
+        parts = [part for part in path.split('/') if part]
+        if parts and parts[0].isdigit():
+            parts = parts[1:]  # 去掉 TMDB 的 API 版本号
+        data = self.data
+        if not parts:
+            return {'MediaContainer': {'size': 0, 'friendlyName': 'stub'}}
+        if parts[:2] == ['search', 'movie']:
+            return data.search_movie(params.get('query', ''))
+        if parts[:2] == ['search', 'tv']:
+            return data.search_tv(params.get('query', ''))
+        if parts[0] == 'movie' and len(parts) == 2 and parts[1].isdigit():
+            return data.movie(int(parts[1]))
+        if parts[0] == 'tv' and len(parts) >= 2 and parts[1].isdigit():
+            tv_id = int(parts[1])
+            if len(parts) == 4 and parts[2] == 'season' and parts[3].isdigit():
+                return data.season(tv_id, int(parts[3]))
+            body = data.tv(tv_id)
+            for item in filter(None, params.get('append_to_response', '').split(',')):
+                match = re.fullmatch(r'season/(\d+)', item)
+                if match:
+                    body[item] = data.season(tv_id, int(match.group(1)))
+            return body
+        if parts == ['search']:
+            items = data.plex_by_title.get(params.get('query', ''), [])
+            return {'MediaContainer': {'size': len(items), 'Metadata': items}}
+        if parts == ['library', 'sections']:
+            return {'MediaContainer': {'Directory': [{'key': '1', 'type': 'movie', 'title': 'Movies'}]}}
+        if parts[:2] == ['library', 'sections'] and len(parts) == 4 and parts[3] == 'all':
+            start = int(params.get('X-Plex-Container-Start', 0))
+            size = int(params.get('X-Plex-Container-Size', len(data.plex_library)))
+            # 条目按加入的顺序保存，只支持按加入时间倒序排列
+            library = data.plex_library[::-1] if params.get('sort') == 'addedAt:desc' else data.plex_library
+            page = library[start:start + size]
+            return {'MediaContainer': {'size': len(page), 'totalSize': len(data.plex_library),
+                                       'offset': start, 'Metadata': page}}
+        if parts[:2] == ['library', 'metadata'] and len(parts) == 3:
+            items = [data.plex_by_key[key] for key in parts[2].split(',') if key in data.plex_by_key]
+            return {'MediaContainer': {'size': len(items), 'Metadata': items}} if items else None
+        return None
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # 响应头和响应体分两次写出，关闭 Nagle 避免与客户端的延迟确认叠加出额外的 40ms
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                params = dict(parse_qsl(parts.query, keep_blank_values=True))
+                status, headers, content = server.respond(parts.path, params, dict(self.headers))
+                try:
+                    self.send_response(status)
+                    for name, value in headers.items():
+                        self.send_header(name, value)
+                    self.send_header('Content-Length', str(len(content)))
+                    self.end_headers()
+                    self.wfile.write(content)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(description='TMDB/PLEX 模拟服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--fixtures', help='录制的夹具文件（JSON）')
+    parser.add_argument('--record', action='store_true', help='夹具中没有的请求转发到 --upstream 并保存')
+    parser.add_argument('--upstream', help='录制时转发的上游地址，如 https://api.themoviedb.org')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求注入的延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的随机浮动范围（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回500的比例')
+    parser.add_argument('--rate-limit', type=float, default=None, help='每秒请求上限，超出返回429')
+    parser.add_argument('--plex-items', type=int, default=DEFAULT_PLEX_ITEMS, help='PLEX媒体库的条目数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.record and not args.upstream:
+        parser.error('--record 需要同时指定 --upstream')
+
+    server = StubServer(args.host, args.port, FixtureStore(args.fixtures), latency=args.latency, jitter=args.jitter,
+                        error_rate=args.error_rate, rate_limit=args.rate_limit, plex_items=args.plex_items,
+                        upstream=args.upstream if args.record else None, seed=args.seed)
+    print(Fore.GREEN + f"模拟服务器已启动：{server.url}（TMDB 地址 {server.url}/3）" + Style.RESET_ALL)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        server.fixtures.save()
+        print(Fore.GREEN + f"模拟服务器已停止：{server.counters}" + Style.RESET_ALL)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+# @Time : 2023/11/21
+# @File : watcher.py
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from colorama import Fore, Style
+from scanner import InventoryStore, scan_library
+
+DEFAULT_WATCH_MODE = 'auto'
+# 轮询的间隔（秒）
+DEFAULT_WATCH_INTERVAL = 30.0
+# 文件夹在这段时间（秒）内没有任何变化、且其中最新的文件也早于这段时间，才视为下载或复制完成
+DEFAULT_WATCH_SETTLE = 10.0
+
+# inotify 事件
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct('iIII')
+
+# 这些文件系统上其他机器的修改不会产生 inotify 事件，只能轮询
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smb3', 'smbfs', '9p', 'afs', 'ceph', 'glusterfs')
+
+
+def is_network_mount(path: str) -> bool:
+    """
+    判断路径是否位于网络文件系统或 FUSE 挂载（如 rclone 挂载的网盘）上，只在 Linux 下能够判断。
+    """
+    try:
+        with open('/proc/mounts', 'r', encoding='utf-8') as f:
+            mounts = [line.split()[1:3] for line in f if len(line.split()) >= 3]
+    except OSError:
+        return False
+    path = os.path.realpath(path)
+    best, fstype = '', ''
+    for mount_point, mount_type in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        if (path == mount_point or path.startswith(os.path.join(mount_point, ''))) and len(mount_point) > len(best):
+            best, fstype = mount_point, mount_type
+    return fstype in NETWORK_FILESYSTEMS or fstype.startswith('fuse')
+
+
+class InotifyBackend:
+    """
+    通过 ctypes 调用 Linux inotify，递归监视目录，新建的子目录自动加入监视。
+    """
+
+    def __init__(self, roots: Iterable[str]):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        if not hasattr(self._libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "系统不支持 inotify")
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        self.watches: Dict[int, str] = {}
+        try:
+            for root in roots:
+                self._add_tree(root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, path: str) -> None:
+        for root, _, _ in os.walk(path):
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(root), WATCH_MASK)
+            if wd < 0:
+                error = ctypes.get_errno()
+                # 监视数量超过 fs.inotify.max_user_watches 时无法继续，交给调用方改用轮询
+                if error == errno.ENOSPC:
+                    raise OSError(error, "inotify 监视数量已达上限（fs.inotify.max_user_watches）")
+                continue
+            self.watches[wd] = root
+
+    def wait(self, timeout: Optional[float]) -> List[str]:
+        """
+        等待文件变化，返回发生变化的路径；超时返回空列表。
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+        paths = []
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出，无法知道具体变化，视为所有监视的目录都有变化
+                paths.extend(self.watches.values())
+                continue
+            directory = self.watches.get(wd)
+            if directory is None:
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            path = os.path.join(directory, name) if name else directory
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self._add_tree(path)
+                except OSError as e:
+                    print(Fore.YELLOW + f"无法监视新目录 {path}: {e}" + Style.RESET_ALL)
+            paths.append(path)
+        return paths
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+class PollingBackend:
+    """
+    定期增量扫描目录，与上一次扫描的结果比较，找出新增或删除的条目。适用于网络挂载等收不到 inotify 事件的情况。
+    """
+
+    def __init__(self, roots: Iterable[str], interval: float = DEFAULT_WATCH_INTERVAL):
+        self.roots = list(roots)
+        self.interval = interval
+        # 清单只在本进程中使用
+        self.store = InventoryStore(':memory:')
+        # 根目录 -> 上一次扫描时各目录的 (子目录名, 文件名)
+        self.directories = {root: scan_library(root, store=self.store).directories for root in self.roots}
+        self.store.flush()
+
+    def wait(self, timeout: Optional[float]) -> List[str]:
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        paths = []
+        for root in self.roots:
+            inventory = scan_library(root, store=self.store)
+            previous = self.directories[root]
+            for directory in inventory.dirty:
+                # 与 inotify 一样给出有变化的条目，目录的条目没有增删时给出目录本身
+                old_dirs, old_files = previous.get(directory, ([], []))
+                new_dirs, new_files = inventory.directories.get(directory, ([], []))
+                changed = set(old_dirs + old_files).symmetric_difference(new_dirs + new_files)
+                if changed:
+                    paths.extend(os.path.join(directory, name) for name in sorted(changed))
+                elif directory != root:
+                    paths.append(directory)
+            self.directories[root] = inventory.directories
+        self.store.flush()
+        return paths
+
+    def close(self) -> None:
+        self.store.close()
+
+
+class Watcher:
+    """
+    监视若干个待处理目录，把有变化的一级子文件夹（如新下载的电影、剧集文件夹）在其稳定之后分批交给调用方。
+    """
+
+    def __init__(self, roots: Iterable[str], mode: str = DEFAULT_WATCH_MODE, interval: float = DEFAULT_WATCH_INTERVAL,
+                 settle: float = DEFAULT_WATCH_SETTLE):
+        self.roots = [os.path.normpath(root) for root in roots]
+        self.settle = settle
+        # 一级子文件夹 -> 最近一次变化的时间
+        self.pending: Dict[str, float] = {}
+        # 刚由调用方写入的路径（及其中的所有路径）-> 忽略其变化的截止时间
+        self.written: Dict[str, float] = {}
+        self.backend = None
+        if mode == 'auto' and any(is_network_mount(root) for root in self.roots):
+            print(Fore.YELLOW + "监视的目录位于网络挂载上，使用轮询。" + Style.RESET_ALL)
+            mode = 'poll'
+        if mode in ('auto', 'inotify') and sys.platform.startswith('linux'):
+            try:
+                self.backend = InotifyBackend(self.roots)
+            except OSError as e:
+                print(Fore.YELLOW + f"无法使用 inotify（{e}），改为轮询。" + Style.RESET_ALL)
+        if self.backend is None:
+            self.backend = PollingBackend(self.roots, interval)
+        # 自己造成的变化在这段时间内一定会被发现：inotify 立即收到事件，轮询要等到下一次扫描
+        self.ignore_seconds = settle + (interval if isinstance(self.backend, PollingBackend) else 0)
+
+    @classmethod
+    def from_config(cls, roots: Iterable[str], config: Dict) -> 'Watcher':
+        return cls(roots, mode=config.get('watch_mode', DEFAULT_WATCH_MODE),
+                   interval=float(config.get('watch_interval', DEFAULT_WATCH_INTERVAL)),
+                   settle=float(config.get('watch_settle', DEFAULT_WATCH_SETTLE)))
+
+    def top_level(self, path: str) -> Optional[str]:
+        """
+        返回路径所属的一级子文件夹（或直接放在监视目录中的文件），监视目录本身返回None。
+        """
+        path = os.path.normpath(path)
+        for root in self.roots:
+            if path.startswith(os.path.join(root, '')):
+                return os.path.join(root, os.path.relpath(path, root).split(os.sep)[0])
+        return None
+
+    def ignore(self, paths: Iterable[str]) -> None:
+        """
+        忽略调用方刚刚写入（改名、移动、删除）的路径在之后 ignore_seconds 秒内产生的变化，
+        避免处理完的文件夹因为自己的改名再被处理一次。
+        """
+        until = time.time() + self.ignore_seconds
+        for path in paths:
+            self.written[os.path.normpath(path)] = until
+
+    def _ignored(self, path: str, now: float) -> bool:
+        if not self.written:
+            return False
+        self.written = {written: until for written, until in self.written.items() if until > now}
+        path = os.path.normpath(path)
+        while path not in self.roots:
+            if path in self.written:
+                return True
+            parent = os.path.dirname(path)
+            if parent == path:
+                break
+            path = parent
+        return False
+
+    def _newest_mtime(self, path: str) -> float:
+        if not os.path.isdir(path):
+            return os.stat(path).st_mtime
+        inventory = scan_library(path)
+        return max([entry.mtime for entry in inventory.files.values()], default=0.0)
+
+    def _ready(self, now: float) -> List[str]:
+        ready = []
+        for folder, last_change in list(self.pending.items()):
+            if now - last_change < self.settle:
+                continue
+            try:
+                newest = self._newest_mtime(folder)
+            except OSError:
+                # 已被删除或移走
+                del self.pending[folder]
+                continue
+            # 仍在写入的文件修改时间很新；修改时间在将来（时钟不一致）时不以此为准
+            if now - self.settle < newest <= now + 1:
+                self.pending[folder] = newest
+                continue
+            del self.pending[folder]
+            ready.append(folder)
+        return sorted(ready)
+
+    def poll(self, timeout: Optional[float] = None) -> List[str]:
+        """
+        等待一次文件变化（最多 timeout 秒，None表示一直等到有变化或有文件夹稳定），返回已经稳定的一级子文件夹。
+        """
+        now = time.time()
+        if self.pending:
+            settle_timeout = max(0.1, min(last_change + self.settle - now for last_change in self.pending.values()))
+            timeout = settle_timeout if timeout is None else min(timeout, settle_timeout)
+        for path in self.backend.wait(timeout):
+            now = time.time()
+            if self._ignored(path, now):
+                continue
+            folder = self.top_level(path)
+            if folder is not None:
+                self.pending[folder] = now
+        return self._ready(time.time())
+
+    def batches(self) -> Iterator[List[str]]:
+        """
+        持续返回已经稳定的一级子文件夹列表。
+        """
+        while True:
+            ready = self.poll()
+            if ready:
+                yield ready
+
+    def close(self) -> None:
+        self.backend.close()
+
+
+def run_daemon(roots: List[str], config: Dict, handle: Callable[[List[str]], Optional[Iterable[str]]]) -> None:
+    """
+    监视 roots，新的文件夹稳定后调用 handle(文件夹列表)；按 Ctrl+C 退出。
+    handle 返回本批写入的路径，这些路径随后因改名等产生的变化不再触发处理。
+    处理单个批次时出错只打印错误，不影响继续监视。
+    """
+    watcher = Watcher.from_config(roots, config)
+    print(Fore.GREEN + f"正在监视: {', '.join(roots)}（{type(watcher.backend).__name__}，稳定 {watcher.settle:g} 秒后处理）"
+          + Style.RESET_ALL)
+    try:
+        for folders in watcher.batches():
+            print(Fore.GREEN + f"发现 {len(folders)} 个新的或有变化的文件夹" + Style.RESET_ALL)
+            try:
+                watcher.ignore(handle(folders) or ())
+            except Exception as e:
+                print(Fore.RED + f"处理文件夹时发生错误: {e}" + Style.RESET_ALL)
+    except KeyboardInterrupt:
+        print(Fore.RED + "已停止监视。" + Style.RESET_ALL)
+    finally:
+        watcher.close()